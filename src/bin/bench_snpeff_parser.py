@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark for snpEff output parsing: compare parse_vcf_line() with the
+original parser (reference_parse_vcf_line()) on a recorded snpEff output file
+(plain or gzipped VCF, as produced from SnpeffAnnotator input, ie. with
+"# hgvs:..." comments), and check both give the same documents.
+
+    python bin/bench_snpeff_parser.py snpeff_output.vcf.gz [repeat=3]
+"""
+
+import sys
+import gzip
+import time
+
+
+def main(vcf_file, repeat=3):
+
+    import biothings, config
+    biothings.config_for_app(config)
+    from hub.dataload.sources.snpeff.snpeff_parser import parse_vcf_line, reference_parse_vcf_line
+
+    opener = gzip.open if vcf_file.endswith(".gz") else open
+    with opener(vcf_file, "rt") as fin:
+        lines = [line.rstrip("\n") for line in fin if line.strip() and not line.startswith("#")]
+    print("%d records in '%s'" % (len(lines), vcf_file))
+
+    timings = {}
+    for name, func in (("reference", reference_parse_vcf_line), ("fast", parse_vcf_line)):
+        best = None
+        for _ in range(repeat):
+            t0 = time.time()
+            docs = [func(line) for line in lines]
+            elapsed = time.time() - t0
+            best = elapsed if best is None else min(best, elapsed)
+        timings[name] = (best, docs)
+        print("%-10s %8.3fs  %10.0f records/s" % (name, best, best and len(lines) / best or 0))
+
+    diffs = [i for i, (a, b) in enumerate(zip(timings["reference"][1], timings["fast"][1])) if a != b]
+    print("speedup: x%.1f" % (timings["reference"][0] / (timings["fast"][0] or 1e-9)))
+    if diffs:
+        print("%d records parsed differently, eg. line %d:\n%s" % (len(diffs), diffs[0] + 1, lines[diffs[0]]))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    vcf_file = sys.argv[1]
+    kwargs = dict(list(map(lambda e: e.split("="), sys.argv[2:])))
+    main(vcf_file, **{k: int(v) for k, v in kwargs.items()})
@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 
-import os, logging
+import os, logging, asyncio
 from functools import partial
 
 # shut some mouths...
@@ -29,6 +29,7 @@ from hub.databuild.syncer import MyVariantThrottledESColdHotJsonDiffSelfContaine
 
 from biothings.hub import CommandDefinition
 import biothings.utils.mongo as mongo
+from hub.dataload.uploader import SnpeffPlanner, get_snpeff_params, get_id_filter, upgrade_snpeff
 
 
 class MyVariantHubServer(HubServer):
@@ -61,6 +62,81 @@ class MyVariantHubServer(HubServer):
         task = asyncio.ensure_future(do(sources))
         return task
 
+    def snpeff_build(self, build_name, assembly, force=False, force_use_cache=True, shard_size=None):
+        """
+        Run snpeff once for all sources involved in build_name: the union of
+        _ids from all sources, minus _ids already in snpeff collection, is
+        annotated in one pass (sharded by chromosome, see SnpeffPlanner), so
+        a variant found in many sources is checked/annotated only once.
+        assembly is "hg19" or "hg38" and must match build's sources.
+        force=True re-annotates all _ids, even if already in snpeff collection.
+        """
+        sources = mongo.get_source_fullnames(self.managers["build_manager"].list_sources(build_name))
+        # remove any snpeff related collection
+        sources = [src for src in sources if not src.startswith("snpeff")]
+        if not sources:
+            raise Exception("No valid sources found for build '%s'" % build_name)
+        job_manager = self.managers["job_manager"]
+
+        def plan():
+            params = get_snpeff_params(assembly)
+            src_db = mongo.get_src_db()
+            annotated = None if force else get_id_filter(src_db[params["name"]],logger=self.logger)
+            kwargs = shard_size and {"shard_size" : shard_size} or {}
+            planner = SnpeffPlanner(params,annotated=annotated,job_manager=job_manager,dedup=True,
+                                    pinfo={"category" : "snpeff", "source" : build_name,
+                                           "step" : "", "description" : ""},
+                                    logger=self.logger,**kwargs)
+            for src in sources:
+                # src can be a full name (eg. clinvar.clinvar_hg38) but id_feeder knows only name (clinvar_hg38)
+                if "." in src:
+                    src = src.split(".")[1]
+                self.logger.info("Collecting _ids from '%s'" % src)
+                planner.add_collection(src_db[src],force_use_cache=force_use_cache)
+            stats = planner.finish()
+            # each duplicated _id would have been checked/annotated again by per-source snpeff
+            stats["saved"] = stats["duplicated"]
+            self.logger.info("snpeff on build '%s': %d _ids from %d sources, %d already annotated, " % \
+                    (build_name,stats["seen"],len(sources),stats["already_annotated"]) + \
+                    "%d annotated, %d annotations saved (duplicated across sources)" % \
+                    (stats["annotated"],stats["saved"]))
+            return stats
+
+        @asyncio.coroutine
+        def do():
+            pinfo = {"category" : "snpeff",
+                    "source" : build_name,
+                    "step" : "plan",
+                    "description" : "%d sources" % len(sources)}
+            job = yield from job_manager.defer_to_thread(pinfo, plan)
+            res = yield from job
+            return res
+
+        task = asyncio.ensure_future(do())
+        return task
+
+    def snpeff_upgrade(self, assembly, force_use_cache=True):
+        """
+        After a snpEff database upgrade (new snpeff dump), compute again
+        annotations only for variants in snpeff collection falling in regions
+        where gene/transcript models changed (see upgrade_snpeff)
+        """
+        job_manager = self.managers["job_manager"]
+
+        @asyncio.coroutine
+        def do():
+            pinfo = {"category" : "snpeff",
+                    "source" : assembly,
+                    "step" : "upgrade",
+                    "description" : ""}
+            job = yield from job_manager.defer_to_thread(pinfo, partial(upgrade_snpeff,assembly,
+                        job_manager=job_manager,force_use_cache=force_use_cache,logger=self.logger))
+            res = yield from job
+            return res
+
+        task = asyncio.ensure_future(do())
+        return task
+
     def rebuild_cache(self, build_name=None, sources=None, target=None, force_build=False):
         """Rebuild cache files for all sources involved in build_name, as well as 
         the latest merged collection found for that build"""
@@ -137,6 +213,8 @@ class MyVariantHubServer(HubServer):
         super().configure_commands() # keep all originals...
         # custom
         self.commands["snpeff"] = self.snpeff
+        self.commands["snpeff_build"] = self.snpeff_build
+        self.commands["snpeff_upgrade"] = self.snpeff_upgrade
         self.commands["rebuild_cache"] = self.rebuild_cache
         # merge
         self.commands["premerge"] = partial(self.managers["build_manager"].merge,steps=["merge","metadata"])
@@ -27,6 +27,22 @@ CHROM_FIELDS = {'cadd':'chrom', 'clinvar':'chrom', 'cosmic':'chrom', 'dbnsfp':'c
 HG38_FIELDS = ['clinvar.hg38', 'dbnsfp.hg38', 'evs.hg38']
 HG19_FIELDS = ['clinvar.hg19', 'cosmic.hg19', 'dbnsfp.hg19', 'dbsnp.hg19', 'docm.hg19', 'evs.hg19', 'grasp.hg19']
 
+# Genome stores (see utils.genome) per assembly, used to normalize (left-align)
+# indels while parsing VCF sources, so they get the same _id whatever the source.
+# None disables normalization for the assembly
+GENOME_STORES = {"hg19": None, "hg38": None}
+
+# dbNSFP files contain both hg19 and hg38 positions: when True, dbnsfp_hg38
+# uploader parses each file once and also uploads dbnsfp_hg19 documents
+DBNSFP_DUAL_ASSEMBLY = True
+
+# When True, one snpEff process is kept per hub worker process (across
+# annotation jobs, until idle) and fed with all batches (saves snpEff startup
+# per batch). It's health-checked, and if snpEff doesn't answer (see
+# tests/test_snpeff.py to check installed snpEff), each batch runs its own
+# snpEff process, as when False
+SNPEFF_PERSISTENT_WORKER = True
+
 # Max length for vcf.alt and vcf.ref fields (must be less than 32k, ElasticSearch limit)
 MAX_REF_ALT_LEN = 1000
 
@@ -231,6 +247,12 @@ RELEASE_PATH = ConfigurationDefault(
         default=ConfigurationValue("""os.path.join(DATA_ARCHIVE_ROOT,"release")"""),
         desc="Define path to folder which will contain release files")
 
+# Path to folder containing rsID => hgvs ids indices (see utils.rsid_index), one
+# per dbSNP collection, built after dbSNP uploads and used by parsers matching on rsIDs
+RSID_INDEX_PATH = ConfigurationDefault(
+        default=ConfigurationValue("""os.path.join(DATA_ARCHIVE_ROOT,"rsid_index")"""),
+        desc="Define path to folder which will contain rsID indices")
+
 # this dir must be created manually
 LOG_FOLDER = ConfigurationDefault(
         default=ConfigurationValue("""os.path.join(DATA_ARCHIVE_ROOT,"logs")"""),
@@ -2,12 +2,14 @@ import math
 import asyncio
 from functools import partial
 import datetime, pickle
+import numpy as np
 
 from biothings.utils.common import iter_n, open_compressed_file
 from biothings.utils.mongo import id_feeder
 import biothings.utils.mongo as mongo
 import biothings.hub.databuild.builder as builder
 import config
+from utils.hgvs import VariantKeyCodec
 
 class MyVariantDataBuilder(builder.DataBuilder):
 
@@ -41,6 +43,9 @@ class MyVariantDataBuilder(builder.DataBuilder):
         btotal = math.ceil(total/batch_size) 
         bnum = 1
         cnt = 0
+        # discrepancies can be numerous, keep them as packed variant keys until the end
+        codec = VariantKeyCodec()
+        discrepancies = {"missing" : [], "disagreed" : []}
         results = {"missing" : [], "disagreed" : []}
         root_keys = {}
         # grab ids only, so we can get more and fill queue for each step
@@ -59,11 +64,11 @@ class MyVariantDataBuilder(builder.DataBuilder):
                         (bnum,btotal,cnt,total,(cnt/total*100.)))
                 job = yield from job_manager.defer_to_process(pinfo,
                         partial(chrom_worker, self.target_backend.target_name, doc_ids))
-                def processed(f,results, batch_num):
+                def processed(f, discrepancies, batch_num):
                     try:
                         fres = f.result()
-                        results["missing"].extend(fres["missing"])
-                        results["disagreed"].extend(fres["disagreed"])
+                        discrepancies["missing"].append(codec.encode_many(fres["missing"]))
+                        discrepancies["disagreed"].append(codec.encode_many(fres["disagreed"]))
                         # merge root key counts
                         rk = fres["root_keys"]
                         for k in rk:
@@ -75,12 +80,15 @@ class MyVariantDataBuilder(builder.DataBuilder):
                         self.logger.error("chrom batch #%d, error in processed (set_chrom): %s:\n%s" % \
                                 (batch_num, e, traceback.format_exc()))
                         raise
-                job.add_done_callback(partial(processed, results=results, batch_num=bnum))
+                job.add_done_callback(partial(processed, discrepancies=discrepancies, batch_num=bnum))
                 jobs.append(job)
                 bnum += 1
         self.logger.info("%d jobs created for merging step" % len(jobs))
         if jobs:
             yield from asyncio.gather(*jobs)
+            for k, keys in discrepancies.items():
+                if keys:
+                    results[k] = codec.decode_many(np.concatenate(keys))
             self.logger.info("Found %d missing 'chrom' and %d where resources disagreed" % (len(results["missing"]), len(results["disagreed"])))
             if results["missing"] or results["disagreed"]:
                 fn = "chrom_%s_%s.pickle" % (self.target_backend.target_name,datetime.datetime.now().strftime("%Y%m%d_%H%M%S"))
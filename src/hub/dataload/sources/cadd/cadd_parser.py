@@ -1,14 +1,141 @@
 import pysam
 import dbm
 from itertools import groupby
-from biothings.utils.dataload import dict_sweep, unlist, value_convert, merge_duplicate_rows
-from utils.hgvs import get_hgvs_from_vcf
+from biothings.utils.dataload import merge_duplicate_rows
+from biothings.utils.common import iter_n
+from utils.hgvs import get_hgvs_from_vcf, get_hgvs_from_vcf_many
+from utils.idfilter import IdFilter
+from utils.normalize import DocNormalizer
+from utils.docmapper import DocMapper
 # tabix file links from CADD http://cadd.gs.washington.edu/download
 
 # number of fields/annotations
 VALID_COLUMN_NO = 116
+normalize = DocNormalizer(sweep=["NA"])
 cadd_file_path = '/opt/myvariant.info/load_archive/cadd/whole_genome_SNVs_inclAnno.tsv.gz'
 
+# column position => document field
+CADD_SPEC = [
+    ("chrom", 0),
+    ("pos", 1),
+    ("ref", 2),
+    ("anc", 3),
+    ("alt", 4),
+    ("type", 5),
+    ("length", 6),
+    ("istv", 7),
+    ("isderived", 8),
+    ("annotype", 9),
+    ("consequence", 10),
+    ("consscore", 11),
+    ("consdetail", 12),
+    ("gc", 13),
+    ("cpg", 14),
+    ("mapability.20bp", 15),
+    ("mapability.35bp", 16),
+    ("scoresegdup", 17),
+    ("phast_cons.primate", 18),
+    ("phast_cons.mammalian", 19),
+    ("phast_cons.vertebrate", 20),
+    ("phylop.primate", 21),
+    ("phylop.mammalian", 22),
+    ("phylop.vertebrate", 23),
+    ("gerp.n", 24),
+    ("gerp.s", 25),
+    ("gerp.rs", 26),
+    ("gerp.rs_pval", 27),
+    ("bstatistic", 28),
+    ("mutindex", 29),
+    ("dna.helt", 30),
+    ("dna.mgw", 31),
+    ("dna.prot", 32),
+    ("dna.roll", 33),
+    ("mirsvr.score", 34),
+    ("mirsvr.e", 35),
+    ("mirsvr.aln", 36),
+    ("targetscans", 37),
+    ("fitcons", 38),
+    ("chmm.tssa", 39),
+    ("chmm.tssaflnk", 40),
+    ("chmm.txflnk", 41),
+    ("chmm.tx", 42),
+    ("chmm.txwk", 43),
+    ("chmm.enh", 44),
+    # ("chmm.enh", 45),
+    ("chmm.znfrpts", 46),
+    ("chmm.het", 47),
+    ("chmm.tssbiv", 48),
+    ("chmm.bivflnk", 49),
+    ("chmm.enhbiv", 50),
+    ("chmm.reprpc", 51),
+    ("chmm.reprpcwk", 52),
+    ("chmm.quies", 53),
+    ("encode.exp", 54),
+    ("encode.h3k27ac", 55),
+    ("encode.h3k4me1", 56),
+    ("encode.h3k4me3", 57),
+    ("encode.nucleo", 58),
+    ("encode.occ", 59),
+    ("encode.p_val.comb", 60),
+    ("encode.p_val.dnas", 61),
+    ("encode.p_val.faire", 62),
+    ("encode.p_val.polii", 63),
+    ("encode.p_val.ctcf", 64),
+    ("encode.p_val.mycp", 65),
+    ("encode.sig.dnase", 66),
+    ("encode.sig.faire", 67),
+    ("encode.sig.polii", 68),
+    ("encode.sig.ctcf", 69),
+    ("encode.sig.myc", 70),
+    ("segway", 71),
+    ("motif.toverlap", 72),
+    ("motif.dist", 73),
+    ("motif.ecount", 74),
+    ("motif.ename", 75),
+    ("motif.ehipos", 76),
+    ("motif.escorechng", 77),
+    ("tf.bs", 78),
+    ("tf.bs_peaks", 79),
+    ("tf.bs_peaks_max", 80),
+    ("isknownvariant", 81),
+    ("esp.af", 82),
+    ("esp.afr", 83),
+    ("esp.eur", 84),
+    ("1000g.af", 85),
+    ("1000g.asn", 86),
+    ("1000g.amr", 87),
+    ("1000g.afr", 88),
+    ("1000g.eur", 89),
+    ("min_dist_tss", 90),
+    ("min_dist_tse", 91),
+    ("gene.gene_id", 92),
+    ("gene.feature_id", 93),
+    ("gene.ccds_id", 94),
+    ("gene.genename", 95),
+    ("gene.cds.cdna_pos", 96),
+    ("gene.cds.rel_cdna_pos", 97),
+    ("gene.cds.cds_pos", 98),
+    ("gene.cds.rel_cds_pos", 99),
+    ("gene.prot.protpos", 100),
+    ("gene.prot.rel_prot_pos", 101),
+    ("gene.prot.domain", 102),
+    ("dst2splice", 103),
+    ("dst2spltype", 104),
+    ("exon", 105),
+    ("intron", 106),
+    ("oaa", 107),  # ref aa
+    ("naa", 108),  # alt aa
+    ("grantham", 109),
+    ("polyphen.cat", 110),
+    ("polyphen.val", 111),
+    ("sift.cat", 112),
+    ("sift.val", 113),
+    ("rawscore", 114),  # raw CADD score
+    ("phred", 115),  # log-percentile of raw CADD score
+]
+map_cadd = DocMapper(CADD_SPEC).compile()
+
+
 # convert one snp to json
 def _map_line_to_json(fields):
     assert len(fields) == VALID_COLUMN_NO
@@ -23,166 +150,10 @@ def _map_line_to_json(fields):
         return
     one_snp_json = {
         "_id": HGVS,
-        "cadd": {
-            'chrom': fields[0],
-            'pos': fields[1],
-            'ref': fields[2],
-            'anc': fields[3],
-            'alt': fields[4],
-            'type': fields[5],
-            'length': fields[6],
-            'istv': fields[7],
-            'isderived': fields[8],
-            'annotype': fields[9],
-            'consequence': fields[10],
-            'consscore': fields[11],
-            'consdetail': fields[12],
-            'gc': fields[13],
-            'cpg': fields[14],
-            'mapability': {
-                '20bp': fields[15],
-                '35bp': fields[16]
-            },
-            'scoresegdup': fields[17],
-            'phast_cons': {
-                'primate': fields[18],
-                'mammalian': fields[19],
-                'vertebrate': fields[20]
-            },
-            'phylop': {
-                'primate': fields[21],
-                'mammalian': fields[22],
-                'vertebrate': fields[23]
-            },
-            'gerp': {
-                'n': fields[24],
-                's': fields[25],
-                'rs': fields[26],
-                'rs_pval': fields[27]
-            },
-            'bstatistic': fields[28],
-            'mutindex': fields[29],
-            'dna': {
-                'helt': fields[30],
-                'mgw': fields[31],
-                'prot': fields[32],
-                'roll': fields[33]
-            },
-            'mirsvr': {
-                'score': fields[34],
-                'e': fields[35],
-                'aln': fields[36]
-            },
-            'targetscans': fields[37],
-            'fitcons': fields[38],
-            'chmm': {
-                'tssa': fields[39],
-                'tssaflnk': fields[40],
-                'txflnk': fields[41],
-                'tx': fields[42],
-                'txwk': fields[43],
-                'enh': fields[44],
-                # 'enh': fields[45],
-                'znfrpts': fields[46],
-                'het': fields[47],
-                'tssbiv': fields[48],
-                'bivflnk': fields[49],
-                'enhbiv': fields[50],
-                'reprpc': fields[51],
-                'reprpcwk': fields[52],
-                'quies': fields[53],
-            },
-            'encode': {
-                'exp': fields[54],
-                'h3k27ac': fields[55],
-                'h3k4me1': fields[56],
-                'h3k4me3': fields[57],
-                'nucleo': fields[58],
-                'occ': fields[59],
-                'p_val': {
-                    'comb': fields[60],
-                    'dnas': fields[61],
-                    'faire': fields[62],
-                    'polii': fields[63],
-                    'ctcf': fields[64],
-                    'mycp': fields[65]
-                },
-                'sig': {
-                    'dnase': fields[66],
-                    'faire': fields[67],
-                    'polii': fields[68],
-                    'ctcf': fields[69],
-                    'myc': fields[70]
-                },
-            },
-            'segway': fields[71],
-            'motif': {
-                'toverlap': fields[72],
-                'dist': fields[73],
-                'ecount': fields[74],
-                'ename': fields[75],
-                'ehipos': fields[76],
-                'escorechng': fields[77]
-            },
-            'tf': {
-                'bs': fields[78],
-                'bs_peaks': fields[79],
-                'bs_peaks_max': fields[80]
-            },
-            'isknownvariant': fields[81],
-            'esp': {
-                'af': fields[82],
-                'afr': fields[83],
-                'eur': fields[84]
-            },
-            '1000g': {
-                'af': fields[85],
-                'asn': fields[86],
-                'amr': fields[87],
-                'afr': fields[88],
-                'eur': fields[89]
-            },
-            'min_dist_tss': fields[90],
-            'min_dist_tse': fields[91],
-            'gene': {
-                'gene_id': fields[92],
-                'feature_id': fields[93],
-                'ccds_id': fields[94],
-                'genename': fields[95],
-                'cds': {
-                    'cdna_pos': fields[96],
-                    'rel_cdna_pos': fields[97],
-                    'cds_pos': fields[98],
-                    'rel_cds_pos': fields[99]
-                },
-                'prot': {
-                    'protpos': fields[100],
-                    'rel_prot_pos': fields[101],
-                    'domain': fields[102]
-                }
-            },
-            'dst2splice': fields[103],
-            'dst2spltype': fields[104],
-            'exon': fields[105],
-            'intron': fields[106],
-            'oaa': fields[107],   # ref aa
-            'naa': fields[108],   # alt aa
-            'grantham': fields[109],
-            'polyphen': {
-                'cat': fields[110],
-                'val': fields[111]
-            },
-            'sift': {
-                'cat': fields[112],
-                'val': fields[113]
-            },
-            'rawscore': fields[114],    # raw CADD score
-            'phred': fields[115]        # log-percentile of raw CADD score
-        }
+        "cadd": map_cadd(fields)
     }
 
-    obj = dict_sweep(unlist(value_convert(one_snp_json)), ["NA"])
-    yield obj
+    yield normalize(one_snp_json)
 
 
 def load_contig(contig):
@@ -192,17 +163,29 @@ def load_contig(contig):
     for doc in data:
         yield doc
 
+def select_rows(rows, set_ids, chunk_size=10000):
+    """looking for annotype as 'codingtranscript', 'noncodingtranscript',
+       or variants found in set_ids (membership tested chunk by chunk)"""
+    for chunk in iter_n(rows, chunk_size):
+        hgvs_ids = get_hgvs_from_vcf_many([row[0] for row in chunk], [row[1] for row in chunk],
+                                          [row[2] for row in chunk], [row[4] for row in chunk])
+        found = set_ids.contains_many(hgvs_ids).tolist()
+        for row, isin in zip(chunk, found):
+            if isin or "CodingTranscript" in row[9]:
+                yield row
+
 def fetch_generator(tabix, contig):
     dbfile_path = 'home/kevinxin/cadd/' + 'cadd_id' + contig
-    db = dbm.open(dbfile_path)
-    ids = db.keys()
-    set_ids = set(ids)
-    print(len(ids))
+    # filter over dbm keys (bytes), built once and saved next to dbm file
+    set_ids = IdFilter.load(dbfile_path + ".idfilter")
+    if set_ids is None:
+        db = dbm.open(dbfile_path)
+        set_ids = IdFilter.from_ids(k.decode() for k in db.keys())
+        set_ids.save(dbfile_path + ".idfilter")
+    print(len(set_ids))
     fetch = tabix.fetch(contig)
     rows = map(lambda x: x.split('\t'), fetch)
-#   looking for annotype as 'codingtranscript', 'noncodingtranscript'
-    annos = (row for row in rows if "CodingTranscript" in row[9] or
-             get_hgvs_from_vcf(row[0], row[1], row[2], row[4]) in set_ids)
+    annos = select_rows(rows, set_ids)
     json_rows = map(_map_line_to_json, annos)
     json_rows = (row for row in json_rows if row)
     row_groups = (it for (key, it) in groupby(json_rows, lambda row: row["_id"]))
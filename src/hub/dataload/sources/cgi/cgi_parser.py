@@ -2,7 +2,10 @@ import unicodedata
 from collections import defaultdict
 
 from csv import DictReader
-from biothings.utils.dataload import dict_sweep, open_anyfile
+from biothings.utils.dataload import open_anyfile
+from utils.normalize import DocNormalizer
+
+normalize = DocNormalizer(convert=False, unlist=False, sweep=['', 'null', 'N/A', None, [], {}])
 
 
 def load_data(input_file):
@@ -44,7 +47,7 @@ def load_data(input_file):
 
                 variant['cgi'][new_k] = unicodedata.normalize("NFKD", row.get(old_k, None))
 
-            variant = dict_sweep(variant, vals=['', 'null', 'N/A', None, [], {}])
+            variant = normalize(variant)
             results[variant['_id']].append(variant)
 
         # Merge duplications
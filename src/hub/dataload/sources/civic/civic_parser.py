@@ -5,7 +5,10 @@ import glob
 import os
 import logging
 from utils.hgvs import get_hgvs_from_vcf
-from biothings.utils.dataload import unlist, dict_sweep, to_int
+from biothings.utils.dataload import to_int
+from utils.normalize import DocNormalizer
+
+normalize = DocNormalizer(convert=False, sweep=['', 'null', 'N/A', None, [], {}])
 
 
 def load_data(data_folder):
@@ -64,7 +67,7 @@ def load_data(data_folder):
                     else:
                         raise ValueError("The value of source_type is not one of PubMed or ASCO, it's {}, need to restructure parser".format(_evidence['source']['source_type']))
             new_doc['civic'] = doc
-            yield dict_sweep(unlist(new_doc),['','null', 'N/A', None, [], {}])
+            yield normalize(new_doc)
             # change doid into its formal representation, which should be sth like DOID:1
         else:
             continue
@@ -1,12 +1,10 @@
 import os
 import os.path
-import sys
-import time
 
 import biothings, config
 biothings.config_for_app(config)
 
-from config import DATA_ARCHIVE_ROOT, logger as logging
+from config import DATA_ARCHIVE_ROOT
 from biothings.hub.dataload.dumper import FTPDumper
 
 
@@ -49,40 +47,6 @@ class ClinvarDumper(FTPDumper):
         if force or not os.path.exists(current_localfile) or self.remote_is_better(self.newest_file,current_localfile) or self.new_release_available():
             # register new release (will be stored in backend)
             self.to_dump.append({"remote": self.newest_file,"local":new_localfile})
-            # schema
-            xsd = "clinvar_public.xsd"
-            localxsdfile = os.path.join(self.new_data_folder,xsd)
-            self.to_dump.append({"remote": "../%s" % xsd, "local":localxsdfile})
-
-    def post_dump(self, *args, **kwargs):
-        generate_clinvar_lib(self.new_data_folder)
-
-
-def generate_clinvar_lib(data_folder):
-    sys.path.insert(0,data_folder)
-    orig_path = os.getcwd()
-    try:
-        os.chdir(data_folder)
-        logging.info("Generate XM parser")
-        ret = os.system('''generateDS.py -f -o "clinvar_tmp.py" -s "clinvarsubs.py" clinvar_public.xsd''')
-        if ret != 0:
-            raise Exception("Unable to generate parser, return code: %s" % ret)
-        try:
-            py = open("clinvar_tmp.py").read()
-            # convert py2 to py3 (though they claim it support both versions)
-            py = py.replace("from StringIO import StringIO","from io import StringIO")
-            fout = open("genclinvar.py","w")
-            fout.write(py)
-            fout.close()
-            os.unlink("clinvar_tmp.py")
-            # can we import it ?
-            import genclinvar
-            logging.info("Found generated clinvar module: %s" % genclinvar)
-        except Exception as e:
-            logging.error("Cannot convert to py3: %s" % e)
-            raise
-    finally:
-        os.chdir(orig_path)
 
 
 def main():
@@ -7,7 +7,8 @@ import os
 
 import vcf
 
-from biothings.utils.dataload import unlist, dict_sweep, value_convert_to_number, merge_duplicate_rows
+from biothings.utils.dataload import merge_duplicate_rows
+from utils.normalize import DocNormalizer
 
 ''' vcf file for clinvar downloaded from
 ftp://ftp.ncbi.nlm.nih.gov/pub/clinvar/vcf_GRCh37/
@@ -15,6 +16,7 @@ and tab_delimited file for clinvar downloaded from
 ftp://ftp.ncbi.nlm.nih.gov/pub/clinvar/tab_delimited/'''
 
 VALID_COLUMN_NO = 25
+normalize = DocNormalizer(sweep=["-"])
 vcf_reader = vcf.Reader(filename='clinvar_20150305.vcf.gz')
 
 
@@ -142,7 +144,7 @@ def _map_line_to_json(fields):
                 "clinvar_id": fields[24]
             }
         }
-    return dict_sweep(unlist(value_convert_to_number(one_snp_json)), vals=["-"])
+    return normalize(one_snp_json)
 
 
 # open file, parse, pass to json mapper
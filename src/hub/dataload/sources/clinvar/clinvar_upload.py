@@ -232,7 +232,7 @@ class ClinvarHG19Uploader(ClinvarBaseUploader):
     def load_data(self,data_folder):
         self.logger.info("Load data from folder '%s'" % data_folder)
         try:
-            return load_common(data_folder,"hg19")
+            return load_common(data_folder,"hg19",genome=self.get_genome_store())
         except Exception as e:
             import traceback
             self.logger.error("Error while uploading, %s:\n%s" % (e,traceback.format_exc()))
@@ -252,7 +252,7 @@ class ClinvarHG38Uploader(ClinvarBaseUploader):
     def load_data(self,data_folder):
         self.logger.info("Load data from folder '%s'" % data_folder)
         try:
-            return load_common(data_folder,"hg38")
+            return load_common(data_folder,"hg38",genome=self.get_genome_store())
         except Exception as e:
             import traceback
             self.logger.error("Error while uploading, %s:\n%s" % (e,traceback.format_exc()))
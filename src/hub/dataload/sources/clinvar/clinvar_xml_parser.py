@@ -1,35 +1,29 @@
-# a python lib is generated on the fly, in data folder
-# adjust path
-
-
-import sys, os, glob
+import os, glob, gzip
 from itertools import groupby
+import xml.etree.ElementTree as ET
 
 from config import DATA_ARCHIVE_ROOT, logger as logging
 import biothings, config
 biothings.config_for_app(config)
-from biothings.utils.dataload import unlist, dict_sweep, \
-                                     value_convert_to_number, rec_handler
+from utils.normalize import DocNormalizer
+from utils.extsort import external_sort
+from utils.hgvs import get_hgvs_from_vcf_many
+from utils.genome import GenomeStore
 
 GLOB_PATTERN = "ClinVarFullRelease_*.xml.gz"
-clinvarlib = None
-
-def import_clinvar_lib(data_folder):
-    sys.path.insert(0,data_folder)
-    import genclinvar as clinvar_mod
-    global clinvarlib
-    clinvarlib = clinvar_mod
+# number of documents sorted in memory before being spilled to disk
+RUN_SIZE = 100000
+normalize = DocNormalizer(skipped_keys=['chrom', 'omim', 'id', 'orphanet', 'gene',
+                                        'rettbase_(cdkl5)', 'cosmic', 'dbrbc'],
+                          sweep=[None, '', 'None'])
 
 def merge_rcv_accession(generator):
-    groups = []
+    # generator is sorted by _id, groups are merged as they come
+    num_groups = 0
     for key, group in groupby(generator, lambda x: x['_id']):
-        groups.append(list(group))
-
-    # get the number of groups, and uniquekeys
-    logging.info("number of groups: %s" % len(groups))
-
-    # loop through each item, if item number >1, merge rcv accession number
-    for item in groups:
+        item = list(group)
+        num_groups += 1
+        # if item number >1, merge rcv accession number
         rcv_new = []
         if len(item) > 1:
             json_item = item[0]
@@ -41,14 +35,37 @@ def merge_rcv_accession(generator):
         else:
             yield item[0]
 
+    # get the number of groups, and uniquekeys
+    logging.info("number of groups: %s" % num_groups)
+
+
+def normalize_indel_id(genome, chrom, variation_type, start, end, ins_seq=None):
+    '''return normalized hgvs id (see utils.hgvs.normalize_vcf_many()) for a
+       'Deletion' (start..end) or 'Insertion' (ins_seq between start and end),
+       or None if it can't be expressed as a VCF record on genome'''
+    try:
+        start, end = int(start), int(end)
+        if variation_type == 'Deletion':
+            # VCF-style: anchor base before deleted bases
+            ref = genome.fetch(chrom, start - 1, end)
+            pos, alt = start - 1, ref[0]
+        elif variation_type == 'Insertion' and end == start + 1:
+            ref = genome.fetch(chrom, start, start)
+            pos, alt = start, ref + ins_seq
+        else:
+            return None
+    except (ValueError, KeyError):
+        return None
+    return get_hgvs_from_vcf_many(chrom, pos, ref, [alt], skip_invalid=True, genome=genome)[0]
+
 
-def parse_measure(Measure, hg19=True):
-    variation_type = Measure.Type
+def parse_measure(Measure, hg19=True, genome=None):
+    variation_type = Measure.get("Type")
     # exclude any item of which types belong to
     # 'Variation', 'protein only' or 'Microsatellite'
     if variation_type == 'Variation' or variation_type == 'protein only' or variation_type == 'Microsatellite':
         return None
-    allele_id = Measure.ID
+    allele_id = Measure.get("ID")
     chrom = None
     chromStart_19 = None
     chromEnd_19 = None
@@ -56,40 +73,32 @@ def parse_measure(Measure, hg19=True):
     chromEnd_38 = None
     ref = None
     alt = None
-    if Measure.SequenceLocation:
-        for SequenceLocation in Measure.SequenceLocation:
-            # In this version, only accept information concerning GRCh37
-            if 'GRCh37' in SequenceLocation.Assembly:
-                chrom = SequenceLocation.Chr
-                chromStart_19 = SequenceLocation.start
-                chromEnd_19 = SequenceLocation.stop
-                ref = SequenceLocation.referenceAllele
-                alt = SequenceLocation.alternateAllele
-            if 'GRCh38' in SequenceLocation.Assembly:
-                chromStart_38 = SequenceLocation.start
-                chromEnd_38 = SequenceLocation.stop
-                if not ref:
-                    ref = SequenceLocation.referenceAllele
-                if not alt:
-                    alt = SequenceLocation.alternateAllele
-    if Measure.MeasureRelationship:
-        try:
-            symbol = Measure.MeasureRelationship[0].\
-                Symbol[0].get_ElementValue().valueOf_
-        except:
-            symbol = None
-        gene_id = Measure.MeasureRelationship[0].XRef[0].ID
+    for SequenceLocation in Measure.iterfind("SequenceLocation"):
+        # In this version, only accept information concerning GRCh37
+        if 'GRCh37' in SequenceLocation.get("Assembly"):
+            chrom = SequenceLocation.get("Chr")
+            chromStart_19 = SequenceLocation.get("start")
+            chromEnd_19 = SequenceLocation.get("stop")
+            ref = SequenceLocation.get("referenceAllele")
+            alt = SequenceLocation.get("alternateAllele")
+        if 'GRCh38' in SequenceLocation.get("Assembly"):
+            chromStart_38 = SequenceLocation.get("start")
+            chromEnd_38 = SequenceLocation.get("stop")
+            if not ref:
+                ref = SequenceLocation.get("referenceAllele")
+            if not alt:
+                alt = SequenceLocation.get("alternateAllele")
+    MeasureRelationship = Measure.find("MeasureRelationship")
+    if MeasureRelationship is not None:
+        symbol = MeasureRelationship.findtext("Symbol/ElementValue")
+        gene_id = MeasureRelationship.findall("XRef")[0].get("ID")
     else:
         symbol = None
         gene_id = None
-    if Measure.Name:
-        name = Measure.Name[0].ElementValue.valueOf_
-    else:
-        name = None
-    if len(Measure.CytogeneticLocation) == 1:
-        cytogenic = Measure.CytogeneticLocation[0]
-    else:
-        cytogenic = Measure.CytogeneticLocation
+    name = Measure.findtext("Name/ElementValue")
+    cytogenic = [loc.text for loc in Measure.iterfind("CytogeneticLocation")]
+    if len(cytogenic) == 1:
+        cytogenic = cytogenic[0]
     hgvs_coding = None
     hgvs_genome = None
     HGVS = {'genomic': [], 'coding': [], 'non-coding': [], 'protein': []}
@@ -102,47 +111,40 @@ def parse_measure(Measure, hg19=True):
         chromStart = chromStart_38
         chromEnd = chromEnd_38
     # hgvs_not_validated = None
-    if Measure.AttributeSet:
+    Attributes = Measure.findall("AttributeSet/Attribute")
+    if Attributes:
         # 'copy number loss' or 'gain' have format different\
         # from other types, should be dealt with seperately
         if (variation_type == 'copy number loss') or \
                 (variation_type == 'copy number gain'):
-            for AttributeSet in Measure.AttributeSet:
-                if 'HGVS, genomic, top level' in AttributeSet.\
-                        Attribute.Type:
-                    if AttributeSet.Attribute.integerValue == 37:
-                        hgvs_genome = AttributeSet.Attribute.get_valueOf_()
-                if 'genomic' in AttributeSet.Attribute.Type:
-                    HGVS['genomic'].append(AttributeSet.Attribute.
-                                           get_valueOf_())
-                elif 'non-coding' in AttributeSet.Attribute.Type:
-                    HGVS['non-coding'].append(AttributeSet.Attribute.
-                                              get_valueOf_())
-                elif 'coding' in AttributeSet.Attribute.Type:
-                    HGVS['coding'].append(AttributeSet.Attribute.
-                                          get_valueOf_())
-                elif 'protein' in AttributeSet.Attribute.Type:
-                    HGVS['protein'].append(AttributeSet.
-                                           Attribute.get_valueOf_())
+            for Attribute in Attributes:
+                attr_type = Attribute.get("Type")
+                if 'HGVS, genomic, top level' in attr_type:
+                    if Attribute.get("integerValue") == "37":
+                        hgvs_genome = Attribute.text
+                if 'genomic' in attr_type:
+                    HGVS['genomic'].append(Attribute.text)
+                elif 'non-coding' in attr_type:
+                    HGVS['non-coding'].append(Attribute.text)
+                elif 'coding' in attr_type:
+                    HGVS['coding'].append(Attribute.text)
+                elif 'protein' in attr_type:
+                    HGVS['protein'].append(Attribute.text)
         else:
-            for AttributeSet in Measure.AttributeSet:
-                if 'genomic' in AttributeSet.Attribute.Type:
-                    HGVS['genomic'].append(AttributeSet.
-                                           Attribute.get_valueOf_())
-                elif 'non-coding' in AttributeSet.Attribute.Type:
-                    HGVS['non-coding'].append(AttributeSet.
-                                              Attribute.get_valueOf_())
-                elif 'coding' in AttributeSet.Attribute.Type:
-                    HGVS['coding'].append(AttributeSet.Attribute.
-                                          get_valueOf_())
-                elif 'protein' in AttributeSet.Attribute.Type:
-                    HGVS['protein'].append(AttributeSet.
-                                           Attribute.get_valueOf_())
-                if AttributeSet.Attribute.Type == 'HGVS, coding, RefSeq':
-                    hgvs_coding = AttributeSet.Attribute.get_valueOf_()
-                elif AttributeSet.Attribute.Type == \
-                        'HGVS, genomic, top level, previous':
-                    hgvs_genome = AttributeSet.Attribute.get_valueOf_()
+            for Attribute in Attributes:
+                attr_type = Attribute.get("Type")
+                if 'genomic' in attr_type:
+                    HGVS['genomic'].append(Attribute.text)
+                elif 'non-coding' in attr_type:
+                    HGVS['non-coding'].append(Attribute.text)
+                elif 'coding' in attr_type:
+                    HGVS['coding'].append(Attribute.text)
+                elif 'protein' in attr_type:
+                    HGVS['protein'].append(Attribute.text)
+                if attr_type == 'HGVS, coding, RefSeq':
+                    hgvs_coding = Attribute.text
+                elif attr_type == 'HGVS, genomic, top level, previous':
+                    hgvs_genome = Attribute.text
                     break
         if chrom and chromStart and chromEnd:
             if variation_type == 'single nucleotide variant':
@@ -163,6 +165,9 @@ def parse_measure(Measure, hg19=True):
                     hgvs_id = "chr%s:g.%sdel" % (chrom, chromStart)
                 else:
                     hgvs_id = "chr%s:g.%s_%sdel" % (chrom, chromStart, chromEnd)
+                if genome is not None:
+                    hgvs_id = normalize_indel_id(genome, chrom, variation_type,
+                                                 chromStart, chromEnd) or hgvs_id
             elif variation_type == 'Insertion':
                 if hgvs_genome:
                     ins_position = hgvs_genome.find('ins')
@@ -174,6 +179,9 @@ def parse_measure(Measure, hg19=True):
                         else:
                             hgvs_id = "chr%s:g.%s_%sins%s" % \
                                       (chrom, chromStart, chromEnd, ins_ref)
+                        if genome is not None:
+                            hgvs_id = normalize_indel_id(genome, chrom, variation_type,
+                                                         chromStart, chromEnd, ins_ref) or hgvs_id
             elif variation_type == 'Duplication':
                 if hgvs_genome:
                     dup_position = hgvs_genome.find('dup')
@@ -204,18 +212,18 @@ def parse_measure(Measure, hg19=True):
     uniprot = None
     omim = None
     # loop through XRef to find rsid as well as other ids
-    if Measure.XRef:
-        for XRef in Measure.XRef:
-            if XRef.Type == 'rs':
-                rsid = 'rs' + str(XRef.ID)
-            elif XRef.DB == 'COSMIC':
-                cosmic = XRef.ID
-            elif XRef.DB == 'OMIM':
-                omim = XRef.ID
-            elif XRef.DB == 'UniProtKB/Swiss-Prot':
-                uniprot = XRef.ID
-            elif XRef.DB == 'dbVar':
-                dbvar = XRef.ID
+    for XRef in Measure.iterfind("XRef"):
+        xref_db = XRef.get("DB")
+        if XRef.get("Type") == 'rs':
+            rsid = 'rs' + XRef.get("ID")
+        elif xref_db == 'COSMIC':
+            cosmic = XRef.get("ID")
+        elif xref_db == 'OMIM':
+            omim = XRef.get("ID")
+        elif xref_db == 'UniProtKB/Swiss-Prot':
+            uniprot = XRef.get("ID")
+        elif xref_db == 'dbVar':
+            dbvar = XRef.get("ID")
 
     # make sure the hgvs_id is not none
     if hgvs_id:
@@ -261,66 +269,52 @@ def parse_measure(Measure, hg19=True):
 
         return one_snp_json
 
-def _map_line_to_json(cp, hg19):
-    try:
-        clinical_significance = cp.ReferenceClinVarAssertion.\
-            ClinicalSignificance.Description
-    except:
-        clinical_significance = None
-    rcv_accession = cp.ReferenceClinVarAssertion.ClinVarAccession.Acc
-    try:
-        review_status = cp.ReferenceClinVarAssertion.ClinicalSignificance.\
-            ReviewStatus
-    except:
-        review_status = None
-    try:
-        last_evaluated = cp.ReferenceClinVarAssertion.ClinicalSignificance.\
-            DateLastEvaluated
-    except:
-        last_evaluated = None
-    
-    number_submitters = len(cp.ClinVarAssertion)
+def _map_line_to_json(cp, hg19, genome=None):
+    rcva = cp.find("ReferenceClinVarAssertion")
+    clinical_significance = rcva.findtext("ClinicalSignificance/Description")
+    rcv_accession = rcva.find("ClinVarAccession").get("Acc")
+    review_status = rcva.findtext("ClinicalSignificance/ReviewStatus")
+    ClinicalSignificance = rcva.find("ClinicalSignificance")
+    last_evaluated = ClinicalSignificance.get("DateLastEvaluated") \
+        if ClinicalSignificance is not None else None
+
+    number_submitters = len(cp.findall("ClinVarAssertion"))
     # some items in clinvar_xml doesn't have origin information
-    try:
-        origin = cp.ReferenceClinVarAssertion.ObservedIn[0].Sample.Origin
-    except:
-        origin = None
+    ObservedIn = rcva.find("ObservedIn")
+    origin = ObservedIn.findtext("Sample/Origin") if ObservedIn is not None else None
     conditions = []
-    for _trait in cp.ReferenceClinVarAssertion.TraitSet.Trait:
+    for _trait in rcva.iterfind("TraitSet/Trait"):
         synonyms = []
         conditions_name = ''
-        for name in _trait.Name:
-            if name.ElementValue.Type == 'Alternate':
-                synonyms.append(name.ElementValue.get_valueOf_())
-            if name.ElementValue.Type == 'Preferred':
-                conditions_name += name.ElementValue.get_valueOf_()
+        for value in _trait.iterfind("Name/ElementValue"):
+            if value.get("Type") == 'Alternate':
+                synonyms.append(value.text)
+            if value.get("Type") == 'Preferred':
+                conditions_name += value.text or ''
         identifiers = {}
-        for item in _trait.XRef:
-            if item.DB == 'Human Phenotype Ontology':
+        for item in _trait.iterfind("XRef"):
+            if item.get("DB") == 'Human Phenotype Ontology':
                 key = 'Human_Phenotype_Ontology'
             else:
-                key = item.DB
-            identifiers[key.lower()] = item.ID
-        for symbol in _trait.Symbol:
-            if symbol.ElementValue.Type == 'Preferred':
-                conditions_name += ' (' + symbol.ElementValue.get_valueOf_() + ')'
+                key = item.get("DB")
+            identifiers[key.lower()] = item.get("ID")
+        for value in _trait.iterfind("Symbol/ElementValue"):
+            if value.get("Type") == 'Preferred':
+                conditions_name += ' (' + (value.text or '') + ')'
         age_of_onset = ''
-        for _set in _trait.AttributeSet:
-            if _set.Attribute.Type == 'age of onset':
-                age_of_onset = _set.Attribute.get_valueOf_()
+        for attribute in _trait.iterfind("AttributeSet/Attribute"):
+            if attribute.get("Type") == 'age of onset':
+                age_of_onset = attribute.text
         conditions.append({"name": conditions_name, "synonyms": synonyms, "identifiers": identifiers, "age_of_onset": age_of_onset})
 
-    try:
-        genotypeset = cp.ReferenceClinVarAssertion.GenotypeSet
-    except:
-        genotypeset = None
-    if genotypeset:
+    genotypeset = rcva.find("GenotypeSet")
+    if genotypeset is not None:
         obj_list = []
         id_list = []
-        for _set in cp.ReferenceClinVarAssertion.GenotypeSet.MeasureSet:
-            variant_id = _set.ID
-            for _measure in _set.Measure:
-                json_obj = parse_measure(_measure, hg19=hg19)
+        for _set in genotypeset.iterfind("MeasureSet"):
+            variant_id = _set.get("ID")
+            for _measure in _set.iterfind("Measure"):
+                json_obj = parse_measure(_measure, hg19=hg19, genome=genome)
                 if json_obj:
                     json_obj['clinvar']['rcv'].update({'accession': rcv_accession,
                         'clinical_significance': clinical_significance,
@@ -330,9 +324,7 @@ def _map_line_to_json(cp, hg19):
                         'origin': origin,
                         'conditions': conditions})
                     json_obj['clinvar'].update({'variant_id': variant_id})
-                    json_obj = (dict_sweep(unlist(value_convert_to_number(json_obj,
-                                               ['chrom', 'omim', 'id', 'orphanet', 'gene',
-                                                'rettbase_(cdkl5)', 'cosmic', 'dbrbc'])), [None, '', 'None']))
+                    json_obj = normalize(json_obj)
                     obj_list.append(json_obj)
                     id_list.append(json_obj['_id'])
         for _obj in obj_list:
@@ -342,9 +334,10 @@ def _map_line_to_json(cp, hg19):
                     }})
             yield _obj
     else:
-        variant_id = cp.ReferenceClinVarAssertion.MeasureSet.ID
-        for _measure in cp.ReferenceClinVarAssertion.MeasureSet.Measure:
-            json_obj = parse_measure(_measure, hg19=hg19)
+        measureset = rcva.find("MeasureSet")
+        variant_id = measureset.get("ID")
+        for _measure in measureset.iterfind("Measure"):
+            json_obj = parse_measure(_measure, hg19=hg19, genome=genome)
             if json_obj:
                 json_obj['clinvar']['rcv'].update({'accession': rcv_accession,
                         'clinical_significance': clinical_significance,
@@ -354,43 +347,52 @@ def _map_line_to_json(cp, hg19):
                         'origin': origin,
                         'conditions': conditions})
                 json_obj['clinvar'].update({'variant_id': variant_id})
-                json_obj = (dict_sweep(unlist(value_convert_to_number(json_obj,
-                                               ['chrom', 'omim', 'id', 'orphanet', 'gene',
-                                                'rettbase_(cdkl5)', 'cosmic', 'dbrbc'])), [None, '', 'None']))
+                json_obj = normalize(json_obj)
                 yield json_obj
 
 
-def rcv_feeder(input_file, hg19):
-    # the first two line of clinvar_xml is not useful information
-    cv_data = rec_handler(input_file, block_end='</ClinVarSet>\n',
-                          skip=2, include_block_end=True)
-    for record in cv_data:
-        # some exceptions
-        if record.startswith('\n</ReleaseSet>'):
-            continue
+def iter_clinvarsets(input_file):
+    '''stream <ClinVarSet> elements from (gzipped) XML file, each element is
+       cleared once the next one is requested so memory doesn't grow with file'''
+    fsock = gzip.open(input_file, "rb") if input_file.endswith(".gz") else open(input_file, "rb")
+    try:
+        context = ET.iterparse(fsock, events=("start", "end"))
+        _, root = next(context)
+        for event, elem in context:
+            if event == "end" and elem.tag == "ClinVarSet":
+                yield elem
+                # drop processed records (attached to <ReleaseSet>)
+                root.clear()
+    finally:
+        fsock.close()
+
+
+def rcv_feeder(input_file, hg19, genome=None):
+    for record in iter_clinvarsets(input_file):
         try:
-            record_parsed = clinvarlib.parseString(record, silence=1)
+            for record_mapped in _map_line_to_json(record, hg19, genome=genome):
+                yield record_mapped
         except:
-            logging.debug(record)
+            logging.debug(ET.tostring(record, encoding="unicode"))
             raise
-        for record_mapped in _map_line_to_json(record_parsed, hg19):
-            yield record_mapped
 
-def load_data(data_folder, version):
+def load_data(data_folder, version, genome=None):
     # try to get logger from uploader
     import logging as loggingmod
     global logging
     logging = loggingmod.getLogger("clinvar_upload")
 
-    import_clinvar_lib(data_folder)
     files = glob.glob(os.path.join(data_folder,GLOB_PATTERN))
     assert len(files) == 1, "Expecting only one file matching '%s', got: %s" % (GLOB_PATTERN,files)
     input_file = files[0]
-    data_generator = rcv_feeder(input_file, version == "hg19")
-    data_list = list(data_generator)
-    # TODO: why do we sort this list ? this prevent from using yield/iterator
-    data_list_sorted = sorted(data_list, key=lambda k: k['_id'])
-    data_merge_rcv = merge_rcv_accession(data_list_sorted)
+    genome = genome and GenomeStore(genome)
+    data_generator = rcv_feeder(input_file, version == "hg19", genome=genome)
+    # a variant can be found in several RCV records (not consecutive), sort by
+    # _id so they can be merged. Sorted on disk, by runs, not to hold the
+    # whole release in memory
+    data_sorted = external_sort(data_generator, key=lambda k: k['_id'],
+                                run_size=RUN_SIZE, tmp_dir=data_folder)
+    data_merge_rcv = merge_rcv_accession(data_sorted)
     return data_merge_rcv
 
 if __name__ == "__main__":
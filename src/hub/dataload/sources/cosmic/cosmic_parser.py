@@ -3,19 +3,53 @@ import csv
 import re
 from itertools import groupby
 import operator
-from biothings.utils.dataload import dict_sweep, value_convert_to_number, merge_duplicate_rows
+from biothings.utils.dataload import merge_duplicate_rows
+from utils.normalize import DocNormalizer
+from utils.docmapper import DocMapper
 
 
 VALID_COLUMN_NO = 29 + 1
+normalize = DocNormalizer(unlist=False, sweep=[""])
+
+
+def _chr_info(val):
+    # Mutation GRCh37 genome position: chrom, start, end
+    return re.findall(r"[\w']+", val)[:3]
+
+
+# column position => document field
+COSMIC_SPEC = [
+    ("gene.symbol", 0),  # Gene name
+    ("gene.id", 3),  # HGNC ID
+    ("gene.cds_length", 2),
+    ("transcript", 1),  # Accession Number
+    ("sample.name", 4),  # Sample name
+    ("sample.id", 5),  # ID_sample
+    ("tumour.id", 6),  # ID_tumour
+    ("tumour.primary_site", 7),  # Primary site
+    ("tumour.site_subtype", 8),  # Site subtype
+    ("tumour.primary_histology", 9),  # Primary histology
+    ("tumour.histology_subtype", 10),  # Histology subtype
+    ("tumour.origin", 1),
+    ("mutation.id", 12, lambda val: "COSM" + val),  # Mutation ID
+    ("mutation.cds", 13),  # Mutation CDS
+    ("mutation.aa", 14),  # Mutation AA
+    ("mutation.description", 15),  # Mutation Description
+    ("mutation.zygosity", 16),  # Mutation zygosity
+    ("mutation.somatic_status", 21),  # Mutation somatic status
+    (("chrom", "hg19.start", "hg19.end"), 17, _chr_info),
+    ("pubmed", 22),  # Pubmed_PMID
+]
+map_cosmic = DocMapper(COSMIC_SPEC).compile()
 
 
 # convert one snp to json
 def _map_line_to_json(fields):
     assert len(fields) == VALID_COLUMN_NO
-    chr_info = re.findall(r"[\w']+", fields[17])
-    chrom = chr_info[0]  # Mutation GRCh37 genome position
-    chromStart = chr_info[1]
-    chromEnd = chr_info[2]
+    cosmic = map_cosmic(fields)
+    chrom = cosmic["chrom"]  # Mutation GRCh37 genome position
+    chromStart = cosmic["hg19"]["start"]
+    chromEnd = cosmic["hg19"]["end"]
 
     HGVS = None
     cds = fields[13]
@@ -46,48 +80,9 @@ def _map_line_to_json(fields):
     one_snp_json = {
         "sorter": fields[17] + fields[13],
         "_id": HGVS,
-        "cosmic":
-            {
-                "gene":
-                    {
-                        "symbol": fields[0],  # Gene name
-                        "id": fields[3],  # HGNC ID
-                        "cds_length": fields[2]
-                    },
-                "transcript": fields[1],  # Accession Number
-                "sample":
-                    {
-                        "name": fields[4],  # Sample name
-                        "id": fields[5]  # ID_sample
-                    },
-                "tumour":
-                    {
-                        "id": fields[6],  # ID_tumour
-                        "primary_site": fields[7],  # Primary site
-                        "site_subtype": fields[8],  # Site subtype
-                        "primary_histology": fields[9],  # Primary histology
-                        "histology_subtype": fields[10],  # Histology subtype
-                        "origin": fields[1]
-                    },
-                "mutation":
-                    {
-                        "id": "COSM" + fields[12],  # Mutation ID
-                        "cds": cds,  # Mutation CDS
-                        "aa": fields[14],  # Mutation AA
-                        "description": fields[15],  # Mutation Description
-                        "zygosity": fields[16],  # Mutation zygosity
-                        "somatic_status": fields[21]  # Mutation somatic status
-                    },
-                "chrom": chrom,
-                "hg19":
-                   {
-                        "start": chromStart,
-                        "end": chromEnd
-                    },
-                "pubmed": fields[22]  # Pubmed_PMID
-            }
+        "cosmic": cosmic
         }
-    return dict_sweep(value_convert_to_number(one_snp_json), vals=[""])
+    return normalize(one_snp_json)
 
 
 # open file, parse, pass to json mapper
@@ -1,9 +1,10 @@
 import csv
 import glob
-from utils.dataload import list_split, dict_sweep, unlist
+from utils.normalize import DocNormalizer
 
 
 VALID_COLUMN_NO = 136
+normalize = DocNormalizer(sweep=[".", None], split=";")
 
 '''this parser is for dbNSFP v3.3a beta2 downloaded from
 https://sites.google.com/site/jpopgen/dbNSFP'''
@@ -308,7 +309,7 @@ def _map_line_to_json(df, version, index=0):
         }
     }
 
-    one_snp_json = list_split(dict_sweep(unlist(value_convert_to_number(one_snp_json)), vals=[".", None]), ";")
+    one_snp_json = normalize(one_snp_json)
     one_snp_json["dbnsfp"]["chrom"] = str(one_snp_json["dbnsfp"]["chrom"])
     return one_snp_json
 
@@ -1,644 +1,330 @@
 import csv
 import glob
-from biothings.utils.dataload import list_split, dict_sweep, unlist, value_convert_to_number
+from utils.normalize import DocNormalizer
+from utils.docmapper import DocMapper
 from biothings.utils.common import anyfile
 
 VALID_COLUMN_NO = 367
+normalize = DocNormalizer(sweep=[".", '-', "NA", None], remove_invalid_list=True, split=";")
 
 '''this parser is for dbNSFP v3.5a beta2 downloaded from
 https://sites.google.com/site/jpopgen/dbNSFP'''
 
+
+# column converters
+def _chrom(chrom):
+    return 'MT' if chrom == 'M' else chrom
+
+
+def _pos(pos):
+    return pos if pos == "." else int(pos)
+
+
+def _upper(val):
+    return val.upper()
+
+
+def _split(val):
+    return val.split(';')
+
+
+def _scores(val):
+    return [None if item == '.' else item for item in val.split(';')]
+
+
+def _values(sep):
+    return lambda val: [i for i in val.split(sep) if i != "."]
+
+
+def _hgvs(chrom, pos, ref, alt):
+    return "chr%s:g.%d%s>%s" % (_chrom(chrom), int(pos), ref.upper(), alt.upper())
+
+
+def _siphy(val):
+    if val == ".":
+        return "."
+    freq = val.split(":")
+    return {'a': freq[0], 'c': freq[1], 'g': freq[2], 't': freq[3]}
+
+
+def _uniprot(acc, entry):
+    acc = acc.rstrip().rstrip(';').split(";")
+    entry = entry.rstrip().rstrip(';').split(";")
+    return [dict(zip(('acc', 'entry'), t)) for t in zip(acc, entry)]
+
+
+def _gtex(gene, tissue):
+    return [dict(zip(('gene', 'tissue'), t)) for t in zip(gene.split('|'), tissue.split('|'))]
+
+
+def _mutpred(mechanisms):
+    '''parse mutpred top 5 features'''
+    if mechanisms in ['.', ',', '-']:
+        return '.'
+    mechanisms = [m.rstrip(")") for m in mechanisms.split(";")]
+    mechanisms = sum([m.split(" (") for m in mechanisms], [])
+    return [{"mechanism": mechanisms[i], "p_val": float(mechanisms[i + 1].strip('P = '))}
+            for i in range(0, 10, 2)]
+
+
+def _populations(path, prefix, pops, fields):
+    return [("%s.%s_%s" % (path, pop.lower(), key), "%s_%s_%s" % (prefix, pop, col))
+            for pop in pops for key, col in fields]
+
+
+# column => document field specs, "_id" is version specific
+ID_SPEC = {
+    "hg19": ("_id", ("#chr", "hg19_pos(1-based)", "ref", "alt"), _hgvs),
+    "hg38": ("_id", ("#chr", "pos(1-coor)", "ref", "alt"), _hgvs),
+}
+
+DBNSFP_SPEC = [
+    ("dbnsfp.rsid", "rs_dbSNP151"),
+    ("dbnsfp.chrom", "#chr", _chrom),
+    ("dbnsfp.hg19.start", "hg19_pos(1-based)", int),
+    ("dbnsfp.hg19.end", "hg19_pos(1-based)", int),
+    ("dbnsfp.hg18.start", "hg18_pos(1-based)"),
+    ("dbnsfp.hg18.end", "hg18_pos(1-based)", _pos),
+    ("dbnsfp.hg38.start", "pos(1-coor)"),
+    ("dbnsfp.hg38.end", "pos(1-coor)"),
+    ("dbnsfp.ref", "ref", _upper),
+    ("dbnsfp.alt", "alt", _upper),
+    ("dbnsfp.aa.ref", "aaref"),
+    ("dbnsfp.aa.alt", "aaalt"),
+    ("dbnsfp.aa.pos", "aapos"),
+    ("dbnsfp.aa.refcodon", "refcodon"),
+    ("dbnsfp.aa.codonpos", "codonpos"),
+    ("dbnsfp.aa.codon_degeneracy", "codon_degeneracy"),
+    ("dbnsfp.genename", "genename"),
+    ("dbnsfp.uniprot", ("Uniprot_acc", "Uniprot_entry"), _uniprot),
+    ("dbnsfp.vindijia_neandertal", "VindijiaNeandertal", _values("/")),
+    ("dbnsfp.interpro_domain", "Interpro_domain"),
+    ("dbnsfp.cds_strand", "cds_strand"),
+    ("dbnsfp.ancestral_allele", "Ancestral_allele"),
+    ("dbnsfp.appris", "APPRIS", _split),
+    ("dbnsfp.genecode_basic", "GENCODE_basic"),
+    ("dbnsfp.tsl", "TSL", _split),
+    ("dbnsfp.vep_canonical", "VEP_canonical", _split),
+    ("dbnsfp.ensembl.geneid", "Ensembl_geneid"),
+    ("dbnsfp.ensembl.transcriptid", "Ensembl_transcriptid"),
+    ("dbnsfp.ensembl.proteinid", "Ensembl_proteinid"),
+    ("dbnsfp.sift.score", "SIFT_score", _scores),
+    ("dbnsfp.sift.converted_rankscore", "SIFT_converted_rankscore"),
+    ("dbnsfp.sift.pred", "SIFT_pred"),
+    ("dbnsfp.sift4g.score", "SIFT4G_score", _split),
+    ("dbnsfp.sift4g.pred", "SIFT4G_score"),
+    ("dbnsfp.sift4g.converted_rankscore", "SIFT4G_converted_rankscore"),
+    ("dbnsfp.polyphen2.hdiv.score", "Polyphen2_HDIV_score", _scores),
+    ("dbnsfp.polyphen2.hdiv.rankscore", "Polyphen2_HDIV_rankscore"),
+    ("dbnsfp.polyphen2.hdiv.pred", "Polyphen2_HDIV_pred"),
+    ("dbnsfp.polyphen2.hvar.score", "Polyphen2_HVAR_score", _scores),
+    ("dbnsfp.polyphen2.hvar.rankscore", "Polyphen2_HVAR_rankscore"),
+    ("dbnsfp.polyphen2.hvar.pred", "Polyphen2_HVAR_pred"),
+    ("dbnsfp.lrt.score", "LRT_score", _scores),
+    ("dbnsfp.lrt.converted_rankscore", "LRT_converted_rankscore"),
+    ("dbnsfp.lrt.pred", "LRT_pred"),
+    ("dbnsfp.lrt.omega", "LRT_Omega"),
+    ("dbnsfp.mvp.score", "MVP_score", _split),
+    ("dbnsfp.mvp.rankscore", "MVP_rankscore"),
+    ("dbnsfp.mpc.score", "MPC_score", _split),
+    ("dbnsfp.mpc.rankscore", "MPC_rankscore"),
+    ("dbnsfp.bstatistic.score", "bStatistic"),
+    ("dbnsfp.bstatistic.rankscore", "bStatistic_rankscore"),
+    ("dbnsfp.aloft.fraction_transcripts_affected", "Aloft_Fraction_transcripts_affected", _split),
+    ("dbnsfp.aloft.prob_tolerant", "Aloft_prob_Tolerant"),
+    ("dbnsfp.aloft.prob_recessive", "Aloft_prob_Recessive"),
+    ("dbnsfp.aloft.prob_dominant", "Aloft_prob_Dominant"),
+    ("dbnsfp.aloft.pred", "Aloft_pred"),
+    ("dbnsfp.aloft.confidence", "Aloft_Confidence"),
+    ("dbnsfp.primateai.score", "PrimateAI_score"),
+    ("dbnsfp.primateai.rankscore", "PrimateAI_rankscore"),
+    ("dbnsfp.primateai.pred", "PrimateAI_pred"),
+    ("dbnsfp.mutationtaster.score", "MutationTaster_score", _scores),
+    ("dbnsfp.mutationtaster.converted_rankscore", "MutationTaster_converted_rankscore"),
+    ("dbnsfp.mutationtaster.pred", "MutationTaster_pred"),
+    ("dbnsfp.mutationtaster.model", "MutationTaster_model"),
+    ("dbnsfp.mutationtaster.AAE", "MutationTaster_AAE"),
+    ("dbnsfp.mutationassessor.score", "MutationAssessor_score", _scores),
+    ("dbnsfp.mutationassessor.rankscore", "MutationAssessor_rankscore"),
+    ("dbnsfp.mutationassessor.pred", "MutationAssessor_pred"),
+    ("dbnsfp.fathmm.score", "FATHMM_score", _scores),
+    ("dbnsfp.fathmm.rankscore", "FATHMM_converted_rankscore"),
+    ("dbnsfp.fathmm.pred", "FATHMM_pred"),
+    ("dbnsfp.provean.score", "PROVEAN_score", _scores),
+    ("dbnsfp.provean.rankscore", "PROVEAN_converted_rankscore"),
+    ("dbnsfp.provean.pred", "PROVEAN_pred"),
+    ("dbnsfp.vest4.score", "VEST4_score", _scores),
+    ("dbnsfp.vest4.rankscore", "VEST4_rankscore"),
+    ("dbnsfp.deogen2.score", "DEOGEN2_score", _split),
+    ("dbnsfp.deogen2.rankscore", "DEOGEN2_rankscore"),
+    ("dbnsfp.deogen2.pred", "DEOGEN2_pred"),
+    ("dbnsfp.fathmm-mkl.coding_score", "fathmm-MKL_coding_score"),
+    ("dbnsfp.fathmm-mkl.coding_rankscore", "fathmm-MKL_coding_rankscore"),
+    ("dbnsfp.fathmm-mkl.coding_pred", "fathmm-MKL_coding_pred"),
+    ("dbnsfp.fathmm-mkl.coding_group", "fathmm-MKL_coding_group"),
+    ("dbnsfp.fathmm-xf.coding_score", "fathmm-XF_coding_score"),
+    ("dbnsfp.fathmm-xf.coding_rankscore", "fathmm-XF_coding_rankscore"),
+    ("dbnsfp.fathmm-xf.coding_pred", "fathmm-XF_coding_pred"),
+    ("dbnsfp.eigen.raw_coding", "Eigen-raw_coding"),
+    ("dbnsfp.eigen.raw_coding_rankscore", "Eigen-raw_coding_rankscore"),
+    ("dbnsfp.eigen.phred_coding", "Eigen-pred_coding"),
+    ("dbnsfp.eigen-pc.raw_coding", "Eigen-PC-raw_coding"),
+    ("dbnsfp.eigen-pc.phred_coding", "Eigen-PC-phred_coding"),
+    ("dbnsfp.eigen-pc.raw_rankscore", "Eigen-PC-raw_coding_rankscore"),
+    ("dbnsfp.genocanyon.score", "GenoCanyon_score"),
+    ("dbnsfp.genocanyon.rankscore", "GenoCanyon_rankscore"),
+    ("dbnsfp.metasvm.score", "MetaSVM_score", _scores),
+    ("dbnsfp.metasvm.rankscore", "MetaSVM_rankscore"),
+    ("dbnsfp.metasvm.pred", "MetaSVM_pred"),
+    ("dbnsfp.metalr.score", "MetaLR_score", _scores),
+    ("dbnsfp.metalr.rankscore", "MetaLR_rankscore"),
+    ("dbnsfp.metalr.pred", "MetaLR_pred"),
+    ("dbnsfp.reliability_index", "Reliability_index"),
+    ("dbnsfp.m_cap_score.score", "M-CAP_score", _scores),
+    ("dbnsfp.m_cap_score.rankscore", "M-CAP_rankscore"),
+    ("dbnsfp.m_cap_score.pred", "M-CAP_pred"),
+    ("dbnsfp.revel.score", "REVEL_score", _scores),
+    ("dbnsfp.revel.rankscore", "REVEL_rankscore"),
+    ("dbnsfp.mutpred.score", "MutPred_score"),
+    ("dbnsfp.mutpred.rankscore", "MutPred_rankscore"),
+    ("dbnsfp.mutpred.accession", "MutPred_protID"),
+    ("dbnsfp.mutpred.aa_change", "MutPred_AAchange"),
+    ("dbnsfp.mutpred.pred", "MutPred_Top5features", _mutpred),
+    ("dbnsfp.dann.score", "DANN_score"),
+    ("dbnsfp.dann.rankscore", "DANN_rankscore"),
+    ("dbnsfp.gerp++.nr", "GERP++_NR"),
+    ("dbnsfp.gerp++.rs", "GERP++_RS"),
+    ("dbnsfp.gerp++.rs_rankscore", "GERP++_RS_rankscore"),
+] + [
+    ("dbnsfp.%s.%s" % (path, key), "%s_%s" % (prefix, col))
+    for path, prefix in (("integrated", "integrated"), ("gm12878", "GM12878"),
+                         ("h1-hesc", "H1-hESC"), ("huvec", "HUVEC"))
+    for key, col in (("fitcons_score", "fitCons_score"), ("fitcons_rankscore", "fitCons_rankscore"),
+                     ("confidence_value", "confidence_value"))
+] + [
+    ("dbnsfp.phylo.p100way.vertebrate", "phyloP100way_vertebrate"),
+    ("dbnsfp.phylo.p100way.vertebrate_rankscore", "phyloP100way_vertebrate_rankscore"),
+    ("dbnsfp.phylo.p30way.mammalian", "phyloP30way_mammalian"),
+    ("dbnsfp.phylo.p30way.mammalian_rankscore", "phyloP30way_mammalian_rankscore"),
+    ("dbnsfp.phylo.p17way.primate", "phyloP17way_primate"),
+    ("dbnsfp.phylo.p17way.primate_rankscore", "phyloP17way_primate_rankscore"),
+    ("dbnsfp.phastcons.100way.vertebrate", "phastCons100way_vertebrate"),
+    ("dbnsfp.phastcons.100way.vertebrate_rankscore", "phastCons100way_vertebrate_rankscore"),
+    ("dbnsfp.phastcons.30way.mammalian", "phastCons30way_mammalian"),
+    ("dbnsfp.phastcons.30way.mammalian_rankscore", "phastCons30way_mammalian_rankscore"),
+    ("dbnsfp.phastcons.p17way.primate", "phastCons17way_primate"),
+    ("dbnsfp.phastcons.p17way.primate_rankscore", "phastCons17way_primate_rankscore"),
+    ("dbnsfp.siphy_29way.pi", "29way_pi", _siphy),
+    ("dbnsfp.siphy_29way.logodds", "29way_logOdds"),
+    ("dbnsfp.siphy_29way.logodds_rankscore", "29way_logOdds_rankscore"),
+    ("dbnsfp.1000gp3.ac", "1000Gp3_AC"),
+    ("dbnsfp.1000gp3.af", "1000Gp3_AF"),
+] + _populations("dbnsfp.1000gp3", "1000Gp3", ["AFR", "EUR", "AMR", "EAS", "SAS"], [("ac", "AC"), ("af", "AF")]) + [
+    ("dbnsfp.twinsuk.ac", "TWINSUK_AC"),
+    ("dbnsfp.twinsuk.af", "TWINSUK_AF"),
+    ("dbnsfp.alspac.ac", "ALSPAC_AC"),
+    ("dbnsfp.alspac.af", "ALSPAC_AF"),
+    ("dbnsfp.esp6500.aa_ac", "ESP6500_AA_AC"),
+    ("dbnsfp.esp6500.aa_af", "ESP6500_AA_AF"),
+    ("dbnsfp.esp6500.ea_ac", "ESP6500_EA_AC"),
+    ("dbnsfp.esp6500.ea_af", "ESP6500_EA_AF"),
+    ("dbnsfp.uk10k.ac", "UK10K_AC"),
+    ("dbnsfp.uk10k.af", "UK10K_AF"),
+] + [
+    entry for path, prefix in (("exac", "ExAC"), ("exac_nontcga", "ExAC_nonTCGA"), ("exac_nonpsych", "ExAC_nonpsych"))
+    for entry in [("dbnsfp.%s.ac" % path, "%s_AC" % prefix), ("dbnsfp.%s.af" % path, "%s_AF" % prefix)] +
+                 _populations("dbnsfp." + path, prefix, ["Adj", "AFR", "AMR", "EAS", "FIN", "NFE", "SAS"],
+                              [("ac", "AC"), ("af", "AF")])
+] + [
+    ("dbnsfp.clinvar.rs", "clinvar_rs"),
+    ("dbnsfp.clinvar.clinsig", "clinvar_clnsig", _values("/")),
+    ("dbnsfp.clinvar.trait", "clinvar_trait", _values("|")),
+    ("dbnsfp.clinvar.review", "clinvar_review", _values(",")),
+    ("dbnsfp.clinvar.hgvs", "clinvar_hgvs"),
+    ("dbnsfp.clinvar.var_source", "clinvar_var_source", _values("|")),
+    ("dbnsfp.gtex", ("GTEx_V7_gene", "GTEx_V7_tissue"), _gtex),
+    ("dbnsfp.geuvadis_eqtl_target_gene", "Geuvadis_eQTL_target_gene"),
+]
+
+GNOMAD_FIELDS = [("ac", "AC"), ("af", "AF"), ("an", "AN"), ("nhomalt", "nhomalt")]
+GNOMAD_SPEC = [
+    entry for path, prefix, flag, pops in (
+        ("gnomad_exomes", "gnomAD_exomes", True, ["AFR", "AMR", "ASJ", "EAS", "FIN", "NFE", "SAS", "POPMAX"]),
+        ("gnomad_exomes_controls", "gnomAD_exomes_controls", False, ["AFR", "AMR", "ASJ", "EAS", "FIN", "NFE", "SAS", "POPMAX"]),
+        ("gnomad_genomes", "gnomAD_genomes", True, ["AFR", "AMR", "ASJ", "EAS", "FIN", "NFE", "POPMAX"]),
+        ("gnomad_genomes_controls", "gnomAD_genomes_controls", False, ["AFR", "AMR", "ASJ", "EAS", "FIN", "NFE", "POPMAX"]))
+    for entry in (flag and [("dbnsfp.%s.flag" % path, "%s_flag" % prefix)] or []) +
+                 [("dbnsfp.%s.%s" % (path, key), "%s_%s" % (prefix, col)) for key, col in GNOMAD_FIELDS] +
+                 _populations("dbnsfp." + path, prefix, pops, GNOMAD_FIELDS)
+]
+
+
+def get_mapper(header, version, include_gnomad):
+    '''compile row => document mapper for file's header'''
+    spec = [ID_SPEC[version]] + DBNSFP_SPEC + (include_gnomad and GNOMAD_SPEC or [])
+    return DocMapper(spec).compile(header)
+
+
 # convert one snp to json
-def _map_line_to_json(df, version, include_gnomad, index=0):
-    # specific variable treatment
-    chrom = df["#chr"]
-    if chrom == 'M':
-        chrom = 'MT'
-    # fields[7] in version 2, represent hg18_pos
-    hg18_end = df["hg18_pos(1-based)"]
-    if hg18_end == ".":
-        hg18_end = "."
-    else:
-        hg18_end = int(hg18_end)
+def _map_line_to_json(row, mapper, hg19_pos):
     # in case of no hg19 position provided, remove the item
-    if df["hg19_pos(1-based)"] == '.':
+    if row[hg19_pos] == '.':
         return None
-    else:
-        chromStart = int(df["hg19_pos(1-based)"])
-        chromEnd = chromStart
-    chromStart_38 = int(df["pos(1-coor)"])
-    ref = df["ref"].upper()
-    alt = df["alt"].upper()
-    HGVS_19 = "chr%s:g.%d%s>%s" % (chrom, chromStart, ref, alt)
-    HGVS_38 = "chr%s:g.%d%s>%s" % (chrom, chromStart_38, ref, alt)
-    if version == 'hg19':
-        HGVS = HGVS_19
-    elif version == 'hg38':
-        HGVS = HGVS_38
-    siphy_29way_pi = df["29way_pi"]
-    if siphy_29way_pi == ".":
-        siphy = "."
-    else:
-        freq = siphy_29way_pi.split(":")
-        siphy = {'a': freq[0], 'c': freq[1], 'g': freq[2], 't': freq[3]}
-    gtex_gene = df["GTEx_V7_gene"].split('|')
-    gtex_tissue = df["GTEx_V7_tissue"].split('|')
-    gtex = map(dict, map(lambda t: zip(('gene', 'tissue'), t), zip(gtex_gene, gtex_tissue)))
-    acc = df["Uniprot_acc"].rstrip().rstrip(';').split(";")
-    entry = df["Uniprot_entry"].rstrip().rstrip(';').split(";")
-    uniprot = map(dict, map(lambda t: zip(('acc', 'entry'), t), zip(acc, entry)))
-    provean_score = df["PROVEAN_score"].split(';')
-    sift_score = df["SIFT_score"].split(';')
-    sift4g_score = df["SIFT4G_score"].split(';')
-    hdiv_score = df["Polyphen2_HDIV_score"].split(';')
-    hvar_score = df["Polyphen2_HVAR_score"].split(';')
-    lrt_score = df["LRT_score"].split(';')
-    m_cap_score = df["M-CAP_score"].split(';')
-    mutationtaster_score = df["MutationTaster_score"].split(';')
-    mutationassessor_score = df["MutationAssessor_score"].split(';')
-    vest3_score = df["VEST4_score"].split(';')
-    metasvm_score = df["MetaSVM_score"].split(';')
-    fathmm_score = df["FATHMM_score"].split(';')
-    metalr_score = df["MetaLR_score"].split(';')
-    revel_score = df["REVEL_score"].split(';')
-    appris = df["APPRIS"].split(";")
-    mpc_score = df["MPC_score"].split(';')
-    mvp_score = df["MVP_score"].split(';')
-    tsl = df["TSL"].split(';')
-    vep_canonical = df["VEP_canonical"].split(';')
-    deogen2_score = df["DEOGEN2_score"].split(';')
-    '''
-    parse mutpred top 5 features
-    '''
-    def modify_pvalue(pvalue):
-        return float(pvalue.strip('P = '))
-    mutpred_mechanisms = df["MutPred_Top5features"]
-    if mutpred_mechanisms not in ['.', ',', '-']:
-        mutpred_mechanisms = mutpred_mechanisms.split(" (") and mutpred_mechanisms.split(";")
-        mutpred_mechanisms = [m.rstrip(")") for m in mutpred_mechanisms]
-        mutpred_mechanisms = [i.split(" (") for i in mutpred_mechanisms]
-        mutpred_mechanisms = sum(mutpred_mechanisms, [])
-        mechanisms = [
-            {"mechanism": mutpred_mechanisms[0],
-             "p_val": modify_pvalue(mutpred_mechanisms[1])},
-            {"mechanism": mutpred_mechanisms[2],
-             "p_val": modify_pvalue(mutpred_mechanisms[3])},
-            {"mechanism": mutpred_mechanisms[4],
-             "p_val": modify_pvalue(mutpred_mechanisms[5])},
-            {"mechanism": mutpred_mechanisms[6],
-             "p_val": modify_pvalue(mutpred_mechanisms[7])},
-            {"mechanism": mutpred_mechanisms[8],
-             "p_val": modify_pvalue(mutpred_mechanisms[9])}
-        ]
-    else:
-        mechanisms = '.'
-
-    # normalize scores
-
-    def norm(arr):
-        return [None if item == '.' else item for item in arr]
-
-    provean_score = norm(provean_score)
-    sift_score = norm(sift_score)
-    hdiv_score = norm(hdiv_score)
-    hvar_score = norm(hvar_score)
-    lrt_score = norm(lrt_score)
-    m_cap_score = norm(m_cap_score)
-    mutationtaster_score = norm(mutationtaster_score)
-    mutationassessor_score = norm(mutationassessor_score)
-    vest3_score = norm(vest3_score)
-    metasvm_score = norm(metasvm_score)
-    fathmm_score = norm(fathmm_score)
-    metalr_score = norm(metalr_score)
-    revel_score = norm(revel_score)
-
-    gnomad = {"gnomad_exomes": {
-                "flag": df["gnomAD_exomes_flag"],
-                "nhomalt": df["gnomAD_exomes_nhomalt"],
-                "ac": df["gnomAD_exomes_AC"],
-                "an": df["gnomAD_exomes_AN"],
-                "af": df["gnomAD_exomes_AF"],
-                "nhomalt": df["gnomAD_exomes_nhomalt"],
-                "afr_ac": df["gnomAD_exomes_AFR_AC"],
-                "afr_af": df["gnomAD_exomes_AFR_AF"],
-                "afr_an": df["gnomAD_exomes_AFR_AN"],
-                "afr_nhomalt": df["gnomAD_exomes_AFR_nhomalt"],
-                "amr_ac": df["gnomAD_exomes_AMR_AC"],
-                "amr_an": df["gnomAD_exomes_AMR_AN"],
-                "amr_af": df["gnomAD_exomes_AMR_AF"],
-                "amr_nhomalt": df["gnomAD_exomes_AMR_nhomalt"],
-                "asj_ac": df["gnomAD_exomes_ASJ_AC"],
-                "asj_an": df["gnomAD_exomes_ASJ_AN"],
-                "asj_af": df["gnomAD_exomes_ASJ_AF"],
-                "asj_nhomalt": df["gnomAD_exomes_ASJ_nhomalt"],
-                "eas_ac": df["gnomAD_exomes_EAS_AC"],
-                "eas_af": df["gnomAD_exomes_EAS_AF"],
-                "eas_an": df["gnomAD_exomes_EAS_AN"],
-                "eas_nhomalt": df["gnomAD_exomes_EAS_nhomalt"],
-                "fin_ac": df["gnomAD_exomes_FIN_AC"],
-                "fin_af": df["gnomAD_exomes_FIN_AF"],
-                "fin_an": df["gnomAD_exomes_FIN_AN"],
-                "fin_nhomalt": df["gnomAD_exomes_FIN_nhomalt"],
-                "nfe_ac": df["gnomAD_exomes_NFE_AC"],
-                "nfe_af": df["gnomAD_exomes_NFE_AF"],
-                "nfe_an": df["gnomAD_exomes_NFE_AN"],
-                "nfe_nhomalt": df["gnomAD_exomes_NFE_nhomalt"],
-                "sas_ac": df["gnomAD_exomes_SAS_AC"],
-                "sas_af": df["gnomAD_exomes_SAS_AF"],
-                "sas_an": df["gnomAD_exomes_SAS_AN"],
-                "sas_nhomalt": df["gnomAD_exomes_SAS_nhomalt"],
-                "popmax_ac": df["gnomAD_exomes_POPMAX_AC"],
-                "popmax_af": df["gnomAD_exomes_POPMAX_AF"],
-                "popmax_an": df["gnomAD_exomes_POPMAX_AN"],
-                "popmax_nhomalt": df["gnomAD_exomes_POPMAX_nhomalt"]
-            },
-            "gnomad_exomes_controls": {
-                "nhomalt": df["gnomAD_exomes_controls_nhomalt"],
-                "ac": df["gnomAD_exomes_controls_AC"],
-                "an": df["gnomAD_exomes_controls_AN"],
-                "af": df["gnomAD_exomes_controls_AF"],
-                "nhomalt": df["gnomAD_exomes_controls_nhomalt"],
-                "afr_ac": df["gnomAD_exomes_controls_AFR_AC"],
-                "afr_af": df["gnomAD_exomes_controls_AFR_AF"],
-                "afr_an": df["gnomAD_exomes_controls_AFR_AN"],
-                "afr_nhomalt": df["gnomAD_exomes_controls_AFR_nhomalt"],
-                "amr_ac": df["gnomAD_exomes_controls_AMR_AC"],
-                "amr_an": df["gnomAD_exomes_controls_AMR_AN"],
-                "amr_af": df["gnomAD_exomes_controls_AMR_AF"],
-                "amr_nhomalt": df["gnomAD_exomes_controls_AMR_nhomalt"],
-                "asj_ac": df["gnomAD_exomes_controls_ASJ_AC"],
-                "asj_an": df["gnomAD_exomes_controls_ASJ_AN"],
-                "asj_af": df["gnomAD_exomes_controls_ASJ_AF"],
-                "asj_nhomalt": df["gnomAD_exomes_controls_ASJ_nhomalt"],
-                "eas_ac": df["gnomAD_exomes_controls_EAS_AC"],
-                "eas_af": df["gnomAD_exomes_controls_EAS_AF"],
-                "eas_an": df["gnomAD_exomes_controls_EAS_AN"],
-                "eas_nhomalt": df["gnomAD_exomes_controls_EAS_nhomalt"],
-                "fin_ac": df["gnomAD_exomes_controls_FIN_AC"],
-                "fin_af": df["gnomAD_exomes_controls_FIN_AF"],
-                "fin_an": df["gnomAD_exomes_controls_FIN_AN"],
-                "fin_nhomalt": df["gnomAD_exomes_controls_FIN_nhomalt"],
-                "nfe_ac": df["gnomAD_exomes_controls_NFE_AC"],
-                "nfe_af": df["gnomAD_exomes_controls_NFE_AF"],
-                "nfe_an": df["gnomAD_exomes_controls_NFE_AN"],
-                "nfe_nhomalt": df["gnomAD_exomes_controls_NFE_nhomalt"],
-                "sas_ac": df["gnomAD_exomes_controls_SAS_AC"],
-                "sas_af": df["gnomAD_exomes_controls_SAS_AF"],
-                "sas_an": df["gnomAD_exomes_controls_SAS_AN"],
-                "sas_nhomalt": df["gnomAD_exomes_controls_SAS_nhomalt"],
-                "popmax_ac": df["gnomAD_exomes_controls_POPMAX_AC"],
-                "popmax_af": df["gnomAD_exomes_controls_POPMAX_AF"],
-                "popmax_an": df["gnomAD_exomes_controls_POPMAX_AN"],
-                "popmax_nhomalt": df["gnomAD_exomes_controls_POPMAX_nhomalt"]
-            },
-            "gnomad_genomes": {
-                "flag": df["gnomAD_genomes_flag"],
-                "nhomalt": df["gnomAD_genomes_nhomalt"],
-                "ac": df["gnomAD_genomes_AC"],
-                "an": df["gnomAD_genomes_AN"],
-                "af": df["gnomAD_genomes_AF"],
-                "nhomalt": df["gnomAD_genomes_nhomalt"],
-                "afr_ac": df["gnomAD_genomes_AFR_AC"],
-                "afr_af": df["gnomAD_genomes_AFR_AF"],
-                "afr_an": df["gnomAD_genomes_AFR_AN"],
-                "afr_nhomalt": df["gnomAD_genomes_AFR_nhomalt"],
-                "amr_ac": df["gnomAD_genomes_AMR_AC"],
-                "amr_an": df["gnomAD_genomes_AMR_AN"],
-                "amr_af": df["gnomAD_genomes_AMR_AF"],
-                "amr_nhomalt": df["gnomAD_genomes_AMR_nhomalt"],
-                "asj_ac": df["gnomAD_genomes_ASJ_AC"],
-                "asj_an": df["gnomAD_genomes_ASJ_AN"],
-                "asj_af": df["gnomAD_genomes_ASJ_AF"],
-                "asj_nhomalt": df["gnomAD_genomes_ASJ_nhomalt"],
-                "eas_ac": df["gnomAD_genomes_EAS_AC"],
-                "eas_af": df["gnomAD_genomes_EAS_AF"],
-                "eas_an": df["gnomAD_genomes_EAS_AN"],
-                "eas_nhomalt": df["gnomAD_genomes_EAS_nhomalt"],
-                "fin_ac": df["gnomAD_genomes_FIN_AC"],
-                "fin_af": df["gnomAD_genomes_FIN_AF"],
-                "fin_an": df["gnomAD_genomes_FIN_AN"],
-                "fin_nhomalt": df["gnomAD_genomes_FIN_nhomalt"],
-                "nfe_ac": df["gnomAD_genomes_NFE_AC"],
-                "nfe_af": df["gnomAD_genomes_NFE_AF"],
-                "nfe_an": df["gnomAD_genomes_NFE_AN"],
-                "nfe_nhomalt": df["gnomAD_genomes_NFE_nhomalt"],
-                "popmax_ac": df["gnomAD_genomes_POPMAX_AC"],
-                "popmax_af": df["gnomAD_genomes_POPMAX_AF"],
-                "popmax_an": df["gnomAD_genomes_POPMAX_AN"],
-                "popmax_nhomalt": df["gnomAD_genomes_POPMAX_nhomalt"]
-            },
-            "gnomad_genomes_controls": {
-                "nhomalt": df["gnomAD_genomes_controls_nhomalt"],
-                "ac": df["gnomAD_genomes_controls_AC"],
-                "an": df["gnomAD_genomes_controls_AN"],
-                "af": df["gnomAD_genomes_controls_AF"],
-                "nhomalt": df["gnomAD_genomes_controls_nhomalt"],
-                "afr_ac": df["gnomAD_genomes_controls_AFR_AC"],
-                "afr_af": df["gnomAD_genomes_controls_AFR_AF"],
-                "afr_an": df["gnomAD_genomes_controls_AFR_AN"],
-                "afr_nhomalt": df["gnomAD_genomes_controls_AFR_nhomalt"],
-                "amr_ac": df["gnomAD_genomes_controls_AMR_AC"],
-                "amr_an": df["gnomAD_genomes_controls_AMR_AN"],
-                "amr_af": df["gnomAD_genomes_controls_AMR_AF"],
-                "amr_nhomalt": df["gnomAD_genomes_controls_AMR_nhomalt"],
-                "asj_ac": df["gnomAD_genomes_controls_ASJ_AC"],
-                "asj_an": df["gnomAD_genomes_controls_ASJ_AN"],
-                "asj_af": df["gnomAD_genomes_controls_ASJ_AF"],
-                "asj_nhomalt": df["gnomAD_genomes_controls_ASJ_nhomalt"],
-                "eas_ac": df["gnomAD_genomes_controls_EAS_AC"],
-                "eas_af": df["gnomAD_genomes_controls_EAS_AF"],
-                "eas_an": df["gnomAD_genomes_controls_EAS_AN"],
-                "eas_nhomalt": df["gnomAD_genomes_controls_EAS_nhomalt"],
-                "fin_ac": df["gnomAD_genomes_controls_FIN_AC"],
-                "fin_af": df["gnomAD_genomes_controls_FIN_AF"],
-                "fin_an": df["gnomAD_genomes_controls_FIN_AN"],
-                "fin_nhomalt": df["gnomAD_genomes_controls_FIN_nhomalt"],
-                "nfe_ac": df["gnomAD_genomes_controls_NFE_AC"],
-                "nfe_af": df["gnomAD_genomes_controls_NFE_AF"],
-                "nfe_an": df["gnomAD_genomes_controls_NFE_AN"],
-                "nfe_nhomalt": df["gnomAD_genomes_controls_NFE_nhomalt"],
-                "popmax_ac": df["gnomAD_genomes_controls_POPMAX_AC"],
-                "popmax_af": df["gnomAD_genomes_controls_POPMAX_AF"],
-                "popmax_an": df["gnomAD_genomes_controls_POPMAX_AN"],
-                "popmax_nhomalt": df["gnomAD_genomes_controls_POPMAX_nhomalt"]
-            }
-        }
-
-# load as json data
-    one_snp_json = {
-        "_id": HGVS,
-        "dbnsfp": {
-            "rsid": df["rs_dbSNP151"],
-            #"rsid_dbSNP144": fields[6],
-            "chrom": chrom,
-            "hg19": {
-                "start": chromStart,
-                "end": chromEnd
-            },
-            "hg18": {
-                "start": df["hg18_pos(1-based)"],
-                "end": hg18_end
-            },
-            "hg38": {
-                "start": df["pos(1-coor)"],
-                "end": df["pos(1-coor)"]
-            },
-            "ref": ref,
-            "alt": alt,
-            "aa": {
-                "ref": df["aaref"],
-                "alt": df["aaalt"],
-                "pos": df["aapos"],
-                "refcodon": df["refcodon"],
-                "codonpos": df["codonpos"],
-                "codon_degeneracy": df["codon_degeneracy"],
-            },
-            "genename": df["genename"],
-            "uniprot": list(uniprot),
-            "vindijia_neandertal": [i for i in df["VindijiaNeandertal"].split("/") if i != "."],
-            "interpro_domain": df["Interpro_domain"],
-            "cds_strand": df["cds_strand"],
-            "ancestral_allele": df["Ancestral_allele"],
-            "appris": appris,
-            "genecode_basic": df["GENCODE_basic"],
-            "tsl": tsl,
-            "vep_canonical": vep_canonical,
-            #"altaineandertal": fields[17],
-            #"denisova": fields[18]
-            "ensembl": {
-                "geneid": df["Ensembl_geneid"],
-                "transcriptid": df["Ensembl_transcriptid"],
-                "proteinid": df["Ensembl_proteinid"]
-            },
-            "sift": {
-                "score": sift_score,
-                "converted_rankscore": df["SIFT_converted_rankscore"],
-                "pred": df["SIFT_pred"]
-            },
-            "sift4g": {
-                "score": sift4g_score,
-                "pred": df["SIFT4G_score"],
-                "converted_rankscore": df["SIFT4G_converted_rankscore"]
-            },
-            "polyphen2": {
-                "hdiv": {
-                    "score": hdiv_score,
-                    "rankscore": df["Polyphen2_HDIV_rankscore"],
-                    "pred": df["Polyphen2_HDIV_pred"]
-                },
-                "hvar": {
-                    "score": hvar_score,
-                    "rankscore": df["Polyphen2_HVAR_rankscore"],
-                    "pred": df["Polyphen2_HVAR_pred"]
-                }
-            },
-            "lrt": {
-                "score": lrt_score,
-                "converted_rankscore": df["LRT_converted_rankscore"],
-                "pred": df["LRT_pred"],
-                "omega": df["LRT_Omega"]
-            },
-            "mvp": {
-                "score": mvp_score,
-                "rankscore": df["MVP_rankscore"]
-            },
-            "mpc": {
-                "score": mpc_score,
-                "rankscore": df["MPC_rankscore"]
-            },
-            "bstatistic": {
-                "score": df['bStatistic'],
-                "rankscore": df["bStatistic_rankscore"]
-            },
-            "aloft": {
-                "fraction_transcripts_affected": df["Aloft_Fraction_transcripts_affected"].split(';'),
-                "prob_tolerant": df["Aloft_prob_Tolerant"],
-                "prob_recessive": df["Aloft_prob_Recessive"],
-                "prob_dominant": df["Aloft_prob_Dominant"],
-                "pred": df["Aloft_pred"],
-                "confidence": df["Aloft_Confidence"],
-            },
-            "primateai": {
-                "score": df["PrimateAI_score"],
-                "rankscore": df["PrimateAI_rankscore"],
-                "pred": df["PrimateAI_pred"]
-            },
-            "mutationtaster": {
-                "score": mutationtaster_score,
-                "converted_rankscore": df["MutationTaster_converted_rankscore"],
-                "pred": df["MutationTaster_pred"],
-                "model": df["MutationTaster_model"],
-                "AAE": df["MutationTaster_AAE"]
-            },
-            "mutationassessor": {
-                "score": mutationassessor_score,
-                "rankscore": df["MutationAssessor_rankscore"],
-                "pred": df["MutationAssessor_pred"]
-            },
-            "fathmm": {
-                "score": fathmm_score,
-                "rankscore": df["FATHMM_converted_rankscore"],
-                "pred": df["FATHMM_pred"]
-            },
-            "provean": {
-                "score": provean_score,
-                "rankscore": df["PROVEAN_converted_rankscore"],
-                "pred": df["PROVEAN_pred"]
-            },
-            "vest4": {
-                "score": vest3_score,
-                "rankscore": df["VEST4_rankscore"]
-            },
-            "deogen2": {
-                "score": deogen2_score,
-                "rankscore": df["DEOGEN2_rankscore"],
-                "pred": df["DEOGEN2_pred"]
-            },
-            "fathmm-mkl": {
-                "coding_score": df["fathmm-MKL_coding_score"],
-                "coding_rankscore": df["fathmm-MKL_coding_rankscore"],
-                "coding_pred": df["fathmm-MKL_coding_pred"],
-                "coding_group": df["fathmm-MKL_coding_group"]
-            },
-            "fathmm-xf": {
-                "coding_score": df["fathmm-XF_coding_score"],
-                "coding_rankscore": df["fathmm-XF_coding_rankscore"],
-                "coding_pred": df["fathmm-XF_coding_pred"]
-            },
-            "eigen": {
-                "raw_coding": df["Eigen-raw_coding"],
-                "raw_coding_rankscore": df["Eigen-raw_coding_rankscore"],
-                "phred_coding": df["Eigen-pred_coding"]
-            },
-            "eigen-pc": {
-                "raw_coding": df["Eigen-PC-raw_coding"],
-                "phred_coding": df["Eigen-PC-phred_coding"],
-                "raw_rankscore": df["Eigen-PC-raw_coding_rankscore"]
-            },
-            "genocanyon": {
-                "score": df["GenoCanyon_score"],
-                "rankscore": df["GenoCanyon_rankscore"]
-            },
-            "metasvm": {
-                "score": metasvm_score,
-                "rankscore": df["MetaSVM_rankscore"],
-                "pred": df["MetaSVM_pred"]
-            },
-            "metalr": {
-                "score": metalr_score,
-                "rankscore": df["MetaLR_rankscore"],
-                "pred": df["MetaLR_pred"]
-            },
-            "reliability_index": df["Reliability_index"],
-            "m_cap_score": {
-                "score": m_cap_score,
-                "rankscore": df["M-CAP_rankscore"],
-                "pred": df["M-CAP_pred"]
-            },
-            "revel": {
-                "score": revel_score,
-                "rankscore": df["REVEL_rankscore"]
-            },
-            "mutpred": {
-                "score": df["MutPred_score"],
-                "rankscore": df["MutPred_rankscore"],
-                "accession": df["MutPred_protID"],
-                "aa_change": df["MutPred_AAchange"],
-                "pred": mechanisms
-            },
-            "dann": {
-                "score": df["DANN_score"],
-                "rankscore": df["DANN_rankscore"]
-            },
-            "gerp++": {
-                "nr": df["GERP++_NR"],
-                "rs": df["GERP++_RS"],
-                "rs_rankscore": df["GERP++_RS_rankscore"]
-            },
-            "integrated": {
-                "fitcons_score": df["integrated_fitCons_score"],
-                "fitcons_rankscore": df["integrated_fitCons_rankscore"],
-                "confidence_value": df["integrated_confidence_value"]
-            },
-            "gm12878": {
-                "fitcons_score": df["GM12878_fitCons_score"],
-                "fitcons_rankscore": df["GM12878_fitCons_rankscore"],
-                "confidence_value": df["GM12878_confidence_value"]
-            },
-            "h1-hesc": {
-                "fitcons_score": df["H1-hESC_fitCons_score"],
-                "fitcons_rankscore": df["H1-hESC_fitCons_rankscore"],
-                "confidence_value": df["H1-hESC_confidence_value"]
-            },
-            "huvec": {
-                "fitcons_score": df["HUVEC_fitCons_score"],
-                "fitcons_rankscore": df["HUVEC_fitCons_rankscore"],
-                "confidence_value": df["HUVEC_confidence_value"]
-            },
-            "phylo": {
-                "p100way": {
-                    "vertebrate": df["phyloP100way_vertebrate"],
-                    "vertebrate_rankscore": df["phyloP100way_vertebrate_rankscore"]
-                },
-                "p30way": {
-                    "mammalian": df["phyloP30way_mammalian"],
-                    "mammalian_rankscore": df["phyloP30way_mammalian_rankscore"]
-                },
-                "p17way": {
-                    "primate": df["phyloP17way_primate"],
-                    "primate_rankscore": df["phyloP17way_primate_rankscore"]
-                }
-            },
-            "phastcons": {
-                "100way": {
-                    "vertebrate": df["phastCons100way_vertebrate"],
-                    "vertebrate_rankscore": df["phastCons100way_vertebrate_rankscore"]
-                },
-                "30way": {
-                    "mammalian": df["phastCons30way_mammalian"],
-                    "mammalian_rankscore": df["phastCons30way_mammalian_rankscore"]
-                },
-                "p17way": {
-                    "primate": df["phastCons17way_primate"],
-                    "primate_rankscore": df["phastCons17way_primate_rankscore"]
-                }
-            },
-            "siphy_29way": {
-                "pi": siphy,
-                "logodds": df["29way_logOdds"],
-                "logodds_rankscore": df["29way_logOdds_rankscore"]
-            },
-            "1000gp3": {
-                "ac": df["1000Gp3_AC"],
-                "af": df["1000Gp3_AF"],
-                "afr_ac": df["1000Gp3_AFR_AC"],
-                "afr_af": df["1000Gp3_AFR_AF"],
-                "eur_ac": df["1000Gp3_EUR_AC"],
-                "eur_af": df["1000Gp3_EUR_AF"],
-                "amr_ac": df["1000Gp3_AMR_AC"],
-                "amr_af": df["1000Gp3_AMR_AF"],
-                "eas_ac": df["1000Gp3_EAS_AC"],
-                "eas_af": df["1000Gp3_EAS_AF"],
-                "sas_ac": df["1000Gp3_SAS_AC"],
-                "sas_af": df["1000Gp3_SAS_AF"]
-            },
-            "twinsuk": {
-                "ac": df["TWINSUK_AC"],
-                "af": df["TWINSUK_AF"]
-            },
-            "alspac": {
-                "ac": df["ALSPAC_AC"],
-                "af": df["ALSPAC_AF"]
-            },
-            "esp6500": {
-                "aa_ac": df["ESP6500_AA_AC"],
-                "aa_af": df["ESP6500_AA_AF"],
-                "ea_ac": df["ESP6500_EA_AC"],
-                "ea_af": df["ESP6500_EA_AF"]
-            },
-            "uk10k": {
-                "ac": df["UK10K_AC"],
-                "af": df["UK10K_AF"]
-            },
-            "exac": {
-                "ac": df["ExAC_AC"],
-                "af": df["ExAC_AF"],
-                "adj_ac": df["ExAC_Adj_AC"],
-                "adj_af": df["ExAC_Adj_AF"],
-                "afr_ac": df["ExAC_AFR_AC"],
-                "afr_af": df["ExAC_AFR_AF"],
-                "amr_ac": df["ExAC_AMR_AC"],
-                "amr_af": df["ExAC_AMR_AF"],
-                "eas_ac": df["ExAC_EAS_AC"],
-                "eas_af": df["ExAC_EAS_AF"],
-                "fin_ac": df["ExAC_FIN_AC"],
-                "fin_af": df["ExAC_FIN_AF"],
-                "nfe_ac": df["ExAC_NFE_AC"],
-                "nfe_af": df["ExAC_NFE_AF"],
-                "sas_ac": df["ExAC_SAS_AC"],
-                "sas_af": df["ExAC_SAS_AF"]
-            },
-            "exac_nontcga": {
-                "ac": df["ExAC_nonTCGA_AC"],
-                "af": df["ExAC_nonTCGA_AF"],
-                "adj_ac": df["ExAC_nonTCGA_Adj_AC"],
-                "adj_af": df["ExAC_nonTCGA_Adj_AF"],
-                "afr_ac": df["ExAC_nonTCGA_AFR_AC"],
-                "afr_af": df["ExAC_nonTCGA_AFR_AF"],
-                "amr_ac": df["ExAC_nonTCGA_AMR_AC"],
-                "amr_af": df["ExAC_nonTCGA_AMR_AF"],
-                "eas_ac": df["ExAC_nonTCGA_EAS_AC"],
-                "eas_af": df["ExAC_nonTCGA_EAS_AF"],
-                "fin_ac": df["ExAC_nonTCGA_FIN_AC"],
-                "fin_af": df["ExAC_nonTCGA_FIN_AF"],
-                "nfe_ac": df["ExAC_nonTCGA_NFE_AC"],
-                "nfe_af": df["ExAC_nonTCGA_NFE_AF"],
-                "sas_ac": df["ExAC_nonTCGA_SAS_AC"],
-                "sas_af": df["ExAC_nonTCGA_SAS_AF"]
-            },
-            "exac_nonpsych": {
-                "ac": df["ExAC_nonpsych_AC"],
-                "af": df["ExAC_nonpsych_AF"],
-                "adj_ac": df["ExAC_nonpsych_Adj_AC"],
-                "adj_af": df["ExAC_nonpsych_Adj_AF"],
-                "afr_ac": df["ExAC_nonpsych_AFR_AC"],
-                "afr_af": df["ExAC_nonpsych_AFR_AF"],
-                "amr_ac": df["ExAC_nonpsych_AMR_AC"],
-                "amr_af": df["ExAC_nonpsych_AMR_AF"],
-                "eas_ac": df["ExAC_nonpsych_EAS_AC"],
-                "eas_af": df["ExAC_nonpsych_EAS_AF"],
-                "fin_ac": df["ExAC_nonpsych_FIN_AC"],
-                "fin_af": df["ExAC_nonpsych_FIN_AF"],
-                "nfe_ac": df["ExAC_nonpsych_NFE_AC"],
-                "nfe_af": df["ExAC_nonpsych_NFE_AF"],
-                "sas_ac": df["ExAC_nonpsych_SAS_AC"],
-                "sas_af": df["ExAC_nonpsych_SAS_AF"]
-            },
-            "clinvar": {
-                "rs": df["clinvar_rs"],
-                "clinsig": [i for i in df["clinvar_clnsig"].split("/") if i != "."],
-                "trait": [i for i in df["clinvar_trait"].split("|") if i != "."],
-                "review": [i for i in df["clinvar_review"].split(",") if i != "."],
-                "hgvs": df["clinvar_hgvs"],
-                "var_source": [i for i in df["clinvar_var_source"].split("|") if i != "."]
-
-            },
-            "gtex": list(gtex),
-            "geuvadis_eqtl_target_gene": df["Geuvadis_eQTL_target_gene"]
-        }
-    }
-    if include_gnomad:
-        one_snp_json['dbnsfp'].update(gnomad)
-    one_snp_json = list_split(dict_sweep(unlist(value_convert_to_number(one_snp_json)), vals=[".", '-', "NA", None], remove_invalid_list=True), ";")
+    one_snp_json = normalize(mapper(row))
     one_snp_json["dbnsfp"]["chrom"] = str(one_snp_json["dbnsfp"]["chrom"])
     return one_snp_json
 
 
-# open file, parse, pass to json mapper
-def data_generator(input_file, version, include_gnomad):
+def _map_rows(input_file, versions, include_gnomad):
+    '''parse file once, yield for each row a tuple of documents, one per
+       version (or None). Documents only differ by their _id, they share the
+       same "dbnsfp" sub-document'''
     open_file = anyfile(input_file)
     db_nsfp = csv.reader(open_file, delimiter="\t")
     index = next(db_nsfp)
     assert len(index) == VALID_COLUMN_NO, "Expecting %s columns, but got %s" % (VALID_COLUMN_NO, len(index))
-    previous_row = None
+    mapper = get_mapper(index, versions[0], include_gnomad)
+    id_mappers = [DocMapper([ID_SPEC[version]]).compile(index) for version in versions[1:]]
+    hg19_pos = index.index("hg19_pos(1-based)")
+    no_docs = (None,) * len(versions)
     for row in db_nsfp:
-        df = dict(zip(index, row))
-        # use transpose matrix to have 1 row with N 187 columns
-        current_row = _map_line_to_json(df, version=version, include_gnomad=include_gnomad)
-        if previous_row and current_row:
-            if current_row["_id"] == previous_row["_id"]:
-                aa = previous_row["dbnsfp"]["aa"]
-                if not isinstance(aa, list):
-                    aa = [aa]
-                aa.append(current_row["dbnsfp"]["aa"])
-                previous_row["dbnsfp"]["aa"] = aa
-                if len(previous_row["dbnsfp"]["aa"]) > 1:
+        one_snp_json = _map_line_to_json(row, mapper, hg19_pos)
+        if one_snp_json is None:
+            yield no_docs
+        else:
+            yield (one_snp_json,) + tuple(dict(one_snp_json, **id_mapper(row)) for id_mapper in id_mappers)
+
+
+def _merge_rows(rows):
+    '''merge consecutive documents with same _id ("aa" becomes a list), rows
+       being tuples of documents (see _map_rows()), each position in tuples
+       processed independently. Yield (position, document)'''
+    previous_rows = None
+    for current_rows in rows:
+        if previous_rows is None:
+            previous_rows = [None] * len(current_rows)
+        for i, current_row in enumerate(current_rows):
+            previous_row = previous_rows[i]
+            if previous_row and current_row:
+                if current_row["_id"] == previous_row["_id"]:
+                    aa = previous_row["dbnsfp"]["aa"]
+                    if not isinstance(aa, list):
+                        # "dbnsfp" may be shared with other versions' documents
+                        previous_row["dbnsfp"] = dict(previous_row["dbnsfp"], aa=[aa])
+                    previous_row["dbnsfp"]["aa"].append(current_row["dbnsfp"]["aa"])
                     continue
-            else:
-                yield previous_row
-        previous_row = current_row
-    if previous_row:
-        yield previous_row
+                else:
+                    yield i, previous_row
+            previous_rows[i] = current_row
+    for i, previous_row in enumerate(previous_rows or []):
+        if previous_row:
+            yield i, previous_row
+
+
+# open file, parse, pass to json mapper
+def data_generator(input_file, version, include_gnomad):
+    for _, one_snp_json in _merge_rows(_map_rows(input_file, [version], include_gnomad)):
+        yield one_snp_json
 
 
 def load_data_file(input_file, version, include_gnomad=False):
@@ -647,6 +333,13 @@ def load_data_file(input_file, version, include_gnomad=False):
         yield one_snp_json
 
 
+def load_data_file_multi(input_file, versions, include_gnomad=False):
+    '''parse file once for all versions (eg. ["hg38", "hg19"]), yield
+       (version, document), documents for each version in file order'''
+    for i, one_snp_json in _merge_rows(_map_rows(input_file, versions, include_gnomad)):
+        yield versions[i], one_snp_json
+
+
 # load path and find files, pass to data_generator
 def load_data(path_glob, version='hg19', include_gnomad=False):
     for input_file in sorted(glob.glob(path_glob)):
@@ -3,11 +3,14 @@ import glob
 import asyncio
 import concurrent.futures
 import logging
+import queue
+import threading
 
-from .dbnsfp_parser import load_data_file as load_common
+from .dbnsfp_parser import load_data_file as load_common, load_data_file_multi
 import biothings.hub.dataload.uploader as uploader
 from biothings.hub.dataload.storage import IgnoreDuplicatedStorage
 from hub.dataload.uploader import SnpeffPostUpdateUploader
+from config import DBNSFP_DUAL_ASSEMBLY
 
 
 SRC_META = {
@@ -16,6 +19,12 @@ SRC_META = {
     "license_url_short": "http://bit.ly/2VLnQBz"
 }
 
+# uploader name => "dual" or "single", for dbnsfp uploaders currently running
+# their data step (in hub's event loop): dbnsfp_hg19 only skips its data step
+# when dbnsfp_hg38 is uploading it, dbnsfp_hg38 doesn't use dual-assembly mode
+# when dbnsfp_hg19 is already uploading on its own
+_loading = {}
+
 
 class DBNSFPBaseUploader(uploader.IgnoreDuplicatedSourceUploader,
                          uploader.ParallelizedSourceUploader,
@@ -1011,16 +1020,79 @@ class DBNSFPBaseUploader(uploader.IgnoreDuplicatedSourceUploader,
 
         return mapping
 
+    # see DBNSFPHG38Uploader
+    DUAL_ASSEMBLY = DBNSFP_DUAL_ASSEMBLY
+    # temp collection receiving other assembly's docs, in dual-assembly mode
+    dual_collection_name = None
+    # number of documents for other assembly buffered before being stored,
+    # and number of such batches waiting for writer thread
+    DUAL_BATCH_SIZE = 10000
+    DUAL_QUEUE_SIZE = 2
+
+    def get_steps(self, steps):
+        return steps.split(",") if isinstance(steps, str) else list(steps)
+
     def jobs(self):
         # tuple(input_file,version), where version is either hg38 or hg19)
-        return map(lambda e: (e, self.__class__.__metadata__["assembly"]),
+        # and, in dual-assembly mode, collection for other assembly's docs
+        extra = self.dual_collection_name and (self.dual_collection_name,) or ()
+        return map(lambda e: (e, self.__class__.__metadata__["assembly"]) + extra,
                    glob.glob(os.path.join(self.data_folder, self.__class__.GLOB_PATTERN)))
 
-    def load_data(self, input_file, hg):
-        return load_common(input_file, version=hg)
+    def load_data(self, input_file, hg, dual_collection_name=None):
+        if dual_collection_name is None:
+            return load_common(input_file, version=hg)
+        return self.load_data_dual(input_file, hg, dual_collection_name)
+
+    def load_data_dual(self, input_file, hg, dual_collection_name):
+        '''parse input_file once, return documents for assembly hg while
+           documents for the other one are stored in dual_collection_name by
+           a writer thread, so parsing isn't stalled by these writes'''
+        other = hg == "hg38" and "hg19" or "hg38"
+        storage = self.__class__.storage_class(None, dual_collection_name, logging)
+        batches = queue.Queue(maxsize=self.__class__.DUAL_QUEUE_SIZE)
+        errors = []
+
+        def write():
+            try:
+                # storage needs a generator to store by batches
+                storage.process((doc for docs in iter(batches.get, None) for doc in docs),
+                                self.__class__.DUAL_BATCH_SIZE)
+            except Exception as e:
+                errors.append(e)
+                # keep consuming, parsing must not block on a full queue
+                while batches.get() is not None:
+                    pass
+
+        writer = threading.Thread(target=write, daemon=True)
+        writer.start()
+        docs = []
+        try:
+            for version, doc in load_data_file_multi(input_file, [hg, other]):
+                if version == hg:
+                    yield doc
+                else:
+                    docs.append(doc)
+                    if len(docs) >= self.__class__.DUAL_BATCH_SIZE:
+                        if errors:
+                            raise errors[0]
+                        batches.put(docs)
+                        docs = []
+            if docs:
+                batches.put(docs)
+        finally:
+            batches.put(None)
+            writer.join()
+        if errors:
+            raise errors[0]
 
 
 class DBNSFPHG38Uploader(DBNSFPBaseUploader):
+    '''In dual-assembly mode, both hg38 and hg19 documents are built from
+    one parsing of the files: dbnsfp_hg19 documents are stored in a temp
+    collection of its own, switched once all files are parsed. Remaining
+    steps (post, master, clean) of both uploaders then run concurrently, so
+    each keeps its own status and master document'''
 
     name = "dbnsfp_hg38"
     main_source = "dbnsfp"
@@ -1029,6 +1101,39 @@ class DBNSFPHG38Uploader(DBNSFPBaseUploader):
             "src_meta" : SRC_META
             }
 
+    @asyncio.coroutine
+    def load(self, steps=["data", "post", "master", "clean"], force=False, batch_size=10000,
+             job_manager=None, **kwargs):
+        steps = self.get_steps(steps)
+        if not (self.__class__.DUAL_ASSEMBLY and "data" in steps) or DBNSFPHG19Uploader.name in _loading:
+            res = yield from super(DBNSFPHG38Uploader, self).load(steps, force, batch_size, job_manager, **kwargs)
+            return res
+        hg19 = DBNSFPHG19Uploader.create(db_conn_info=self.db_conn_info, log_folder=self.log_folder)
+        hg19.prepare()
+        self.dual_collection_name = hg19.make_temp_collection()
+        self.logger.info("Dual-assembly mode, also uploading '%s' (temp collection: %s)" % \
+                (hg19.name, self.dual_collection_name))
+        _loading[self.name] = "dual"
+        try:
+            hg19.register_status("uploading")
+            try:
+                res = yield from super(DBNSFPHG38Uploader, self).load(["data"], force, batch_size, job_manager, **kwargs)
+            except Exception as e:
+                hg19.register_status("failed", err=str(e))
+                raise
+            # hg19 docs are all there, switch before any other step can fail
+            hg19.switch_collection()
+        finally:
+            self.dual_collection_name = None
+            _loading.pop(self.name)
+        # remaining steps (snpeff in post) of both uploaders run concurrently,
+        # hg19 one also registers its final status
+        steps = [step for step in steps if step != "data"]
+        res, _ = yield from asyncio.gather(
+                super(DBNSFPHG38Uploader, self).load(steps, force, batch_size, job_manager, **kwargs),
+                hg19.load(steps, force, batch_size, job_manager, **kwargs))
+        return res
+
 
 class DBNSFPHG19Uploader(DBNSFPBaseUploader):
 
@@ -1038,3 +1143,22 @@ class DBNSFPHG19Uploader(DBNSFPBaseUploader):
             "assembly": "hg19",
             "src_meta" : SRC_META
             }
+
+    @asyncio.coroutine
+    def load(self, steps=["data", "post", "master", "clean"], force=False, batch_size=10000,
+             job_manager=None, **kwargs):
+        steps = self.get_steps(steps)
+        if "data" not in steps:
+            res = yield from super(DBNSFPHG19Uploader, self).load(steps, force, batch_size, job_manager, **kwargs)
+            return res
+        if _loading.get(DBNSFPHG38Uploader.name) == "dual":
+            # data, and then other steps, are handled by running dbnsfp_hg38 uploader
+            self.logger.info("Dual-assembly mode, '%s' is uploaded along with '%s'" % \
+                    (self.name, DBNSFPHG38Uploader.name))
+            return
+        _loading[self.name] = "single"
+        try:
+            res = yield from super(DBNSFPHG19Uploader, self).load(steps, force, batch_size, job_manager, **kwargs)
+        finally:
+            _loading.pop(self.name)
+        return res
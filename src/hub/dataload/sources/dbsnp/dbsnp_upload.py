@@ -4,6 +4,8 @@ from .dbsnp_dump import main as download
 from .dbsnp_vcf_parser import load_data
 import biothings.hub.dataload.uploader as uploader
 from hub.dataload.uploader import SnpeffPostUpdateUploader
+from utils.rsid_index import build_rsid_index_from_collection
+from config import RSID_INDEX_PATH
 
 
 SRC_META = {
@@ -26,13 +28,18 @@ class DBSNPBaseUploader(uploader.IgnoreDuplicatedSourceUploader,
 
     def load_data(self,input_file,chrom):
         self.logger.info("Load data from '%s' for chr %s" % (input_file,chrom))
-        return load_data(self.__class__.__metadata__["assembly"],input_file,chrom)
+        return load_data(self.__class__.__metadata__["assembly"],input_file,chrom,
+                         genome=self.get_genome_store())
 
     def post_update_data(self, *args, **kwargs):
         super(DBSNPBaseUploader,self).post_update_data(*args,**kwargs)
         self.logger.info("Indexing 'rsid'")
         # background=true or it'll lock the whole database...
         self.collection.create_index("dbsnp.rsid",background=True)
+        folder = os.path.join(RSID_INDEX_PATH, self.name)
+        self.logger.info("Building rsID index in '%s'" % folder)
+        index = build_rsid_index_from_collection(folder, self.collection)
+        self.logger.info("rsID index built: %s" % index)
 
     @classmethod
     def get_mapping(klass):
@@ -1,7 +1,7 @@
 '''
 Parsing dbSNP VCF file into variant document
 
-requires pyVCF module
+uses hub.dataload.vcf_reader (PyVCF compatible records)
 
 Chunlei Wu
 '''
@@ -10,14 +10,34 @@ import copy, os
 import time
 import glob
 
-from vcf import Reader
+from hub.dataload.vcf_reader import VCFReader
+from utils.hgvs import get_hgvs_from_vcf_many
+from utils.genome import GenomeStore
 
 from biothings.utils.common import timesofar
 from config import logger as logging
 
 
-def get_hgvs_name(record, as_list=False):
-    """construct the valid HGVS name as the _id field"""
+# INFO flags kept in documents
+FLAGS_INCLUDED = [
+    # reverse
+    'RV',
+    # functional
+    'PM', 'TPA', 'PMC', 'S3D', 'SLO', 'NSF', 'NSM', 'NSN', 'REF', 'SYN',
+    'U3', 'U5', 'ASS', 'DSS', 'INT', 'R3', 'R5', 'MUT', 'CDA', 'MTP', 'OM'
+    # mapping:
+    'OTH', 'CFL', 'ASP', 'LSD', 'NOC', 'WTD', 'NOV',
+    # freqs:
+    'G5A', 'G5', 'HD', 'GNO', 'KGPhase1', 'KGPhase3'
+]
+# INFO keys used by parse_one_rec()/get_hgvs_name()
+INFO_KEYS = set(FLAGS_INCLUDED + ['RSPOS', 'dbSNPBuildID', 'GENEINFO', 'SAO', 'VC', 'VLD', 'CAF'])
+
+
+def get_hgvs_name(record, as_list=False, genome=None):
+    """construct the valid HGVS name as the _id field. If genome (a
+       utils.genome.GenomeStore) is given, indels _id are normalized against
+       it (positions are kept as reported by dbSNP)"""
     _id_list = []
     _alt_list = []
     _pos_list = []
@@ -78,6 +98,8 @@ def get_hgvs_name(record, as_list=False):
                     # other cases of insertion currently been ignored
                     # e.g. rs398121698, rs71320640
                     pass
+        if _id and genome is not None and not record.is_snp:
+            _id = get_hgvs_from_vcf_many(chrom, record.POS, record.REF, [alt], genome=genome)[0]
         if _id:
             _id_list.append(_id)
 
@@ -89,7 +111,7 @@ def get_hgvs_name(record, as_list=False):
     return _id_list, _alt_list, _pos_list
 
 
-def parse_one_rec(assembly, record):
+def parse_one_rec(assembly, record, genome=None):
     snp = OrderedDict()
     snp['rsid'] = record.ID
     snp['vartype'] = record.var_type
@@ -114,18 +136,7 @@ def parse_one_rec(assembly, record):
         snp['class'] = info['VC']
     snp['validated'] = info.get('VLD', None) is True
     # flags
-    flags_included = [
-        # reverse
-        'RV',
-        # functional
-        'PM', 'TPA', 'PMC', 'S3D', 'SLO', 'NSF', 'NSM', 'NSN', 'REF', 'SYN',
-        'U3', 'U5', 'ASS', 'DSS', 'INT', 'R3', 'R5', 'MUT', 'CDA', 'MTP', 'OM'
-        # mapping:
-        'OTH', 'CFL', 'ASP', 'LSD', 'NOC', 'WTD', 'NOV',
-        # freqs:
-        'G5A', 'G5', 'HD', 'GNO', 'KGPhase1', 'KGPhase3'
-    ]
-    flags = [f for f in flags_included if info.get(f, False)]
+    flags = [f for f in FLAGS_INCLUDED if info.get(f, False)]
     if flags:
         snp['flags'] = sorted(flags)
 
@@ -148,7 +159,7 @@ def parse_one_rec(assembly, record):
 
     snp['chrom'] = record.CHROM
     snp['ref'] = record.REF
-    _id_list, _alt_list, _pos_list = get_hgvs_name(record)
+    _id_list, _alt_list, _pos_list = get_hgvs_name(record, genome=genome)
     snp['alt'] = _alt_list
     snp[assembly] = _pos_list
     snp['_id'] = _id_list
@@ -156,16 +167,15 @@ def parse_one_rec(assembly, record):
     return snp
 
 
-def parse_vcf(assembly, vcf_infile, compressed=True, verbose=True, by_id=True, **tabix_params):
+def parse_vcf(assembly, vcf_infile, compressed=True, verbose=True, by_id=True, genome=None, **tabix_params):
     t0 = time.time()
     compressed == vcf_infile.endswith('.gz')
-    vcf_r = Reader(filename=vcf_infile, compressed=compressed)
-    vcf_r.fetch('1', 1)   # call a dummy fetch to initialize vcf_r._tabix
+    vcf_r = VCFReader(filename=vcf_infile, compressed=compressed, info_keys=INFO_KEYS)
     if tabix_params:
-        vcf_r.reader = vcf_r._tabix.fetch(**tabix_params)
+        vcf_r.fetch(**tabix_params)
     cnt_1, cnt_2, cnt_3 = 0, 0, 0
     for rec in vcf_r:
-        doc = parse_one_rec(assembly, rec)
+        doc = parse_one_rec(assembly, rec, genome=genome)
         if by_id:
             # one hgvs id, one doc
             if doc['_id']:
@@ -201,12 +211,14 @@ def parse_vcf(assembly, vcf_infile, compressed=True, verbose=True, by_id=True, *
     logging.info("Total rs: {}; total docs: {}; skipped rs: {}".format(cnt_1, cnt_2, cnt_3))
 
 
-def load_data(assembly, input_file,chrom):
+def load_data(assembly, input_file, chrom, genome=None):
     import logging as loggingmod
     global logging
     logging = loggingmod.getLogger("dbsnp_upload")
     logging.info("Processing chr{}...".format(chrom))
-    snpdoc_iter = parse_vcf(assembly, input_file, compressed=True, verbose=False, by_id=True, reference=chrom)
+    genome = genome and GenomeStore(genome)
+    snpdoc_iter = parse_vcf(assembly, input_file, compressed=True, verbose=False, by_id=True,
+                            genome=genome, reference=chrom)
     for doc in snpdoc_iter:
         _doc = {'dbsnp': doc}
         _doc['_id'] = doc['_id']
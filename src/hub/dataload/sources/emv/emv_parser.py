@@ -3,7 +3,8 @@ import re
 import csv
 from itertools import groupby
 
-from biothings.utils.dataload import dict_sweep, value_convert_to_number, unlist, merge_duplicate_rows
+from biothings.utils.dataload import merge_duplicate_rows
+from utils.normalize import DocNormalizer
 
 #  merge EMV file with genomic ID file
 # def file_merge(emv_file, id_file):
@@ -11,6 +12,8 @@ from biothings.utils.dataload import dict_sweep, value_convert_to_number, unlist
 #    os.system("paste -d"," genomic_id3.txt EmVClass.2014-3.csv > emv.csv")
 
 VALID_COLUMN_NO = 11
+# sweep before unlisting, so lists left with one value are unlisted
+normalize = DocNormalizer(sweep=[""], sweep_before_unlist=True)
 
 
 # convert one snp to json
@@ -40,7 +43,7 @@ def _map_line_to_json(fields):
         }
     }
 
-    return unlist(dict_sweep(value_convert_to_number(one_snp_json), vals=[""]))
+    return normalize(one_snp_json)
 
 
 # open file, parse, pass to json mapper
@@ -4,13 +4,15 @@ import os
 from itertools import islice, groupby
 from functools import partial
 
-from biothings.utils.dataload import dict_sweep, value_convert_to_number,\
-                                     merge_duplicate_rows
+from biothings.utils.dataload import merge_duplicate_rows
 
 from utils.hgvs import get_hgvs_from_vcf
 from utils.hgvs import get_pos_start_end
+from utils.normalize import DocNormalizer
+from utils.docmapper import DocMapper
 
 VALID_COLUMN_NO = 31
+normalize = DocNormalizer(unlist=False, sweep=["NA", "none", "unknown"])
 
 
 def polyphen(field):
@@ -33,22 +35,65 @@ def get_dbsnp(field):
         return "none"
 
 
+def _position(chr_info, mutation, hg38):
+    '''chrom, hg19 and hg38 start/end, ref and alt, from grch37 position,
+       mutation and grch38 position columns, each parsed once'''
+    chrom, pos = chr_info.split(":")[:2]
+    ref, alt = mutation.split(">")[:2]
+    hg19 = get_pos_start_end(chrom, int(pos), ref, alt)
+    hg38 = get_pos_start_end(chrom, int(hg38.split(":")[1]), ref, alt)
+    return (chrom, {"start": hg19[0], "end": hg19[1]},
+            {"start": hg38[0], "end": hg38[1]}, ref, alt)
+
+
+# column position => document field
+EVS_SPEC = [
+    (("chrom", "hg19", "hg38", "ref", "alt"), (0, 3, 30), _position),
+    ("rsid", 1),
+    ("dbsnp_version", 2, get_dbsnp),
+    ("allele_count.european_american", 4, count_dict),
+    ("allele_count.african_american", 5, count_dict),
+    ("allele_count.all", 6, count_dict),
+    ("ma_fin_percent.european_american", 7, lambda val: val.split("/")[0]),
+    ("ma_fin_percent.african_american", 7, lambda val: val.split("/")[1]),
+    ("ma_fin_percent.all", 7, lambda val: val.split("/")[2]),
+    ("genotype_count.european_american", 8, count_dict),
+    ("genotype_count.african_american", 9, count_dict),
+    ("genotype_count.all_genotype", 10, count_dict),
+    ("avg_sample_read", 11),
+    ("gene.symbol", 12),
+    ("gene.accession", 13),
+    ("function_gvs", 14),
+    ("hgvs.coding", 16),
+    ("hgvs.protein", 15),
+    ("coding_dna_size", 17),
+    ("conservation.phast_cons", 18),
+    ("conservation.gerp", 19),
+    ("grantham_score", 20),
+    ("polyphen2.class", 21, lambda val: polyphen(val)[0]),
+    ("polyphen2.score", 21, lambda val: polyphen(val)[1]),
+    ("ref_base_ncbi", 22),
+    ("chimp_allele", 23),
+    ("clinical_info", 24),
+    ("filter_status", 25),
+    ("on_illumina_human_exome_chip", 26),
+    ("gwas_pubmed_info", 27),
+    ("estimated_age_kyrs.ea", 28),
+    ("estimated_age_kyrs.aa", 29),
+]
+map_evs = DocMapper(EVS_SPEC).compile()
+
+
 # convert one snp to json
 def _map_line_to_json(fields, version):
-    chrInfo = fields[0].split(":")  # grch37
-    chrom = chrInfo[0]
-    chromStart = int(chrInfo[1])
-    ma_fin_percent = fields[7].split("/")
+    evs = map_evs(fields)
+    chrom, ref, alt = evs["chrom"], evs["ref"], evs["alt"]
     if fields[3]:
-        mutation = fields[3].split(">")
-        ref = mutation[0]
-        alt = mutation[1]
-        hg19 = get_pos_start_end(chrom, chromStart, ref, alt)
-        hg38 = get_pos_start_end(chrom, int(fields[30].split(":")[1]), ref, alt)
         if version == 'hg19':
-            HGVS = get_hgvs_from_vcf(chrom, chromStart, ref, alt)
+            # grch37 position
+            HGVS = get_hgvs_from_vcf(chrom, int(fields[0].split(":")[1]), ref, alt)
         elif version == 'hg38':
-            HGVS = get_hgvs_from_vcf(chrom, hg38[0], ref, alt)
+            HGVS = get_hgvs_from_vcf(chrom, evs["hg38"]["start"], ref, alt)
 
     # load as json data
     if HGVS is None:
@@ -56,79 +101,9 @@ def _map_line_to_json(fields, version):
 
     one_snp_json = {
         "_id": HGVS,
-        "evs":
-            {
-                "chrom": str(chrom),
-                "hg19":
-                    {
-                        "start": hg19[0],
-                        "end": hg19[1]
-                    },
-                "hg38":
-                    {
-                        "start": hg38[0],
-                        "end": hg38[1]
-                    },
-                "rsid": fields[1],
-                "dbsnp_version": get_dbsnp(fields[2]),
-                "ref": ref,
-                "alt": alt,
-                "allele_count":
-                    {
-                        "european_american": count_dict(fields[4]),
-                        "african_american": count_dict(fields[5]),
-                        "all": count_dict(fields[6])
-                    },
-                "ma_fin_percent":
-                    {
-                        "european_american": ma_fin_percent[0],
-                        "african_american": ma_fin_percent[1],
-                        "all": ma_fin_percent[2]
-                    },
-                "genotype_count":
-                    {
-                        "european_american": count_dict(fields[8]),
-                        "african_american": count_dict(fields[9]),
-                        "all_genotype": count_dict(fields[10])
-                    },
-                "avg_sample_read": fields[11],
-                "gene":
-                    {
-                        "symbol": fields[12],
-                        "accession": fields[13]
-                    },
-                "function_gvs": fields[14],
-                "hgvs":
-                    {
-                        "coding": fields[16],
-                        "protein": fields[15]
-                    },
-                "coding_dna_size": fields[17],
-                "conservation":
-                    {
-                        "phast_cons": fields[18],
-                        "gerp": fields[19]
-                    },
-                "grantham_score": fields[20],
-                "polyphen2":
-                    {
-                        "class": polyphen(fields[21])[0],
-                        "score": polyphen(fields[21])[1]
-                    },
-                "ref_base_ncbi": fields[22],
-                "chimp_allele": fields[23],
-                "clinical_info": fields[24],
-                "filter_status": fields[25],
-                "on_illumina_human_exome_chip": fields[26],
-                "gwas_pubmed_info": fields[27],
-                "estimated_age_kyrs":
-                    {
-                        "ea": fields[28],
-                        "aa": fields[29]
-                    }
-            }
+        "evs": evs
         }
-    return dict_sweep(value_convert_to_number(one_snp_json), vals=["NA", "none", "unknown"])
+    return normalize(one_snp_json)
 
 
 # open file, parse, pass to json mapper
@@ -1,10 +1,19 @@
-import vcf
+from utils.hgvs import get_hgvs_from_vcf_many
+from utils.genome import GenomeStore
+from utils.normalize import DocNormalizer
+from hub.dataload.vcf_reader import VCFReader
 
-from biothings.utils.dataload import dict_sweep, unlist, value_convert_to_number
-from utils.hgvs import get_hgvs_from_vcf
 
+EXAC_POPULATIONS = ['AFR', 'AMR', 'EAS', 'FIN', 'NFE', 'OTH', 'SAS']
+# INFO keys used by _map_line_to_json()
+INFO_KEYS = set(['AC', 'AF', 'AN', 'FS', 'MQ', 'MQ0', 'NCC', 'QD', 'VQSLOD', 'culprit',
+                 'BaseQRankSum', 'ClippingRankSum', 'MQRankSum', 'ReadPosRankSum', 'InbreedingCoeff',
+                 'AC_Adj', 'AC_Het', 'AC_Hom', 'AC_MALE', 'AC_FEMALE', 'AN_Adj', 'AN_MALE', 'AN_FEMALE'] +
+                ['%s_%s' % (key, pop) for key in ('AC', 'AN', 'Het', 'Hom') for pop in EXAC_POPULATIONS])
+normalize = DocNormalizer(sweep=[None])
 
-def _map_line_to_json(doc_key, item):
+
+def _map_line_to_json(doc_key, item, genome=None):
     chrom = item.CHROM
     chromStart = item.POS
     ref = item.REF
@@ -37,11 +46,10 @@ def _map_line_to_json(doc_key, item):
     # convert vcf object to string
     item.ALT = [str(alt) for alt in item.ALT]
     # if multiallelic, put all variants as a list in multi-allelic field
-    hgvs_list = None
-    if len(item.ALT) > 1:
-        hgvs_list = [get_hgvs_from_vcf(chrom, chromStart, ref, alt, mutant_type=False) for alt in item.ALT]
+    hgvs_ids, var_types = get_hgvs_from_vcf_many(chrom, chromStart, ref, item.ALT, mutant_type=True, genome=genome)
+    hgvs_list = hgvs_ids if len(item.ALT) > 1 else None
     for i, alt in enumerate(item.ALT):
-        (HGVS, var_type) = get_hgvs_from_vcf(chrom, chromStart, ref, alt, mutant_type=True)
+        HGVS, var_type = hgvs_ids[i], var_types[i]
         if HGVS is None:
             return
         assert len(item.ALT) == len(info['AC']), "Expecting length of item.ALT= length of info.AC, but not for %s" % (HGVS)
@@ -122,12 +130,12 @@ def _map_line_to_json(doc_key, item):
                 "culprit": info['culprit']
             }
         }
-        obj = (dict_sweep(unlist(value_convert_to_number(one_snp_json)), [None]))
-        yield obj
+        yield normalize(one_snp_json)
 
 
-def load_data(doc_key,input_file):
-    vcf_reader = vcf.Reader(open(input_file, 'r'))
+def load_data(doc_key,input_file,genome=None):
+    genome = genome and GenomeStore(genome)
+    vcf_reader = VCFReader(open(input_file, 'r'), info_keys=INFO_KEYS)
     for record in vcf_reader:
-        for record_mapped in _map_line_to_json(doc_key,record):
+        for record_mapped in _map_line_to_json(doc_key,record,genome=genome):
             yield record_mapped
@@ -29,7 +29,7 @@ class ExacUploader(ExacBaseUploader):
             raise uploader.ResourceError("Expecting one single vcf file, got: %s" % repr(content))
         input_file = content.pop()
         self.logger.info("Load data from file '%s'" % input_file)
-        return load_data(self.__class__.name, input_file)
+        return load_data(self.__class__.name, input_file, genome=self.get_genome_store())
 
     @classmethod
     def get_mapping(klass):
@@ -1,16 +1,19 @@
-import vcf
-from biothings.utils.dataload import dict_sweep, unlist, value_convert_to_number
-from utils.hgvs import get_hgvs_from_vcf
+from utils.hgvs import get_hgvs_from_vcf_many
+from utils.genome import GenomeStore
+from utils.normalize import DocNormalizer
+from hub.dataload.vcf_reader import VCFReader
 
-def _map_line_to_json(item):
+normalize = DocNormalizer(sweep=[None])
+
+def _map_line_to_json(item, genome=None):
     chrom = item.CHROM
     chromStart = item.POS
     ref = item.REF
     info = item.INFO
     hpo_count=item.INFO['HPO_CT']
-    for alt in item.ALT:
-        alt = str(alt)
-        (HGVS, var_type) = get_hgvs_from_vcf(chrom, chromStart, ref, alt, mutant_type=True)
+    alts = [str(alt) for alt in item.ALT]
+    hgvs_ids, var_types = get_hgvs_from_vcf_many(chrom, chromStart, ref, alts, mutant_type=True, genome=genome)
+    for HGVS, var_type in zip(hgvs_ids, var_types):
         if HGVS is None:
             return
         one_snp_json = {
@@ -20,13 +23,13 @@ def _map_line_to_json(item):
 
             }
         }
-        obj = (dict_sweep(unlist(value_convert_to_number(one_snp_json)), [None]))
-        yield obj
+        yield normalize(one_snp_json)
 
 
-def load_data(input_file):
-    vcf_reader = vcf.Reader(open(input_file, 'r'))
+def load_data(input_file, genome=None):
+    genome = genome and GenomeStore(genome)
+    vcf_reader = VCFReader(open(input_file, 'r'), info_keys=['HPO_CT'])
     for record in vcf_reader:
 #        print(record)
-        for record_mapped in _map_line_to_json(record):
+        for record_mapped in _map_line_to_json(record, genome=genome):
             yield record_mapped
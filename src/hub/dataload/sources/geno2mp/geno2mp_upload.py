@@ -26,7 +26,7 @@ class Geno2MPUploader(SnpeffPostUpdateUploader):
             raise uploader.ResourceError("Expecting only one VCF file, got: %s" % input_file)
         input_file = input_file.pop()
         self.logger.info("Load data from file '%s'" % input_file)
-        return load_data(input_file)
+        return load_data(input_file, genome=self.get_genome_store())
 
 
     @classmethod
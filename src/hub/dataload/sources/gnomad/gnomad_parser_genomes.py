@@ -1,14 +1,22 @@
-import vcf
 import glob
 import math
 
-from biothings.utils.dataload import dict_sweep, unlist, value_convert_to_number
-from utils.hgvs import get_hgvs_from_vcf
+from utils.hgvs import get_hgvs_from_vcf_many
+from utils.genome import GenomeStore
+from utils.normalize import DocNormalizer
+from hub.dataload.vcf_reader import VCFReader, InfoRouter
 
+# INFO keys with these prefixes are stored in sub-documents (eg. AC_afr => ac.ac_afr),
+# per-allele ones being indexed by allele (see InfoRouter)
+KEY_PREFIXES = ["AC", "AF", "AN", "Hom", "GC", "Hemi"]
+PER_ALLELE_PREFIXES = ["AC", "AF", "Hom", "Hemi"]
+# INFO keys used by _map_line_to_json(), besides keys selected by prefix
+INFO_KEYS = ['VQSLOD', 'VQSR_culprit', 'BaseQRankSum', 'ClippingRankSum', 'MQRankSum',
+             'ReadPosRankSum', 'QD', 'InbreedingCoeff', 'AC', 'AF', 'FS', 'MQ']
+normalize = DocNormalizer(skipped_keys=['chrom'], sweep=[None])
 CHROM_VALID_VALUES = [str(_chr) for _chr in list(range(1, 23)) + ['X', 'Y', 'MT']]
 
-def _map_line_to_json(item, keys):
-    key_start = ["AC", "AF", "AN", "Hom", "GC", "Hemi"]
+def _map_line_to_json(item, router, genome=None):
     chrom = str(item.CHROM)
     if chrom not in CHROM_VALID_VALUES:
         return
@@ -31,11 +39,12 @@ def _map_line_to_json(item, keys):
     # convert vcf object to string
     item.ALT = [str(alt) for alt in item.ALT]
     # if multiallelic, put all variants as a list in multi-allelic field
-    hgvs_list = None
-    if len(item.ALT) > 1:
-        hgvs_list = [get_hgvs_from_vcf(chrom, chromStart, ref, alt, mutant_type=False) for alt in item.ALT]
+    hgvs_ids, var_types = get_hgvs_from_vcf_many(chrom, chromStart, ref, item.ALT, mutant_type=True, genome=genome)
+    hgvs_list = hgvs_ids if len(item.ALT) > 1 else None
+    # prefixed INFO keys' values, per allele
+    routed = router(info, len(item.ALT))
     for i, alt in enumerate(item.ALT):
-        (HGVS, var_type) = get_hgvs_from_vcf(chrom, chromStart, ref, alt, mutant_type=True)
+        HGVS, var_type = hgvs_ids[i], var_types[i]
         if HGVS is None:
             return
         assert len(item.ALT) == len(info['AC']), "Expecting length of item.ALT= length of info.AC, but not for %s" % (HGVS)
@@ -66,27 +75,16 @@ def _map_line_to_json(item, keys):
                 "vqsr_culprit": vqsr_culprit
             }
         }
-        # create a holder in one_snp_json for each _start, e.g. 'ac', 'af', 'gc'
-        for _start in key_start:
-            one_snp_json['gnomad_genome'][_start.lower()] = {}
-        # loop through each available key
-        for _key in keys:
-            if _key in info:
-                # loop through each prefix
-                for _start in key_start:
-                    # "ac", "af" value is related to multi-allelic, need to deal with separately
-                    if _key.startswith(_start) and _start in ['AC', 'AF', 'Hom', 'Hemi']:
-                        one_snp_json['gnomad_genome'][_start.lower()][_key.lower()] = info[_key][i]
-                    elif _key.startswith(_start) and _start not in ['AC', 'AF', 'Hom', 'Hemi']:
-                        one_snp_json['gnomad_genome'][_start.lower()][_key.lower()] = info[_key]
-        obj = (dict_sweep(unlist(value_convert_to_number(one_snp_json, skipped_keys=['chrom'])), [None]))
-        yield obj
+        one_snp_json['gnomad_genome'].update(routed[i])
+        yield normalize(one_snp_json)
 
-def load_data(input_file):
-    vcf_reader = vcf.Reader(filename=input_file)
-    keys = vcf_reader.infos.keys()
-    keys = [_key for _key in keys if _key.startswith(("AC", "AF", "AN", "Hom", "GC", "Hemi"))]
+def load_data(input_file, genome=None):
+    genome = genome and GenomeStore(genome)
+    vcf_reader = VCFReader(filename=input_file)
+    router = InfoRouter(vcf_reader.infos, KEY_PREFIXES, PER_ALLELE_PREFIXES)
+    # only decode INFO keys used by _map_line_to_json()
+    vcf_reader.info_keys = router.keys | set(INFO_KEYS)
     for record in vcf_reader:
-        for record_mapped in _map_line_to_json(record, keys):
+        for record_mapped in _map_line_to_json(record, router, genome=genome):
             yield record_mapped
 
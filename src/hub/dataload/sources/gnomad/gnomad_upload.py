@@ -45,7 +45,7 @@ class GnomadExomesBaseUploader(GnomadBaseUploader):
         input_file = files.pop()
         assert os.path.exists("%s%s" % (input_file,self.__class__.tbi_suffix)), "%s%s" % (input_file,self.__class__.tbi_suffix)
         self.logger.info("Load data from file '%s'" % input_file)
-        res = load_data_exomes(input_file)
+        res = load_data_exomes(input_file, genome=self.get_genome_store())
         return res
 
     @classmethod
@@ -77,7 +77,7 @@ class GnomadGenomesBaseUploader(GnomadBaseUploader, uploader.ParallelizedSourceU
 
     def load_data(self, input_file):
         self.logger.info("Load data from file '%s'" % input_file)
-        res = load_data_genomes(input_file)
+        res = load_data_genomes(input_file, genome=self.get_genome_store())
         return res
 
     @classmethod
@@ -2,12 +2,15 @@ import csv
 import requests
 from itertools import groupby
 from functools import partial
-from biothings.utils.dataload import dict_sweep, list_split, unlist, \
-                                     value_convert_to_number, merge_duplicate_rows
+from biothings.utils.dataload import merge_duplicate_rows
+from biothings.utils.common import iter_n
 import biothings.utils.mongo as mongo
-from utils.hgvs import get_hgvs_from_rsid
+from utils.rsid_index import RsidIndex, CollectionRsidResolver
+from utils.normalize import DocNormalizer
+from utils.docmapper import DocMapper
 
 VALID_COLUMN_NO = 70
+normalize = DocNormalizer(sweep=[""], split=",")
 
 
 def safe_str(s):
@@ -16,100 +19,84 @@ def safe_str(s):
     return _s
 
 
+# column position => document field
+GRASP_SPEC = [
+    ("hg19.chr", 5),
+    ("hg19.pos", 6),
+    ("hupfield", 1),
+    ("last_curation_date", 2),
+    ("creation_date", 3),
+    ("srsid", 4),
+    ("publication.journal", 16),
+    ("publication.title", 17),
+    ("publication.pmid", 7),
+    ("publication.snpid", 8),
+    ("publication.location_within_paper", 9),
+    ("publication.p_value", 10),
+    ("publication.phenotype", 11),
+    ("publication.paper_phenotype_description", 12),
+    ("publication.paper_phenotype_categories", 13),
+    ("publication.date_pub", 14),
+    ("includes_male_female_only_analyses", 18),
+    ("exclusively_male_female", 19),
+    ("initial_sample_description", 20),
+    ("replication_sample_description", 21),
+    ("platform_snps_passing_qc", 22),
+    ("gwas_ancestry_description", 23),
+    ("discovery.total_samples", 25),
+    ("discovery.european", 26),
+    ("discovery.african", 27),
+    ("discovery.east_asian", 28),
+    ("discovery.indian_south_asian", 29),
+    ("discovery.hispanic", 30),
+    ("discovery.native", 31),
+    ("discovery.micronesian", 32),
+    ("discovery.arab_me", 33),
+    ("discovery.mixed", 34),
+    ("discovery.unspecified", 35),
+    ("discovery.filipino", 36),
+    ("discovery.indonesian", 37),
+    ("replication.total_samples", 38),
+    ("replication.european", 39),
+    ("replication.african", 40),
+    ("replication.east_asian", 41),
+    ("replication.indian_south_asian", 42),
+    ("replication.hispanic", 43),
+    ("replication.native", 44),
+    ("replication.micronesian", 45),
+    ("replication.arab_me", 46),
+    ("replication.mixed", 47),
+    ("replication.unspecified", 48),
+    ("replication.filipino", 49),
+    ("replication.indonesian", 50),
+    ("in_gene", 51),
+    ("nearest_gene", 52),
+    ("in_lincrna", 53),
+    ("in_mirna", 54),
+    ("in_mirna_bs", 55),
+    ("oreg_anno", 61),
+    ("conserv_pred_tfbs", 62),
+    ("human_enhancer", 63),
+    ("rna_edit", 64),
+    ("polyphen2", 65),
+    ("sift", 66),
+    ("ls_snp", 67),
+    ("uniprot", 68),
+    ("eqtl_meth_metab_study", 69),
+]
+map_grasp = DocMapper(GRASP_SPEC).compile()
+
+
 # convert one snp to json
-def _map_line_to_json(fields,dbsnp_col):
+def _map_line_to_json(fields,hgvs_ids):
     # lines in fh
     assert len(fields) == VALID_COLUMN_NO
-    rsid = fields[8]
-
-    # load as json data
-    if rsid is None:
-        return
-    docs = get_hgvs_from_rsid([{"_id":rsid}], lambda d: d["_id"], dbsnp_col)
-    for doc in docs:
-        HGVS = doc['_id']
+    for HGVS in hgvs_ids:
         one_snp_json = {
-
             "_id": HGVS,
-            "grasp":
-                {
-                    'hg19':
-                        {
-                            'chr': fields[5],
-                            'pos': fields[6]
-                        },
-                    'hupfield': fields[1],
-                    'last_curation_date': fields[2],
-                    'creation_date': fields[3],
-                    'srsid': fields[4],
-                    'publication':
-                        {
-                            'journal': fields[16],
-                            'title': fields[17],
-                            'pmid': fields[7],
-                            'snpid': fields[8],
-                            'location_within_paper': fields[9],
-                            'p_value': fields[10],
-                            'phenotype': fields[11],
-                            'paper_phenotype_description': fields[12],
-                            'paper_phenotype_categories': fields[13],
-                            'date_pub': fields[14]
-                        },
-                    'includes_male_female_only_analyses': fields[18],
-                    'exclusively_male_female': fields[19],
-                    'initial_sample_description': fields[20],
-                    'replication_sample_description': fields[21],
-                    'platform_snps_passing_qc': fields[22],
-                    'gwas_ancestry_description': fields[23],
-                    'discovery':
-                        {
-                            'total_samples': fields[25],
-                            'european': fields[26],
-                            'african': fields[27],
-                            'east_asian': fields[28],
-                            'indian_south_asian': fields[29],
-                            'hispanic': fields[30],
-                            'native': fields[31],
-                            'micronesian': fields[32],
-                            'arab_me': fields[33],
-                            'mixed': fields[34],
-                            'unspecified': fields[35],
-                            'filipino': fields[36],
-                            'indonesian': fields[37]
-                        },
-                    'replication':
-                        {
-                            'total_samples': fields[38],
-                            'european': fields[39],
-                            'african': fields[40],
-                            'east_asian': fields[41],
-                            'indian_south_asian': fields[42],
-                            'hispanic': fields[43],
-                            'native': fields[44],
-                            'micronesian': fields[45],
-                            'arab_me': fields[46],
-                            'mixed': fields[47],
-                            'unspecified': fields[48],
-                            'filipino': fields[49],
-                            'indonesian': fields[50]
-                        },
-                    'in_gene': fields[51],
-                    'nearest_gene': fields[52],
-                    'in_lincrna': fields[53],
-                    'in_mirna': fields[54],
-                    'in_mirna_bs': fields[55],
-                    'oreg_anno': fields[61],
-                    'conserv_pred_tfbs': fields[62],
-                    'human_enhancer': fields[63],
-                    'rna_edit': fields[64],
-                    'polyphen2': fields[65],
-                    'sift': fields[66],
-                    'ls_snp': fields[67],
-                    'uniprot': fields[68],
-                    'eqtl_meth_metab_study': fields[69]
-                }
+            "grasp": map_grasp(fields)
             }
-        yield list_split(dict_sweep(unlist(value_convert_to_number(one_snp_json)), [""]), ",")
+        yield normalize(one_snp_json)
 
 ''' replace None indices with '''
 
@@ -124,14 +111,22 @@ def row_generator(db_row):
             row.append('')
     return row
 
-def parse_rsid_group(data, dbsnp_col):
+def resolve_rsids(data, resolver, batch_size=10000):
+    # resolve rsids by batch, yield (line, list of matching hgvs ids).
+    # resolver is an RsidIndex or CollectionRsidResolver
+    for lines in iter_n(data, batch_size):
+        for line, hgvs_ids in zip(lines, resolver.resolve_many([line[8] for line in lines])):
+            yield line, hgvs_ids
+
+
+def parse_rsid_group(data):
     # lines are sorted by rsid, so we parse group of rsid data and
     # yield them once we reached another group
     current_rsid = None
     rsid_group = []
     # debug...
     processed = {}
-    for line in data:
+    for line, hgvs_ids in data:
         new_rsid = line[8].strip() # 8: rsid columns
         if new_rsid != current_rsid:
             for row in rsid_group:
@@ -139,25 +134,33 @@ def parse_rsid_group(data, dbsnp_col):
             rsid_group = []
             assert not new_rsid in processed, "Already processed: %s" % repr(new_rsid)
 
-        rows = _map_line_to_json(line,dbsnp_col=dbsnp_col)
+        rows = _map_line_to_json(line,hgvs_ids)
         [rsid_group.append(row) for row in rows]
         current_rsid = new_rsid
         processed[current_rsid] = True
+    # last group
+    for row in rsid_group:
+        yield row
 
 
 # open file, parse, pass to json mapper
-def load_data(input_file):
-    src_db = mongo.get_src_db()
-    if not "dbsnp_hg19" in src_db.collection_names():
-        raise ValueError("'dbsnp_hg19' collection is missing, run dbsnp uploader first")
-    dbsnp_col = src_db["dbsnp_hg19"]
+def load_data(input_file, rsid_index=None):
+    # rsid_index: folder of rsID index built from dbsnp_hg19 (see utils.rsid_index),
+    # if not available, rsids are resolved with queries on dbsnp_hg19 collection
+    if rsid_index:
+        resolver = RsidIndex(rsid_index)
+    else:
+        src_db = mongo.get_src_db()
+        if not "dbsnp_hg19" in src_db.collection_names():
+            raise ValueError("'dbsnp_hg19' collection is missing, run dbsnp uploader first")
+        resolver = CollectionRsidResolver(src_db["dbsnp_hg19"])
     open_file = open(input_file,encoding="cp1252")
     open_file = csv.reader(open_file, delimiter="\t")
     next(open_file)
     grasp = map(row_generator, open_file)
     grasp = filter(lambda row: row[58] != "", grasp)
     #json_rows = map(partial(_map_line_to_json,dbsnp_col=dbsnp_col), grasp)
-    json_rows = (row for row in parse_rsid_group(grasp,dbsnp_col))
+    json_rows = (row for row in parse_rsid_group(resolve_rsids(grasp,resolver)))
     #json_rows = (row for g in json_rows for row in g if row)
     row_groups = (it for (key, it) in groupby(json_rows, lambda row: row["_id"]))
     for row in (merge_duplicate_rows(rg, "grasp") for rg in row_groups):
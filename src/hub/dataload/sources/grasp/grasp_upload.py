@@ -34,7 +34,7 @@ class GraspUploader(uploader.IgnoreDuplicatedSourceUploader,
         input_file = content.pop()
         input_file = os.path.join(data_folder,"sorted")#input_file)
         self.logger.info("Load data from file '%s'" % input_file)
-        res = load_data(input_file)
+        res = load_data(input_file, rsid_index=self.get_rsid_index("dbsnp_hg19"))
         return res
 
 
@@ -1,117 +1,92 @@
 from __future__ import print_function
+import os
 
 try:
     import MySQLdb
 except:
     pass
-import requests
 
-from biothings.utils.common import loadobj, is_float
+from biothings.utils.common import loadobj, is_float, iter_n
+from utils.rsid_index import RsidIndex
+from config import RSID_INDEX_PATH
 
 
-def load_data(step=1000, offset=0, gwas_data_local=None):
-    if gwas_data_local:
-        gwas_data = loadobj('gwasdata.pyobj')
-        for item in gwas_data:
-            snp = item
-            chrom = snp[1]
-            chrom = chrom[3:]
-            rsid = snp[4]
-            pubMedID = snp[5]
-            title = snp[9]
-            trait = snp[10]
-            region = snp[13]
-            gene_name = snp[14]
-            riskAllele = snp[15]
-            riskAlleleFreq = snp[16]
-            if not is_float(riskAlleleFreq):
-                riskAlleleFreq = None
-            pValue = snp[17]
-            pValue_desc = snp[18]
-            if not is_float(pValue):
-                pValue = None
-                pValue_desc = None
-            # parse from myvariant.info to get hgvs_id,
-            # ref, alt information based on rsid
-            url = 'http://localhost:8000/v1/query?q=dbsnp.rsid:'\
-                + rsid + '&fields=_id,dbsnp.ref,dbsnp.alt,dbsnp.chrom,dbsnp.hg19'
-            r = requests.get(url)
-            for hits in r.json()['hits']:
-                HGVS = hits['_id']
+def _map_snp_to_json(snp):
+    # return rsid and gwassnp data, _id is resolved from rsid later
+    chrom = snp[1]
+    chrom = chrom[3:]
+    rsid = snp[4]
+    pubMedID = snp[5]
+    title = snp[9]
+    trait = snp[10]
+    region = snp[13]
+    gene_name = snp[14]
+    riskAllele = snp[15]
+    riskAlleleFreq = snp[16]
+    if not is_float(riskAlleleFreq):
+        riskAlleleFreq = None
+    pValue = snp[17]
+    pValue_desc = snp[18]
+    if not is_float(pValue):
+        pValue = None
+        pValue_desc = None
+    gwassnp = {
+        "rsid": rsid,
+        "pubmed": pubMedID,
+        "title": title,
+        "trait": trait,
+        "region": region,
+        "genename": gene_name,
+        "risk_allele": riskAllele,
+        "risk_allele_freq": riskAlleleFreq,
+        "pvalue": pValue,
+        "pvalue_desc": pValue_desc
+    }
+    return rsid, gwassnp
 
+
+def resolve_rsids(rows, rsid_index, batch_size=1000):
+    # get hgvs_id(s) for each (rsid, gwassnp) row, by batch, from
+    # rsID index built from dbsnp_hg19
+    for batch in iter_n(rows, batch_size):
+        hits = rsid_index.resolve_many([rsid for rsid, _ in batch])
+        for (rsid, gwassnp), hgvs_ids in zip(batch, hits):
+            for HGVS in hgvs_ids:
                 one_snp_json = {
                     "_id": HGVS,
-                    "gwassnp":
-                        {
-                            "rsid": rsid,
-                            "pubmed": pubMedID,
-                            "title": title,
-                            "trait": trait,
-                            "region": region,
-                            "genename": gene_name,
-                            "risk_allele": riskAllele,
-                            "risk_allele_freq": riskAlleleFreq,
-                            "pvalue": pValue,
-                            "pvalue_desc": pValue_desc
-                        }
+                    "gwassnp": dict(gwassnp)
                 }
                 yield one_snp_json
-    else:
-        MySQLHG19 = MySQLdb.connect('genome-mysql.cse.ucsc.edu',
-                                    db='hg19', user='genomep', passwd='password')
-        Cursor = MySQLHG19.cursor()
 
-        # get the row number of gwasCatalog
-        sql = "SELECT COUNT(*) FROM gwasCatalog"
-        Cursor.execute(sql)
-        numrows = Cursor.fetchone()[0]
-        print(numrows)
 
-        sql = "SELECT * FROM gwasCatalog"
-        Cursor.execute(sql)
+def fetch_ucsc_snps(step=1000):
+    MySQLHG19 = MySQLdb.connect('genome-mysql.cse.ucsc.edu',
+                                db='hg19', user='genomep', passwd='password')
+    Cursor = MySQLHG19.cursor()
 
-        for i in range(numrows):
-            snp = Cursor.fetchone()
-            if i and i % step == 0:
-                print(i)
+    # get the row number of gwasCatalog
+    sql = "SELECT COUNT(*) FROM gwasCatalog"
+    Cursor.execute(sql)
+    numrows = Cursor.fetchone()[0]
+    print(numrows)
 
-            chrom = snp[1]
-            chrom = chrom[3:]
-            rsid = snp[4]
-            pubMedID = snp[5]
-            title = snp[9]
-            trait = snp[10]
-            region = snp[13]
-            gene_name = snp[14]
-            riskAllele = snp[15]
-            riskAlleleFreq = snp[16]
-            if not is_float(riskAlleleFreq):
-                riskAlleleFreq = None
-            pValue = snp[17]
-            pValue_desc = snp[18]
-            if not is_float(pValue):
-                pValue = None
-                pValue_desc = None
-            # parse from myvariant.info to get hgvs_id, ref, alt information based on rsid
-            url = 'http://localhost:8000/v1/query?q=dbsnp.rsid:'\
-                + rsid + '&fields=_id,dbsnp.ref,dbsnp.alt,dbsnp.chrom,dbsnp.hg19'
-            r = requests.get(url)
-            for hits in r.json()['hits']:
-                HGVS = hits['_id']
-                one_snp_json = {
-                    "_id": HGVS,
-                    "gwassnp":
-                        {
-                            "rsid": rsid,
-                            "pubmed": pubMedID,
-                            "title": title,
-                            "trait": trait,
-                            "region": region,
-                            "genename": gene_name,
-                            "risk_allele": riskAllele,
-                            "risk_allele_freq": riskAlleleFreq,
-                            "pvalue": pValue,
-                            "pvalue_desc": pValue_desc
-                        }
-                }
-                yield one_snp_json
+    sql = "SELECT * FROM gwasCatalog"
+    Cursor.execute(sql)
+
+    for i in range(numrows):
+        snp = Cursor.fetchone()
+        if i and i % step == 0:
+            print(i)
+        yield snp
+
+
+def load_data(step=1000, offset=0, gwas_data_local=None, rsid_index=None):
+    # rsid_index: folder of rsID index built from dbsnp_hg19 (see utils.rsid_index)
+    rsid_index = RsidIndex(rsid_index or os.path.join(RSID_INDEX_PATH, "dbsnp_hg19"))
+    if gwas_data_local:
+        gwas_data = loadobj('gwasdata.pyobj')
+    else:
+        gwas_data = fetch_ucsc_snps(step=step)
+    rows = (_map_snp_to_json(snp) for snp in gwas_data)
+    for one_snp_json in resolve_rsids(rows, rsid_index, batch_size=step):
+        yield one_snp_json
@@ -11,6 +11,9 @@ biothings.config_for_app(config)
 from config import DATA_ARCHIVE_ROOT
 from biothings.hub.dataload.dumper import LastModifiedHTTPDumper
 from biothings.utils.common import unzipall
+from utils.genome import convert_bitarray_genome
+from hub.dataload.sources.snpeff.snpeff_models import dump_models, diff_models, \
+                                                     MODELS_FILENAME, CHANGES_FILENAME
 
 
 class SnpeffDumper(LastModifiedHTTPDumper):
@@ -31,6 +34,11 @@ class SnpeffDumper(LastModifiedHTTPDumper):
     def post_dump(self, *args, **kwargs):
         self.logger.info("Uncompressing files in '%s'" % self.new_data_folder) 
         unzipall(self.new_data_folder)
+        for assembly in ["hg19","hg38"]:
+            pyobj = os.path.join(self.new_data_folder,"%s_genome.pyobj" % assembly)
+            store = os.path.join(self.new_data_folder,"%s_genome.store" % assembly)
+            self.logger.info("Converting genome '%s' to genome store '%s'" % (pyobj,store))
+            convert_bitarray_genome(pyobj,store,logger=self.logger)
         prev = os.path.abspath(os.curdir)
         try:
             os.chdir(os.path.join(self.new_data_folder,"snpEff"))
@@ -39,6 +47,30 @@ class SnpeffDumper(LastModifiedHTTPDumper):
             subprocess.check_output(["java","-jar","snpEff.jar","download","hg38"])
         finally:
             os.chdir(prev)
+        self.diff_models()
+
+    def diff_models(self):
+        """Dump gene/transcript models from new snpEff databases and, if a
+        previous release is there, diff them to find intervals where
+        annotations need to be computed again (see upgrade_snpeff)"""
+        prev_folder = getattr(self,"current_data_folder",None)
+        if prev_folder == self.new_data_folder:
+            prev_folder = None
+        for assembly in ["hg19","hg38"]:
+            models = os.path.join(self.new_data_folder,MODELS_FILENAME % assembly)
+            self.logger.info("Dumping snpeff models for '%s' to '%s'" % (assembly,models))
+            dump_models(self.new_data_folder,assembly,models)
+            if not prev_folder:
+                continue
+            prev_models = os.path.join(prev_folder,MODELS_FILENAME % assembly)
+            if not os.path.exists(prev_models) and os.path.exists(os.path.join(prev_folder,"snpEff")):
+                self.logger.info("Dumping previous snpeff models for '%s' to '%s'" % (assembly,prev_models))
+                dump_models(prev_folder,assembly,prev_models)
+            if os.path.exists(prev_models):
+                changes = os.path.join(self.new_data_folder,CHANGES_FILENAME % assembly)
+                self.logger.info("Diffing snpeff models for '%s' (%s => %s)" % (assembly,prev_models,models))
+                diff_models(prev_models,models,changes,previous_release=getattr(self,"current_release",None),
+                            release=self.release,previous_data_folder=prev_folder)
 
 
 
@@ -0,0 +1,161 @@
+'''
+snpEff gene/transcript models.
+
+Models are dumped as BED from snpEff databases (one file per assembly, next
+to snpEff in the data folder, see SnpeffDumper.post_dump). Models from two
+snpEff releases are diffed to find the genomic intervals where annotations
+may have changed, so only variants found in these intervals are annotated
+again after an upgrade (see hub.dataload.uploader.upgrade_snpeff).
+'''
+import os
+import re
+import gzip
+import json
+import subprocess
+
+import numpy as np
+
+
+MODELS_FILENAME = "%s_models.bed.gz"
+CHANGES_FILENAME = "%s_changes.json"
+CHANGES_FORMAT = 1
+# snpEff default upstream/downstream interval length (-ud)
+UPDOWN_LENGTH = 5000
+# used as "end of chromosome"
+MAX_POS = 2**31 - 1
+
+pat_id_pos = re.compile(r"^chr([^:]+):g\.(\d+)(?:_(\d+))?")
+
+
+def normalize_chrom(chrom):
+    chrom = chrom[3:] if chrom.startswith("chr") else chrom
+    return "MT" if chrom == "M" else chrom
+
+
+def dump_models(snpeff_dir, assembly, outfile):
+    '''dump gene/transcript models from snpEff database for assembly (already
+       downloaded in snpeff_dir) into outfile, as gzipped BED'''
+    tmpfile = outfile + ".tmp"
+    proc = subprocess.Popen(["java","-jar","snpEff.jar","dump","-bed",assembly],
+                            cwd=os.path.join(snpeff_dir,"snpEff"),stdout=subprocess.PIPE)
+    with gzip.open(tmpfile,"wb") as fout:
+        for line in proc.stdout:
+            fout.write(line)
+    if proc.wait():
+        raise subprocess.CalledProcessError(proc.returncode,proc.args)
+    os.rename(tmpfile,outfile)
+
+
+def load_models(path):
+    '''return markers found in BED models file, as a set of
+       (chrom, start, end, name) with 1-based, inclusive coordinates'''
+    markers = set()
+    with gzip.open(path,"rt") as fin:
+        for line in fin:
+            if not line.strip() or line.startswith(("#","track","browser")):
+                continue
+            fields = line.rstrip("\n").split("\t")
+            markers.add((normalize_chrom(fields[0]),int(fields[1]) + 1,int(fields[2]),"\t".join(fields[3:])))
+    return markers
+
+
+def merge_intervals(starts, ends):
+    '''merge overlapping (or adjacent) intervals, return sorted starts and ends arrays'''
+    order = np.argsort(starts,kind="stable")
+    starts, ends = starts[order], ends[order]
+    if not len(starts):
+        return starts, ends
+    maxends = np.maximum.accumulate(ends)
+    new = np.ones(len(starts),dtype=bool)
+    new[1:] = starts[1:] > maxends[:-1] + 1
+    idx = np.flatnonzero(new)
+    return starts[idx], np.maximum.reduceat(ends,idx)
+
+
+def changed_intervals(old_markers, new_markers, flank=UPDOWN_LENGTH):
+    '''return {chrom: (starts, ends)} intervals where annotations may differ
+       between old and new models: markers found only in one of them, extended
+       by up/downstream length, and up to neighbouring genes as intergenic
+       annotations refer to closest genes (gene markers are the ones named
+       "Gene...", as dumped by snpEff)'''
+    changed = {}
+    for marker in old_markers ^ new_markers:
+        changed.setdefault(marker[0],[]).append(marker[1:3])
+    genes = {}
+    for markers in (old_markers,new_markers):
+        for chrom,start,end,name in markers:
+            if chrom in changed and name.lower().startswith("gene"):
+                genes.setdefault(chrom,set()).add((start,end))
+    res = {}
+    for chrom,coords in changed.items():
+        coords = np.array(coords,dtype=np.int64)
+        starts, ends = coords[:,0], coords[:,1]
+        gene_coords = np.array(sorted(genes.get(chrom,[])),dtype=np.int64).reshape(-1,2)
+        gene_starts, gene_ends = np.sort(gene_coords[:,0]), np.sort(gene_coords[:,1])
+        # end of closest gene before the marker, start of closest gene after it
+        # (or chromosome boundaries)
+        i = np.searchsorted(gene_ends,starts,side="left") - 1
+        left = np.where(i >= 0,gene_ends[np.maximum(i,0)] if len(gene_ends) else 1,1)
+        j = np.searchsorted(gene_starts,ends,side="right")
+        right = np.where(j < len(gene_starts),
+                         gene_starts[np.minimum(j,len(gene_starts) - 1)] if len(gene_starts) else MAX_POS,
+                         MAX_POS)
+        starts = np.maximum(np.minimum(starts,left) - flank,1)
+        ends = np.minimum(np.maximum(ends,right) + flank,MAX_POS)
+        res[chrom] = merge_intervals(starts,ends)
+    return res
+
+
+def save_changes(path, intervals, **meta):
+    doc = {"format" : CHANGES_FORMAT,
+           "intervals" : {chrom : [starts.tolist(),ends.tolist()] for chrom,(starts,ends) in intervals.items()},
+           "length" : int(sum((ends - starts + 1).sum() for starts,ends in intervals.values()))}
+    doc.update(meta)
+    with open(path + ".tmp","w") as fout:
+        json.dump(doc,fout)
+    os.rename(path + ".tmp",path)
+
+
+def load_changes(path):
+    '''return (intervals, metadata) saved with save_changes(), or None if
+       there's no file (or in an unsupported format)'''
+    if not os.path.exists(path):
+        return None
+    with open(path) as fin:
+        doc = json.load(fin)
+    if doc.pop("format",None) != CHANGES_FORMAT:
+        return None
+    intervals = {chrom : (np.array(starts,dtype=np.int64),np.array(ends,dtype=np.int64))
+                 for chrom,(starts,ends) in doc.pop("intervals").items()}
+    return intervals, doc
+
+
+def diff_models(old_path, new_path, changes_path, **meta):
+    '''diff BED models files and save changed intervals in changes_path'''
+    intervals = changed_intervals(load_models(old_path),load_models(new_path))
+    save_changes(changes_path,intervals,**meta)
+    return intervals
+
+
+def select_ids(hgvs_ids, intervals):
+    '''return hgvs_ids overlapping intervals (see changed_intervals()),
+       IDs which can't be parsed are kept'''
+    selected = []
+    bychrom = {}
+    for hgvs_id in hgvs_ids:
+        m = pat_id_pos.match(hgvs_id)
+        if m is None:
+            selected.append(hgvs_id)
+            continue
+        start = int(m.group(2))
+        end = int(m.group(3)) if m.group(3) else start
+        bychrom.setdefault(normalize_chrom(m.group(1)),[]).append((hgvs_id,start,end))
+    for chrom,entries in bychrom.items():
+        if chrom not in intervals:
+            continue
+        starts, ends = intervals[chrom]
+        coords = np.array([e[1:] for e in entries],dtype=np.int64)
+        i = np.searchsorted(starts,coords[:,1],side="right") - 1
+        hit = (i >= 0) & (ends[np.maximum(i,0)] >= coords[:,0])
+        selected.extend(entries[k][0] for k in np.flatnonzero(hit).tolist())
+    return selected
@@ -1,14 +1,17 @@
-import re, os, sys, pickle, datetime
-import subprocess
+import re, os, sys, pickle, datetime, time
+import subprocess, threading, queue, tempfile, atexit
+import numpy as np
 
 from biothings.utils.dataload import unlist, dict_sweep
-from utils.validate import bit_to_nuc
-from biothings.utils.common import loadobj
-from utils.hgvs import get_hgvs_from_vcf, trim_delseq_from_hgvs
+from utils.genome import GenomeStore
+from utils.hgvs import get_hgvs_from_vcf, trim_delseq_from_hgvs, parse_many
 
 from biothings import config
 logging = config.logger
 
+# chromosomes known by snpEff
+VALID_CHROMS = set([str(i) for i in range(1,23)] + ["X","Y","M"])
+
 
 class VCFConstruct(object):
 
@@ -18,367 +21,742 @@ class VCFConstruct(object):
         self.logger = logger
 
     def load_chr_data(self):
-        self.logger.info("\tLoading chromosome data from '%s'..." % self.genome)
+        self.logger.info("\tOpening genome store '%s'..." % self.genome)
         try:
-            self._chr_data = loadobj(self.genome)
+            self._chr_data = GenomeStore(self.genome)
         except Exception as e:
             self.logger.info(e)
             raise
         self.logger.info("Done.")
 
-    def snp_hgvs_id_parser(self, id):
-        '''get chr, pos, ref, alt from hgvs_id'''
-        pat = 'chr(\w+):g\.(\d+)(\w)\>(\w)'
-        mat = re.match(pat, id)
-        if mat:
-            r = mat.groups()
-            return r
-
-    def del_hgvs_id_parser_interval(self, id):
-        pat = 'chr(\w+):g\.(\d+)\_(\d+)del'
-        mat = re.match(pat, id)
-        if mat:
-            r = mat.groups()
-            return r
-
-    def del_hgvs_id_parser(self, id):
-        pat = 'chr(\w+):g\.(\d+)del'
-        mat = re.match(pat, id)
-        if mat:
-            r = mat.groups()
-            return r
-
-    def ins_hgvs_id_parser(self, id):
-        pat = 'chr(\w+):g\.(\d+)\_(\d+)ins(\w+)'
-        mat = re.match(pat, id)
-        if mat:
-            r = mat.groups()
-            return r
-
-    def delins_hgvs_id_parser(self, id):
-        pat = 'chr(\w+):g\.(\d+)\_(\d+)delins(\w+)'
-        mat = re.match(pat, id)
-        if mat:
-            r = mat.groups()
-            return r
-
-    def snp_vcf_constructor(self, hgvs):
-        '''construct a VCF file based on chr, pos, ref, alt information'''
-        chrom = hgvs[0]
-        if chrom == 'MT':
-            chrom = 'M'
-        pos = hgvs[1]
-        ref = hgvs[2]
-        alt = hgvs[3]
-        vcf = {"chrom": str(chrom), "position": str(pos), "ref": ref, "alt": alt}
-        return vcf
-
-    def del_vcf_constructor(self, hgvs):
+    def fetch_ref(self, hgvs, start, end):
+        '''return reference sequence from start to end (inclusive),
+           or None if it can't be extracted from genome'''
         if self._chr_data is None:
             self.load_chr_data()
-        chrom = hgvs[0]
-        pos = int(hgvs[1]) - 1
-        # len=2 was a single del, len=3 was internval del
-        if len(hgvs) == 2:
-            end = int(hgvs[1])
-        else:
-            end = int(hgvs[2])
-        chr_bit = self._chr_data[str(chrom)]
-        ref = ''
-        for i in range(pos, end+1):
-            try:
-                nuc_chr_bit = chr_bit[i*4-4:i*4]
-                nuc_chr = bit_to_nuc(nuc_chr_bit)
-                ref += nuc_chr
-            except Exception as e:
-                self.logger.warning("Couldn't extract nucleotide from bits with HGVS %s: %s" % (repr(hgvs),e))
-                return None
-        alt = ref[0]
-        if chrom == 'MT':
-            chrom = 'M'
-        vcf = {"chrom": str(chrom), "position": str(pos), "ref": ref, "alt": alt}
-        return vcf
-
-    def ins_vcf_constructor(self, hgvs):
-        if self._chr_data is None:
-            self.load_chr_data()
-        chrom = hgvs[0]
-        pos = int(hgvs[1])
-        chr_bit = self._chr_data[str(chrom)]
-        nuc_chr_bit = chr_bit[pos*4-4:pos*4]
         try:
-            ref = bit_to_nuc(nuc_chr_bit)
-        except Exception as e:
-            self.logger.warning("Couldn't extract nucleotide from bits with HGVS %s: %s" % (repr(hgvs),e))
+            return self._chr_data.fetch(str(hgvs.chrom), start, end)
+        except (KeyError, ValueError) as e:
+            self.logger.warning("Couldn't extract nucleotides from genome with HGVS %s: %s" % (repr(hgvs),e))
             return None
-        alt = hgvs[3]
-        alt = ref + alt
-        if chrom == 'MT':
-            chrom = 'M'
-        vcf = {"chrom": str(chrom), "position": str(pos), "ref": ref, "alt": alt}
-        return vcf
-
-    def delins_vcf_constructor(self, hgvs):
+
+    def fetch_ranges(self, chrom, starts, ends):
+        '''return reference sequences for all (start, end) ranges (inclusive)
+           on chrom, extracted in bulk, None for ranges out of chromosome'''
         if self._chr_data is None:
             self.load_chr_data()
-        chrom = hgvs[0]
-        pos = int(hgvs[1])
-        end = int(hgvs[2])
-        chr_bit = self._chr_data[str(chrom)]
-        ref = ''
-        for i in range(pos, end+1):
-            try:
-                nuc_chr_bit = chr_bit[i*4-4:i*4]
-                nuc_chr = bit_to_nuc(nuc_chr_bit)
-                ref += nuc_chr
-            except Exception as e:
-                self.logger.warning("Couldn't extract nucleotide from bits with HGVS %s: %s" % (repr(hgvs),e))
-                return None
-        alt = hgvs[3]
-        if chrom == 'MT':
-            chrom = 'M'
-        vcf = {"chrom": str(chrom), "position": str(pos), "ref": ref, "alt": alt}
-        return vcf
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        length = self._chr_data.length(chrom) if chrom in self._chr_data else 0
+        valid = (starts >= 1) & (ends >= starts) & (ends <= length)
+        lens = np.where(valid, ends - starts + 1, 0)
+        offsets = np.cumsum(lens) - lens
+        # genome position for each nucleotide of all ranges, concatenated
+        positions = np.repeat(starts - offsets, lens) + np.arange(lens.sum())
+        seqs = self._chr_data.bases_at(chrom, positions).tobytes().decode() if len(positions) else ""
+        return [seqs[o:o + l] if ok else None
+                for ok, o, l in zip(valid.tolist(), offsets.tolist(), lens.tolist())]
 
-    def build_vcfs(self, hgvs_ids):
-        '''load data'''
-        # extract each hgvs_id from list, transform into vcf format
-        hgvs_vcfs = {}
-        for hgvs_id in hgvs_ids:
-            if '>' in hgvs_id:
-                hgvs_info = self.snp_hgvs_id_parser(hgvs_id)
-                if not hgvs_info:
-                    continue
-                vcf = self.snp_vcf_constructor(hgvs_info)
-                if not vcf:
+    def build_columns(self, hgvs_ids, max_len=None):
+        '''return VCF info for hgvs_ids as VCFColumns (IDs which can't be
+           converted are skipped). Reference sequences needed for del, ins and
+           delins are extracted in bulk, per chromosome'''
+        ids, chroms, positions, refs, alts = [], [], [], [], []
+        # rows needing reference bases, per chromosome: (row, start, end)
+        fetches = {}
+        for hgvs_id, v in zip(hgvs_ids, parse_many(hgvs_ids)):
+            vartype = v and v.vartype
+            if vartype == "snp":
+                pos, ref, alt = v.start, v.ref, v.alt
+            elif vartype == "del":
+                # VCF keeps the base before deletion
+                pos, ref, alt = v.start - 1, (v.start - 1, v.end), ""
+            elif vartype == "ins":
+                pos, ref, alt = v.start, (v.start, v.start), v.alt
+            elif vartype == "delins":
+                pos, ref, alt = v.start, (v.start, v.end), v.alt
+            else:
+                self.logger.info('%s: beyond current capacity, skip it' % hgvs_id)
+                continue
+            if type(ref) == tuple:
+                fetches.setdefault(v.chrom, []).append((len(ids), vartype) + ref)
+                ref = None
+            ids.append(hgvs_id)
+            chroms.append("M" if v.chrom == "MT" else str(v.chrom))
+            positions.append(pos)
+            refs.append(ref)
+            alts.append(alt)
+        skipped = set()
+        for chrom, rows in fetches.items():
+            idx, vartypes, starts, ends = zip(*rows)
+            for i, vartype, seq in zip(idx, vartypes, self.fetch_ranges(chrom, starts, ends)):
+                if not seq:
+                    self.logger.warning("Couldn't extract nucleotides from genome with HGVS %s" % ids[i])
+                    skipped.add(i)
                     continue
-                hgvs_vcfs[hgvs_id] = {"_id" : hgvs_id, "vcf" : vcf}
+                refs[i] = seq
+                if vartype == "del":
+                    alts[i] = seq[0]
+                elif vartype == "ins":
+                    alts[i] = seq + alts[i]
+        if skipped:
+            keep = [i for i in range(len(ids)) if not i in skipped]
+            ids, chroms, positions, refs, alts = ([col[i] for i in keep] for col in (ids, chroms, positions, refs, alts))
+        return VCFColumns(ids, chroms, positions, refs, alts, max_len=max_len)
 
-            elif hgvs_id.endswith('del') and '_' in hgvs_id:
-                hgvs_info = self.del_hgvs_id_parser_interval(hgvs_id)
-                if not hgvs_info:
-                    continue
-                vcf = self.del_vcf_constructor(hgvs_info)
-                if not vcf:
-                    continue
-                hgvs_vcfs[hgvs_id] = {"_id" : hgvs_id, "vcf" : vcf}
+    def build_vcfs(self, hgvs_ids):
+        '''return dict of hgvs_id => {"_id", "vcf"} for hgvs_ids'''
+        return self.build_columns(hgvs_ids).vcfs()
 
-            elif hgvs_id.endswith('del') and '_' not in hgvs_id:
-                hgvs_info = self.del_hgvs_id_parser(hgvs_id)
-                if not hgvs_info:
-                    continue
-                vcf = self.del_vcf_constructor(hgvs_info)
-                if not vcf:
-                    continue
-                hgvs_vcfs[hgvs_id] = {"_id" : hgvs_id, "vcf" : vcf}
 
-            elif 'ins' in hgvs_id and 'del' not in hgvs_id:
-                hgvs_info = self.ins_hgvs_id_parser(hgvs_id)
-                if not hgvs_info:
-                    continue
-                vcf = self.ins_vcf_constructor(hgvs_info)
-                if not vcf:
-                    continue
-                hgvs_vcfs[hgvs_id] = {"_id" : hgvs_id, "vcf" : vcf}
+class VCFColumns(object):
+    '''VCF info (chrom, position, ref, alt) for a batch of hgvs ids, stored
+       as columns. Documents (VCF info, plus start/end positions) are built
+       from it while snpEff annotations are streamed (see docs())'''
 
-            elif 'delins' in hgvs_id:
-                hgvs_info = self.delins_hgvs_id_parser(hgvs_id)
-                if not hgvs_info:
-                    continue
-                vcf = self.delins_vcf_constructor(hgvs_info)
-                if not vcf:
-                    continue
-                hgvs_vcfs[hgvs_id] = {"_id" : hgvs_id, "vcf" : vcf}
+    TRIMMED_MSG = "...(trimmed)"
 
-            else:
-                self.logger.info('%s: beyond current capacity, skip it' % hgvs_id)
+    def __init__(self, ids, chroms, positions, refs, alts, max_len=None):
+        self.ids = ids
+        self.chroms = chroms
+        self.positions = positions
+        self.refs = refs
+        self.alts = alts
+        self.max_len = max_len
+        ref_lens = np.fromiter(map(len, refs), dtype=np.int64, count=len(refs))
+        alt_lens = np.fromiter(map(len, alts), dtype=np.int64, count=len(alts))
+        pos = np.asarray(positions, dtype=np.int64)
+        # start/end as in utils.hgvs.get_pos_start_end(), computed on whole
+        # sequences (not trimmed ones). 0 when it can't be decided (delins)
+        # (del/ins also need the same first base, otherwise it's a delins)
+        anchored = np.fromiter((r[:1] == a[:1] for r, a in zip(refs, alts)), dtype=bool, count=len(refs))
+        snp = (ref_lens == 1) & (alt_lens == 1)
+        dele = (ref_lens > 1) & (alt_lens == 1) & anchored
+        ins = (ref_lens == 1) & (alt_lens > 1) & anchored
+        self.starts = np.select([snp, dele, ins], [pos, pos + 1, pos], 0).tolist()
+        # end is start+1 for single nt deletion
+        self.ends = np.select([snp, dele, ins], [pos, np.maximum(pos + ref_lens - 1, pos + 2), pos + 1], 0).tolist()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def trim(self, seq):
+        if self.max_len and len(seq) > self.max_len:
+            return seq[:self.max_len - len(self.TRIMMED_MSG)] + self.TRIMMED_MSG
+        return seq
+
+    def vcf_lines(self, logger=logging):
+        '''yield VCF records to send to snpEff, hgvs ID added as a comment at
+           the end so annotations can be matched for sure'''
+        for hgvs_id, chrom, pos, ref, alt in zip(self.ids, self.chroms, self.positions, self.refs, self.alts):
+            if not chrom in VALID_CHROMS or not alt or not alt[0] in "ATGC":
+                logger.warning("Skipping HGVS %s: invalid chromosome or nucleotide (%s, %s)" % (hgvs_id, chrom, alt))
                 continue
+            yield "%s\t%s\t.\t%s\t%s\t.\t.\t.\t# hgvs:%s" % (chrom, pos, ref, alt, hgvs_id)
+
+    def doc(self, i, assembly=None):
+        doc = {"_id" : self.ids[i],
+               "vcf" : {"position" : str(self.positions[i]),
+                        "ref" : self.trim(self.refs[i]),
+                        "alt" : self.trim(self.alts[i])}}
+        if assembly and self.starts[i]:
+            doc[assembly] = {"start" : self.starts[i], "end" : self.ends[i]}
+        return doc
+
+    def docs(self, annotations, assembly=None):
+        '''yield documents, merged with annotations (coming in the same
+           order as ids, as snpEff does, but not all ids are annotated)'''
+        i = 0
+        for annot in annotations:
+            # rows in between have no annotation, 'vcf' data only
+            while i < len(self.ids) and self.ids[i] != annot["_id"]:
+                yield self.doc(i, assembly)
+                i += 1
+            if i == len(self.ids):
+                raise ValueError("Annotation for '%s' doesn't match any (remaining) HGVS ID" % annot["_id"])
+            doc = self.doc(i, assembly)
+            doc.update(annot)
+            yield doc
+            i += 1
+        for j in range(i, len(self.ids)):
+            yield self.doc(j, assembly)
+
+    def vcfs(self):
+        '''return dict of hgvs_id => {"_id", "vcf"} (untrimmed)'''
+        return {hgvs_id : {"_id" : hgvs_id, "vcf" : {"chrom" : chrom, "position" : str(pos), "ref" : ref, "alt" : alt}}
+                for hgvs_id, chrom, pos, ref, alt in zip(self.ids, self.chroms, self.positions, self.refs, self.alts)}
+
+
+class SnpeffError(Exception):
+    pass
+
+
+class SnpeffWorker(object):
+    """Runs snpEff on batches of VCF records, streaming input and output.
+    If persistent (default in hub, see SNPEFF_PERSISTENT_WORKER), the process
+    is started once and fed with all batches, each followed by a marker
+    record: when it comes back on stdout, the whole batch was annotated. This
+    saves snpEff startup (JVM and database loading) per batch, but relies on
+    snpEff echoing records in order and flushing its output: process is
+    health-checked (marker record alone must come back) once started and when
+    idle for a while, and restarted if it dies, hangs or fails the check. If a
+    fresh process fails it, worker falls back to one process per batch, each
+    batch being complete when snpEff exits (EOF)."""
+
+    VCF_HEADER = '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO'
+    MARKER = "# snpeff_batch:"
+    # max seconds without any output from snpEff before considering it hung
+    # (first records come after snpEff database loading)
+    TIMEOUT = 30 * 60
+    # max seconds to wait for health check marker (after a start, includes
+    # snpEff database loading)
+    CHECK_TIMEOUT = 10 * 60
+    # persistent process idle for that long is checked again before use
+    CHECK_INTERVAL = 5 * 60
+    # persistent process idle for that long is stopped (releasing JVM memory),
+    # it's started again on next batch
+    IDLE_TIMEOUT = 15 * 60
+    # max number of output lines read in advance
+    MAX_PENDING_LINES = 10000
+
+    def __init__(self, cmd, logger=logging, timeout=TIMEOUT, persistent=False, check_timeout=CHECK_TIMEOUT,
+                 idle_timeout=IDLE_TIMEOUT):
+        self.snpeff_cmd = cmd
+        self.logger = logger
+        self.timeout = timeout
+        self.persistent = persistent
+        self.check_timeout = check_timeout
+        self.idle_timeout = idle_timeout
+        self.proc = None
+        self.batch_num = 0
+        self.last_used = 0
+        self._lock = threading.Lock()
+        self._idle_timer = None
+
+    def is_alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def start(self):
+        self.logger.debug("Starting snpEff worker '%s'" % " ".join(self.snpeff_cmd))
+        # stderr goes to a file, a full pipe would block snpEff
+        self._stderr = tempfile.TemporaryFile()
+        self._stderr_pos = 0
+        self.proc = subprocess.Popen(self.snpeff_cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     stderr=self._stderr, universal_newlines=True)
+        # bounded, so reading stops when output isn't consumed (backpressure)
+        self._lines = queue.Queue(maxsize=self.MAX_PENDING_LINES)
+        self._reader = threading.Thread(target=self._read_stdout, args=(self.proc.stdout, self._lines), daemon=True)
+        self._reader.start()
+        self.proc.stdin.write(self.VCF_HEADER + "\n")
+
+    def _stop_if_idle(self):
+        # a batch is running or started meanwhile, it'll arm the timer again
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            if self.is_alive() and time.time() - self.last_used >= self.idle_timeout:
+                self.logger.debug("snpEff worker idle for %ss" % self.idle_timeout)
+                self.stop()
+        finally:
+            self._lock.release()
+
+    def _arm_idle_timer(self):
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+        self._idle_timer = threading.Timer(self.idle_timeout, self._stop_if_idle)
+        self._idle_timer.daemon = True
+        self._idle_timer.start()
+
+    def kill(self):
+        if self.proc is not None:
+            self.proc.kill()
+            self.stop()
+
+    def next_marker(self):
+        self.batch_num += 1
+        return "%s%d" % (self.MARKER, self.batch_num)
+
+    def marker_record(self, marker):
+        # any valid record, only its comment matters
+        return "1\t1\t.\tA\tC\t.\t.\t.\t%s\n" % marker
+
+    def check(self):
+        """health check: send a marker record alone, return True if it comes
+        back on stdout within check_timeout"""
+        marker = self.next_marker()
+        try:
+            self.proc.stdin.write(self.marker_record(marker))
+            self.proc.stdin.flush()
+        except (OSError, ValueError):
+            return False
+        deadline = time.time() + self.check_timeout
+        while True:
+            try:
+                line = self._lines.get(timeout=max(deadline - time.time(), 0.001))
+            except queue.Empty:
+                return False
+            if line is None:
+                return False
+            if marker in line:
+                return True
+
+    def ensure_ready(self):
+        """make sure a process is running and, if persistent, healthy"""
+        if not self.persistent:
+            if not self.is_alive():
+                self.start()
+            return
+        if self.is_alive():
+            if time.time() - self.last_used < self.CHECK_INTERVAL or self.check():
+                return
+            self.logger.warning("snpEff worker failed health check, restarting it")
+            self.kill()
+        for attempt in (1, 2):
+            self.start()
+            if self.check():
+                return
+            self.logger.warning("snpEff worker failed health check after start (attempt %d): %s" % \
+                    (attempt, self.read_stderr() or "no output"))
+            self.kill()
+        self.logger.warning("snpEff doesn't answer batch markers, using one snpEff process per batch")
+        self.persistent = False
+        self.start()
+
+    def _read_stdout(self, stdout, lines):
+        for line in stdout:
+            lines.put(line)
+        # EOF, process is gone
+        lines.put(None)
+
+    def stop(self):
+        if self.proc is None:
+            return
+        self.logger.debug("Stopping snpEff worker")
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(timeout=60)
+        except (OSError, subprocess.TimeoutExpired):
+            self.proc.kill()
+            self.proc.wait()
+        # unblock reader thread (waiting on a full queue) until it reaches EOF
+        deadline = time.time() + 60
+        while self._reader.is_alive() and time.time() < deadline:
+            try:
+                self._lines.get(timeout=1)
+            except queue.Empty:
+                pass
+        self.proc = None
+
+    def read_stderr(self):
+        self._stderr.seek(self._stderr_pos)
+        stderr = self._stderr.read().decode()
+        self._stderr_pos = self._stderr.tell()
+        # they print some news message on stderr, bad idea when we use it to detect errors.
+        # try to get rid of it
+        if "NEW VERSION!" in stderr:
+            stderr = stderr.splitlines()
+            start = stderr.index("NEW VERSION!")
+            # message is 5 lines long (hopefully..)
+            end = start + 5
+            stderr = stderr[:start] + stderr[end:]
+            # rebuild and clean any empty lines
+            stderr = "\n".join(stderr)
+        return stderr.strip()
+
+    def stream_batch(self, vcf_lines):
+        """annotate vcf_lines (iterable of VCF records without header) and
+        yield snpEff output records as they come. Input is consumed by a writer
+        thread while output is read, through bounded buffers: if output isn't
+        consumed, snpEff stops reading input, so memory use doesn't depend on
+        batch size. If the stream fails, or isn't fully consumed, the process
+        is killed (and restarted for next batch)"""
+        with self._lock:
+            self.ensure_ready()
+            marker = self.next_marker()
+            errors = []
+            completed = False
+
+            def write():
+                try:
+                    for line in vcf_lines:
+                        self.proc.stdin.write(line + "\n")
+                    if self.persistent:
+                        self.proc.stdin.write(self.marker_record(marker))
+                        self.proc.stdin.flush()
+                    else:
+                        # snpEff flushes and exits on EOF
+                        self.proc.stdin.close()
+                except (OSError, ValueError) as e:
+                    errors.append(e)
+
+            # write from another thread, snpEff would block on a full stdout
+            # pipe if nobody reads it while we're still writing
+            writer = threading.Thread(target=write, daemon=True)
+            writer.start()
+            try:
+                while True:
+                    try:
+                        line = self._lines.get(timeout=self.timeout)
+                    except queue.Empty:
+                        raise SnpeffError("No output from snpEff for %ss, considered hung" % self.timeout)
+                    if line is None:
+                        returncode = self.proc.wait()
+                        if self.persistent or returncode or errors:
+                            raise SnpeffError("snpEff process exited (returncode: %s): %s" %
+                                              (returncode, errors or self.read_stderr()))
+                        break
+                    if line.startswith("#"):
+                        continue
+                    if self.persistent and marker in line:
+                        break
+                    yield line.rstrip("\n")
+                writer.join()
+                stderr = self.read_stderr()
+                if stderr:
+                    raise SnpeffError(stderr)
+                completed = True
+            finally:
+                self.last_used = time.time()
+                if not completed:
+                    # output of this batch may still be pending, can't reuse process
+                    self.kill()
+                elif not self.persistent:
+                    self.stop()
+                else:
+                    self._arm_idle_timer()
+
+    def run_batch(self, vcf_lines):
+        """annotate vcf_lines (list of VCF records without header), return
+        snpEff output records. Batch is retried once on a fresh process if
+        snpEff died or hung"""
+        for attempt in (1, 2):
+            try:
+                return list(self.stream_batch(vcf_lines))
+            except SnpeffError as e:
+                self.logger.warning("snpEff worker failed (attempt %d): %s" % (attempt, e))
+                if attempt == 2:
+                    raise
+
+
+# one snpEff worker per command (and mode), kept for the whole process
+# lifetime (so across hub jobs run by a pool process) until it's idle (see
+# SnpeffWorker.IDLE_TIMEOUT) or stop_snpeff_workers() is called. If the process
+# exits without it (pool processes skip atexit), snpEff gets EOF and exits too
+_snpeff_workers = {}
+
+def get_snpeff_worker(cmd, logger=logging, persistent=False):
+    key = (tuple(cmd), persistent)
+    if not key in _snpeff_workers:
+        _snpeff_workers[key] = SnpeffWorker(list(cmd), logger=logger, persistent=persistent)
+    return _snpeff_workers[key]
 
-        return hgvs_vcfs
+
+@atexit.register
+def stop_snpeff_workers():
+    for worker in _snpeff_workers.values():
+        worker.stop()
 
 
 class SnpeffAnnotator(object):
 
-    def __init__(self, cmd, logger=logging):
+    def __init__(self, cmd, logger=logging, persistent=False):
         if type(cmd) == str:
             self.snpeff_cmd = cmd.split()
         else:
             self.snpeff_cmd = cmd
         self.logger = logger
+        self.persistent = persistent
 
     def check_hgvs_info(self,hgvs_info):
         # last one should be a nucleotide
         if not re.match("[ATGC]",hgvs_info["alt"]):
             raise ValueError("Invalid nucleotide in HGVS info: %s" % repr(hgvs_info))
-        if not hgvs_info["chrom"] in [str(i) for i in range(1,23)] + ["X","Y","M"]:
+        if not hgvs_info["chrom"] in VALID_CHROMS:
             raise ValueError("Invalid chromosome in HGVS info: %s" % repr(hgvs_info))
 
-    def annotate(self,hgvs_vcfs):
-        """hgvs_vcfs: list of {"vcf": {}, "_id": ""}"""
-
-        # title of vcf
-        vcf_stdin = ['#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO']
-        for hgvs_id in hgvs_vcfs:
-            vcf = hgvs_vcfs[hgvs_id]["vcf"]
+    def vcf_lines(self,hgvs_vcfs):
+        # hgvs_vcfs items are listed first, caller may modify hgvs_vcfs
+        # while lines are generated (and sent to snpEff)
+        for hgvs_id, doc in list(hgvs_vcfs.items()):
+            vcf = doc["vcf"]
             try:
                 self.check_hgvs_info(vcf)
             except (TypeError, ValueError) as e:
-                self.logger.warning("Skipping HGVS %s: %s" % (repr(hgvs_vcfs[hgvs_id]),e))
+                self.logger.warning("Skipping HGVS %s: %s" % (repr(doc),e))
                 continue
             # add hgvs ID at the end so we can match for sure which annotations correspond to which ID 
             # instead of rebuild it from VCF info (they can be different)
             # this comment will be at the first position in the result line
-            vcf_stdin.append(str(vcf["chrom"]) + '\t' + str(vcf["position"]) + '\t' + '.' + '\t' + vcf["ref"] + '\t' + vcf["alt"] + '\t.\t.\t.' + "\t# hgvs:" + hgvs_id)
+            yield str(vcf["chrom"]) + '\t' + str(vcf["position"]) + '\t' + '.' + '\t' + vcf["ref"] + '\t' + vcf["alt"] + '\t.\t.\t.' + "\t# hgvs:" + hgvs_id
 
-        if (len(vcf_stdin) - 1) == 0:
+    def annotate(self,hgvs_vcfs):
+        """hgvs_vcfs: dict of hgvs_id => {"vcf": {}, "_id": ""}, or VCFColumns.
+        Annotations are yielded as they come out of snpEff"""
+        if len(hgvs_vcfs) == 0:
             self.logger.info("No HGVS ID as input (previously filtered out)")
             return
-        self.logger.info("Running '%s' on %d HGVS IDs" % (self.snpeff_cmd,len(vcf_stdin)-1)) # -1: header
-        proc = subprocess.Popen(self.snpeff_cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        (stdout, stderr) = proc.communicate("\n".join(vcf_stdin).encode())
-        stderr = stderr.decode()
-        # they print some news message on stderr, bad idea when we use it to detect errors.
-        # try to get rid of it
-        if "NEW VERSION!" in stderr:
-            stderr = stderr.splitlines()
-            start = stderr.index("NEW VERSION!")
-            # message is 5 lines long (hopefully..)
-            end = start + 5
-            stderr = stderr[:start] + stderr[end:]
-            # rebuild and clean any empty lines
-            stderr = "\n".join(stderr).strip()
-        if stderr != '':
+        self.logger.info("Running '%s' on %d HGVS IDs" % (self.snpeff_cmd,len(hgvs_vcfs)))
+        worker = get_snpeff_worker(self.snpeff_cmd,logger=self.logger,persistent=self.persistent)
+        try:
+            if isinstance(hgvs_vcfs,VCFColumns):
+                vcf_lines = hgvs_vcfs.vcf_lines(logger=self.logger)
+            else:
+                vcf_lines = self.vcf_lines(hgvs_vcfs)
+            for snpeff_json in self.parse_vcf_lines(worker.stream_batch(vcf_lines)):
+                yield snpeff_json
+        except SnpeffError as e:
             fn = "snpeff_err_%s.pickle" % datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            if isinstance(hgvs_vcfs,VCFColumns):
+                hgvs_vcfs = hgvs_vcfs.vcfs()
             pickle.dump({"input" : hgvs_vcfs,
-                         "vcf_stdin" : vcf_stdin,
-                         "stderr" : stderr},open(fn,"wb"))
-            raise Exception("Something went wrong while generating snpeff annotation (see dump %s for more):\n%s" % (fn,stderr))
+                         "stderr" : str(e)},open(fn,"wb"))
+            raise Exception("Something went wrong while generating snpeff annotation (see dump %s for more):\n%s" % (fn,e))
+
+    def annotate_chunks(self,chunks):
+        """chunks: iterable of VCFColumns (eg. a shard, built by chunks while
+        previous ones are annotated). All chunks go through a single snpEff
+        batch, so a single snpEff process even if worker isn't persistent.
+        Yield (chunk, list of its annotations) for each chunk, in order"""
+        # chunks whose records were sent to snpEff, their annotations come
+        # back in the same order
+        sent = queue.Queue()
+
+        def vcf_lines():
+            for cols in chunks:
+                sent.put(cols)
+                self.logger.info("Running '%s' on %d HGVS IDs" % (self.snpeff_cmd,len(cols)))
+                yield from cols.vcf_lines(logger=self.logger)
 
-        strout = stdout.decode()
-        vcf_stdout_raw = strout.splitlines()
+        worker = get_snpeff_worker(self.snpeff_cmd,logger=self.logger,persistent=self.persistent)
+        cols, ids, annots = None, (), []
+        try:
+            for annot in self.parse_vcf_lines(worker.stream_batch(vcf_lines())):
+                # annotation from next chunks, current one is done
+                while not annot["_id"] in ids:
+                    if cols is not None:
+                        yield cols, annots
+                    try:
+                        cols = sent.get_nowait()
+                    except queue.Empty:
+                        raise ValueError("Annotation for '%s' doesn't match any (remaining) HGVS ID" % annot["_id"])
+                    ids, annots = set(cols.ids), []
+                annots.append(annot)
+        except SnpeffError as e:
+            raise Exception("Something went wrong while generating snpeff annotation:\n%s" % e)
+        if cols is not None:
+            yield cols, annots
+        # remaining chunks without any annotation (all were sent once batch is done)
+        while not sent.empty():
+            yield sent.get_nowait(), []
+
+    def parse_vcf_lines(self,vcf_stdout_raw):
         for vcf_line in vcf_stdout_raw:
             if vcf_line.startswith('#'):
                 continue
             elif vcf_line == '':
                 continue
             else:
-                fromi = vcf_line.index("#")
-                str_id = vcf_line[fromi:]
-                hgvs_info = str_id.replace("#","").strip().split(":")
-                # extract HGVS
-                assert hgvs_info[0] == "hgvs", "Can't find HGVS ID in VCF line '%s'" % repr(vcf_line)
-                hgvs_id = ":".join(hgvs_info[1:])
-                # -1: remove the tab char also, before #
-                vcf_line = vcf_line[:fromi-1]
-                # assume the following item is 'ANN'
-                ann_info = vcf_line.split(';')[0]
-                ann = []
-                # Multiple annotations per VCF line
-                for item in ann_info.split(','):
-                    if len(item.split('|')) > 1:
-                        (effect, putative_impact, gene_name, gene_id, feature_type, feature_id) = item.split('|')[1:7]
-                        (transcript_biotype, exon, hgvs_coding, hgvs_protein, cdna, cds, protein, distance_to_feature) = item.split('|')[7:15]
-                        if cdna:
-                            (cdna_position, cdna_len) = cdna.split('/')
-                        else:
-                            cdna_position = None
-                            cdna_len = None
-                        if cds:
-                            (cds_position, cds_len) = cds.split('/')
-                        else:
-                            cds_position = None
-                            cds_len = None
-                        if protein:
-                            (protein_position, protein_len) = protein.split('/')
-                        else:
-                            protein_position = None
-                            protein_len = None
-                        if exon:
-                            (rank, total) = exon.split('/')
-                        else:
-                            rank = None
-                            total = None
-                        ann.append({
-                            "effect": effect,
-                            "putative_impact": putative_impact,
-                            "genename": gene_name,
-                            "gene_id": gene_id,
-                            "feature_type": feature_type,
-                            "feature_id": feature_id,
-                            "transcript_biotype": transcript_biotype,
-                            "rank": rank,
-                            "total": total,
-                            "hgvs_c": trim_delseq_from_hgvs(hgvs_coding), # trim long sequence
-                            "hgvs_p": hgvs_protein,
-                            "cdna": {
-                                "position": cdna_position,
-                                "length": cdna_len
-                            },
-                            "cds": {
-                                "position": cds_position,
-                                "length": cds_len
-                            },
-                            "protein": {
-                                "position": protein_position,
-                                "length": protein_len
-                            },
-                            "distance_to_feature": distance_to_feature
-                        })
-                # not all annotations include lof & nmd information. Set them to 'None' as default
-                lof = None
-                nmd = None
-                # the case that annotation include 'ann' & 'lof' & 'nmd'
-                if len(vcf_line.split(';')) == 3:
-                    (lof_info, nmd_info) = vcf_line.split(';')[1:3]
-                    # assume the second item is 'lof'
-                    assert lof_info.startswith('LOF')
-                    # the information to be parsed is like this: 'LOF=(PTEN|PTEN|1|1.00)'
-                    lof_info = lof_info.split('(')[1].split(')')[0]
-                    nmd_info = nmd_info.split('(')[1].split(')')[0]
-                    (id_lof, name_lof, nt_lof, pt_lof) = lof_info.split('|')
-                    (id_nmd, name_nmd, nt_nmd, pt_nmd) = nmd_info.split('|')
-                    lof = {
-                        "gene_id": id_lof,
-                        "genename": name_lof,
-                        "number_of_transcripts_in_gene": nt_lof,
-                        "percent_of_transcripts_affected": pt_lof
-                    }
-                    nmd = {
-                        "gene_id": id_nmd,
-                        "genename": name_nmd,
-                        "number_of_transcripts_in_gene": nt_nmd,
-                        "percent_of_transcripts_affected": pt_nmd
-                    }
-                # the case that annotation include 'ann' & 'lof or nmd'
-                elif len(vcf_line.split(';')) == 2:
-                    (ann_info, idk_info) = vcf_line.split(';')
-                    if idk_info.startswith('LOF'):
-                        lof_info = idk_info.split('(')[1].split(')')[0]
-                        (id_lof, name_lof, nt_lof, pt_lof) = lof_info.split('|')
-                        lof = {
-                            "gene_id": id_lof,
-                            "genename": name_lof,
-                            "number_of_transcripts_in_gene": nt_lof,
-                            "percent_of_transcripts_affected": pt_lof
-                        }
-                    else:
-                        nmd_info = idk_info.split('(')[1].split(')')[0]
-                        (id_nmd, name_nmd, nt_nmd, pt_nmd) = nmd_info.split('|')
-                        nmd = {
-                            "gene_id": id_nmd,
-                            "genename": name_nmd,
-                            "number_of_transcripts_in_gene": nt_nmd,
-                            "percent_of_transcripts_affected": pt_nmd
-                        }
-                (chrom, pos, _id, ref, alt) = ann_info.split('\t')[0:5]
-                one_snp_json = {
-                    "_id": hgvs_id,
-                    "snpeff": {
-                        "ann": ann,
-                        "lof": lof,
-                        "nmd": nmd,
-                    },
-                }
-                snpeff_json = dict_sweep(unlist(one_snp_json), vals=['', None])
+                yield parse_vcf_line(vcf_line)
 
-                yield snpeff_json
+
+# ANN sub-fields (after allele), as named in documents. Values are kept as
+# strings, "a/b" fields are split into a dict
+ANN_FIELDS = ("effect", "putative_impact", "genename", "gene_id", "feature_type",
+              "feature_id", "transcript_biotype")
+ANN_RATIO_FIELDS = (("cdna", "position", "length"), ("cds", "position", "length"),
+                    ("protein", "position", "length"))
+LOF_NMD_FIELDS = ("gene_id", "genename", "number_of_transcripts_in_gene", "percent_of_transcripts_affected")
+
+
+def _parse_lof_nmd(info):
+    # eg. 'LOF=(PTEN|PTEN|1|1.00)', only first gene is kept
+    values = info.split('(', 2)[1].split(')', 1)[0].split('|')
+    if len(values) != 4:
+        raise ValueError("Invalid LOF/NMD info %s" % repr(info))
+    return {k: v for k, v in zip(LOF_NMD_FIELDS, values) if v}
+
+
+def parse_vcf_line(vcf_line):
+    '''parse one snpEff output record (ANN, LOF and NMD INFO fields), return
+       {"_id": hgvs_id, "snpeff": {...}} document, already cleaned (no empty
+       values, single annotation not in a list), in one pass over the line'''
+    fromi = vcf_line.index("#")
+    # "# hgvs:chr1:g.123A>C" comment added to input record
+    hgvs = vcf_line[fromi:].replace("#", "").strip()
+    assert hgvs[:5] == "hgvs:" or hgvs == "hgvs", "Can't find HGVS ID in VCF line '%s'" % repr(vcf_line)
+    hgvs_id = hgvs[5:]
+    # -1: remove the tab char also, before #
+    infos = vcf_line[:fromi-1].split(';')
+    ann = []
+    # Multiple annotations per VCF line, first one starts with other VCF columns
+    for item in infos[0].split(','):
+        fields = item.split('|')
+        if len(fields) < 2:
+            continue
+        if len(fields) < 15:
+            raise ValueError("Invalid ANN field %s" % repr(item))
+        doc = {k: v for k, v in zip(ANN_FIELDS, fields[1:8]) if v}
+        if fields[8]:
+            rank, total = fields[8].split('/')
+            if rank:
+                doc["rank"] = rank
+            if total:
+                doc["total"] = total
+        if fields[9]:
+            hgvs_c = trim_delseq_from_hgvs(fields[9])
+            if hgvs_c:
+                doc["hgvs_c"] = hgvs_c
+        if fields[10]:
+            doc["hgvs_p"] = fields[10]
+        for (key, k1, k2), value in zip(ANN_RATIO_FIELDS, fields[11:14]):
+            if value:
+                v1, v2 = value.split('/')
+                ratio = {k: v for k, v in ((k1, v1), (k2, v2)) if v}
+                if ratio:
+                    doc[key] = ratio
+        if fields[14]:
+            doc["distance_to_feature"] = fields[14]
+        ann.append(doc)
+    snpeff = {}
+    if ann:
+        snpeff["ann"] = ann[0] if len(ann) == 1 else ann
+    # LOF and/or NMD, only when there's nothing else in INFO
+    if len(infos) == 3:
+        assert infos[1].startswith('LOF')
+        lof, nmd = _parse_lof_nmd(infos[1]), _parse_lof_nmd(infos[2])
+    elif len(infos) == 2:
+        lof, nmd = (_parse_lof_nmd(infos[1]), None) if infos[1].startswith('LOF') else (None, _parse_lof_nmd(infos[1]))
+    else:
+        lof = nmd = None
+    if lof:
+        snpeff["lof"] = lof
+    if nmd:
+        snpeff["nmd"] = nmd
+    doc = {"_id": hgvs_id}
+    if snpeff:
+        doc["snpeff"] = snpeff
+    return doc
+
+
+def reference_parse_vcf_line(vcf_line):
+    '''original (slow) snpEff output record parser, kept as a reference for
+       parse_vcf_line() (see bin/bench_snpeff_parser.py)'''
+    fromi = vcf_line.index("#")
+    str_id = vcf_line[fromi:]
+    hgvs_info = str_id.replace("#","").strip().split(":")
+    # extract HGVS
+    assert hgvs_info[0] == "hgvs", "Can't find HGVS ID in VCF line '%s'" % repr(vcf_line)
+    hgvs_id = ":".join(hgvs_info[1:])
+    # -1: remove the tab char also, before #
+    vcf_line = vcf_line[:fromi-1]
+    # assume the following item is 'ANN'
+    ann_info = vcf_line.split(';')[0]
+    ann = []
+    # Multiple annotations per VCF line
+    for item in ann_info.split(','):
+        if len(item.split('|')) > 1:
+            (effect, putative_impact, gene_name, gene_id, feature_type, feature_id) = item.split('|')[1:7]
+            (transcript_biotype, exon, hgvs_coding, hgvs_protein, cdna, cds, protein, distance_to_feature) = item.split('|')[7:15]
+            if cdna:
+                (cdna_position, cdna_len) = cdna.split('/')
+            else:
+                cdna_position = None
+                cdna_len = None
+            if cds:
+                (cds_position, cds_len) = cds.split('/')
+            else:
+                cds_position = None
+                cds_len = None
+            if protein:
+                (protein_position, protein_len) = protein.split('/')
+            else:
+                protein_position = None
+                protein_len = None
+            if exon:
+                (rank, total) = exon.split('/')
+            else:
+                rank = None
+                total = None
+            ann.append({
+                "effect": effect,
+                "putative_impact": putative_impact,
+                "genename": gene_name,
+                "gene_id": gene_id,
+                "feature_type": feature_type,
+                "feature_id": feature_id,
+                "transcript_biotype": transcript_biotype,
+                "rank": rank,
+                "total": total,
+                "hgvs_c": trim_delseq_from_hgvs(hgvs_coding), # trim long sequence
+                "hgvs_p": hgvs_protein,
+                "cdna": {
+                    "position": cdna_position,
+                    "length": cdna_len
+                },
+                "cds": {
+                    "position": cds_position,
+                    "length": cds_len
+                },
+                "protein": {
+                    "position": protein_position,
+                    "length": protein_len
+                },
+                "distance_to_feature": distance_to_feature
+            })
+    # not all annotations include lof & nmd information. Set them to 'None' as default
+    lof = None
+    nmd = None
+    # the case that annotation include 'ann' & 'lof' & 'nmd'
+    if len(vcf_line.split(';')) == 3:
+        (lof_info, nmd_info) = vcf_line.split(';')[1:3]
+        # assume the second item is 'lof'
+        assert lof_info.startswith('LOF')
+        # the information to be parsed is like this: 'LOF=(PTEN|PTEN|1|1.00)'
+        lof_info = lof_info.split('(')[1].split(')')[0]
+        nmd_info = nmd_info.split('(')[1].split(')')[0]
+        (id_lof, name_lof, nt_lof, pt_lof) = lof_info.split('|')
+        (id_nmd, name_nmd, nt_nmd, pt_nmd) = nmd_info.split('|')
+        lof = {
+            "gene_id": id_lof,
+            "genename": name_lof,
+            "number_of_transcripts_in_gene": nt_lof,
+            "percent_of_transcripts_affected": pt_lof
+        }
+        nmd = {
+            "gene_id": id_nmd,
+            "genename": name_nmd,
+            "number_of_transcripts_in_gene": nt_nmd,
+            "percent_of_transcripts_affected": pt_nmd
+        }
+    # the case that annotation include 'ann' & 'lof or nmd'
+    elif len(vcf_line.split(';')) == 2:
+        (ann_info, idk_info) = vcf_line.split(';')
+        if idk_info.startswith('LOF'):
+            lof_info = idk_info.split('(')[1].split(')')[0]
+            (id_lof, name_lof, nt_lof, pt_lof) = lof_info.split('|')
+            lof = {
+                "gene_id": id_lof,
+                "genename": name_lof,
+                "number_of_transcripts_in_gene": nt_lof,
+                "percent_of_transcripts_affected": pt_lof
+            }
+        else:
+            nmd_info = idk_info.split('(')[1].split(')')[0]
+            (id_nmd, name_nmd, nt_nmd, pt_nmd) = nmd_info.split('|')
+            nmd = {
+                "gene_id": id_nmd,
+                "genename": name_nmd,
+                "number_of_transcripts_in_gene": nt_nmd,
+                "percent_of_transcripts_affected": pt_nmd
+            }
+    (chrom, pos, _id, ref, alt) = ann_info.split('\t')[0:5]
+    one_snp_json = {
+        "_id": hgvs_id,
+        "snpeff": {
+            "ann": ann,
+            "lof": lof,
+            "nmd": nmd,
+        },
+    }
+    snpeff_json = dict_sweep(unlist(one_snp_json), vals=['', None])
+    return snpeff_json
@@ -17,11 +17,20 @@ class SnpeffBaseUploader(uploader.NoDataSourceUploader):
         self.logger.info("Skip Snpeff data load (it's a post-process)")
         return {}
 
+    def post_update_data(self, steps, force, batch_size, job_manager, **kwargs):
+        # filter of annotated IDs saved by other sources' snpeff step can't
+        # be trusted anymore
+        from hub.dataload.uploader import invalidate_id_filter
+        invalidate_id_filter(self.name)
+
     @classmethod
     def get_mapping(klass):
         mapping = {
             "snpeff": {
                 "properties": {
+                    "version": {
+                        "type": "keyword"
+                    },
                     "ann": {
                         "properties": {
                             "effect": {
@@ -1,127 +1,455 @@
-import glob, os, math, asyncio
+import os, math, asyncio, time, queue, threading
+import concurrent.futures
+import numpy as np
 from functools import partial
 
 import biothings.hub.dataload.uploader as uploader
 from biothings.hub.dataload.storage import UpsertStorage
 from biothings.utils.mongo import doc_feeder, id_feeder
 import biothings.utils.mongo as mongo
-from biothings.utils.common import iter_n
 from biothings.utils.dataload import dict_attrmerge
 
 import hub.dataload.sources.snpeff.snpeff_upload as snpeff_upload
 import hub.dataload.sources.snpeff.snpeff_parser as snpeff_parser
-from utils.hgvs import get_pos_start_end
-from config import MAX_REF_ALT_LEN
+from hub.dataload.sources.snpeff.snpeff_models import load_changes, select_ids, CHANGES_FILENAME
+from utils.hgvs import VariantKeyCodec
+from utils.idfilter import IdFilter, build_collection_filter
+from config import MAX_REF_ALT_LEN, GENOME_STORES, RSID_INDEX_PATH, CACHE_FOLDER, \
+                   SNPEFF_PERSISTENT_WORKER, HUB_MAX_WORKERS
+
+# memory used by snpEff JVM (see -Xmx in snpeff command), per annotation worker
+SNPEFF_JVM_MEM = 4 * 1024**3
+
 
 class SnpeffPostUpdateUploader(uploader.BaseSourceUploader):
 
     keep_archive = 1
 
     SNPEFF_BATCH_SIZE = 1000000
+    # IDs are sharded by chromosome, each shard is annotated by batches of
+    # SNPEFF_SHARD_SIZE IDs, in its own process
+    SNPEFF_SHARD_SIZE = 200000
+    # in pipelined mode (default for all snpeff annotations), shard batches are
+    # split in chunks going through construct => annotate => store stages
+    SNPEFF_PIPELINED = True
+    SNPEFF_CHUNK_SIZE = 10000
+    # annotated docs sent to storage by batches of that size (independent
+    # from SNPEFF_BATCH_SIZE, so memory doesn't grow with ID batches)
+    SNPEFF_STORAGE_BATCH_SIZE = 10000
 
-    def get_pinfo(self):
-        pinfo = super(SnpeffPostUpdateUploader,self).get_pinfo()
-        # mem depends in the batch size and doc size, but snpeff consumes a lot
-        # (here, asumming 1 doc will weigh 1kB)
-        pinfo.setdefault("__reqs__",{})["mem"] = (self.__class__.SNPEFF_BATCH_SIZE/100000.) * (1024**3)
-        return pinfo
+    def get_genome_store(self):
+        '''return genome store folder used to normalize indels for this
+           source's assembly (see config.GENOME_STORES), or None'''
+        return GENOME_STORES.get(self.__metadata__.get("assembly"))
 
-    def do_snpeff(self, batch_size=SNPEFF_BATCH_SIZE, force=False, force_use_cache=False):
+    def get_rsid_index(self, dbsnp_name="dbsnp_hg19"):
+        '''return folder of rsID index built from dbsnp_name collection
+           (see utils.rsid_index), or None if it doesn't exist'''
+        folder = os.path.join(RSID_INDEX_PATH, dbsnp_name)
+        return folder if os.path.exists(os.path.join(folder, "index.json")) else None
+
+    def get_id_filter(self, col):
+        return get_id_filter(col,logger=self.logger)
+
+    def do_snpeff(self, batch_size=SNPEFF_BATCH_SIZE, force=False, force_use_cache=False,
+                  job_manager=None, shard_size=SNPEFF_SHARD_SIZE, pipelined=SNPEFF_PIPELINED):
         self.logger.info("Updating snpeff information from source '%s' (collection:%s)" % (self.fullname,self.collection_name))
-        # select Snpeff uploader to get collection name and src_dump _id
-        version = self.__class__.__metadata__["assembly"]
-        snpeff_class = getattr(snpeff_upload,"Snpeff%sUploader" % version.capitalize())
-        snpeff_main_source = snpeff_class.main_source
-        snpeff_doc = self.src_dump.find_one({"_id" : snpeff_main_source})
-        assert snpeff_doc, "No snpeff information found, has it been dumped & uploaded ?"
-        snpeff_dir = snpeff_doc["download"]["data_folder"]
-        # -q: when there's an update, there's a message on stderr....
-        cmd = "java -Xmx4g -jar %s/snpEff/snpEff.jar -t -noStats -noExpandIUB %s" % (snpeff_dir,version)
-        # genome files are in "data_folder"/../data
-        genomes = glob.glob(os.path.join(snpeff_dir,"%s_genome.*" % version))
-        assert len(genomes) == 1, "Expected only one genome files for '%s', got: %s" % (version,genomes)
-        genome = genomes[0]
-        annotator = snpeff_parser.SnpeffAnnotator(cmd,logger=self.logger)
-        vcf_builder = snpeff_parser.VCFConstruct(genome,logger=self.logger)
-        storage = UpsertStorage(None,snpeff_class.name,self.logger)
-        col = self.db[self.collection_name]
-        total = math.ceil(col.count()/batch_size)
+        params = get_snpeff_params(self.__class__.__metadata__["assembly"],self.src_dump)
+        # IDs already having snpeff annotations
+        annotated = None if force else self.get_id_filter(self.db[params["name"]])
+        planner = SnpeffPlanner(params,annotated=annotated,job_manager=job_manager,pinfo=self.get_pinfo(),
+                                batch_size=batch_size,shard_size=shard_size,pipelined=pipelined,
+                                logger=self.logger)
+        planner.add_collection(self.db[self.collection_name],force_use_cache=force_use_cache)
+        planner.finish()
+
+    def post_update_data(self, steps, force, batch_size, job_manager, **kwargs):
+        # this one will run in current thread, annotation jobs are sent to
+        # job_manager (one process each), and waited for from here
+        force_use_cache = kwargs.get("force_use_cache",False)
+        self.do_snpeff(force=force,force_use_cache=force_use_cache,job_manager=job_manager)
+
+
+def get_snpeff_params(assembly, src_dump=None):
+    '''return parameters (picklable) needed by snpeff_shard_worker() for assembly'''
+    # select Snpeff uploader to get collection name and src_dump _id
+    snpeff_class = getattr(snpeff_upload,"Snpeff%sUploader" % assembly.capitalize())
+    snpeff_main_source = snpeff_class.main_source
+    src_dump = src_dump or mongo.get_src_dump()
+    snpeff_doc = src_dump.find_one({"_id" : snpeff_main_source})
+    assert snpeff_doc, "No snpeff information found, has it been dumped & uploaded ?"
+    snpeff_dir = snpeff_doc["download"]["data_folder"]
+    # -q: when there's an update, there's a message on stderr....
+    cmd = "java -Xmx4g -jar %s/snpEff/snpEff.jar -t -noStats -noExpandIUB %s" % (snpeff_dir,assembly)
+    # genome store is in "data_folder" (see SnpeffDumper.post_dump)
+    genome = os.path.join(snpeff_dir,"%s_genome.store" % assembly)
+    assert os.path.exists(genome), "Expected genome store for '%s' in %s" % (assembly,genome)
+    return {"name" : snpeff_class.name, "cmd" : cmd, "genome" : genome, "assembly" : assembly,
+            "folder" : snpeff_dir, "version" : snpeff_doc["download"].get("release")}
+
+
+def get_id_signature(col):
+    '''return count and _id bounds of col, used to tell if an IdFilter saved
+       for col is still up-to-date (count alone doesn't change when IDs are
+       replaced, eg. collection re-created)'''
+    first = col.find_one({},{"_id" : 1},sort=[("_id",1)])
+    last = col.find_one({},{"_id" : 1},sort=[("_id",-1)])
+    return {"count" : col.count(), "min_id" : first and first["_id"], "max_id" : last and last["_id"]}
+
+
+def get_id_filter(col, logger=None):
+    '''return an IdFilter for col's _ids. It's saved in cache folder (next
+       to ID cache) and reused as long as collection signature (see
+       get_id_signature()) doesn't change'''
+    path = id_filter_path(col.name)
+    signature = get_id_signature(col)
+    filt = path and IdFilter.load(path)
+    if filt is not None and filt.meta.get("signature") == signature:
+        logger and logger.info("Using ID filter for '%s' (%d IDs)" % (col.name,len(filt)))
+        return filt
+    logger and logger.info("Building ID filter for '%s'" % col.name)
+    filt = build_collection_filter(col,logger=logger)
+    path and filt.save(path,signature=signature)
+    return filt
+
+
+class SnpeffPlanner(object):
+    '''Collect IDs to annotate with snpeff, skip the ones already annotated
+       (and, if dedup, the ones already collected, when IDs come from several
+       collections), and annotate them by chromosome shards, each shard batch
+       being sent to job_manager as a process job (or annotated in current
+       process if no job_manager). If pipelined, each job runs VCF construction,
+       snpEff annotation and storage as concurrent stages'''
+
+    def __init__(self, params, annotated=None, job_manager=None, pinfo=None, dedup=False,
+                 batch_size=SnpeffPostUpdateUploader.SNPEFF_BATCH_SIZE,
+                 shard_size=SnpeffPostUpdateUploader.SNPEFF_SHARD_SIZE,
+                 pipelined=SnpeffPostUpdateUploader.SNPEFF_PIPELINED, logger=None):
+        self.params = params
+        self.annotated = annotated
+        self.job_manager = job_manager
+        self.pinfo = pinfo or {"category" : "snpeff", "source" : None, "step" : "", "description" : ""}
+        self.batch_size = batch_size
+        self.shard_size = shard_size
+        self.pipelined = pipelined
+        self.logger = logger or snpeff_parser.logging
+        # IDs collected so far, exact (Bloom filter part is useless here)
+        self.planned = IdFilter.from_ids([],bits_per_key=0,num_hashes=0) if dedup else None
+        # IDs waiting to be processed, per chromosome, are kept as packed keys, not strings
+        self.shards = {}
+        self.jobs = []
+        # one job per hub worker process, plus one waiting for each
+        self.max_jobs = HUB_MAX_WORKERS * 2
+        # jobs whose memory requirements included a snpEff JVM
+        self.jvms = 0
+        self.stats = {"seen" : 0, "already_annotated" : 0, "duplicated" : 0,
+                      "planned" : 0, "annotated" : 0, "jobs" : 0, "stages" : {}}
+
+    def get_pinfo(self, chrom, size):
+        pinfo = dict(self.pinfo)
+        pinfo["step"] = "snpeff"
+        pinfo["description"] = "chr%s (%d IDs)" % (chrom,size)
+        # VCF info kept for the whole shard batch (asumming 512B per ID), plus
+        # one storage batch of docs (1kB each): annotations are streamed from
+        # snpeff to storage
+        mem = size * 512 + SnpeffPostUpdateUploader.SNPEFF_STORAGE_BATCH_SIZE * 1024
+        # plus snpEff JVM: a persistent one is kept by each pool process across
+        # jobs, so it's counted for the first jobs only (one per process)
+        if not SNPEFF_PERSISTENT_WORKER or self.jvms < HUB_MAX_WORKERS:
+            mem += SNPEFF_JVM_MEM
+            self.jvms += 1
+        pinfo["__reqs__"] = dict(pinfo.get("__reqs__",{}),mem=mem)
+        return pinfo
+
+    def collect(self, res):
+        self.stats["annotated"] += len(res["ids"])
+        for name,stage in res.get("stages",{}).items():
+            total = self.stats["stages"].setdefault(name,{})
+            for k,v in stage.items():
+                total[k] = total.get(k,0) + v
+        if self.annotated is not None:
+            self.annotated.update(res["ids"])
+
+    def dispatch(self, chrom):
+        codec, keys, size = self.shards.pop(chrom)
+        ids = codec.decode_many(np.concatenate(keys))
+        self.stats["jobs"] += 1
+        self.logger.info("Annotating %d documents from chr%s (job #%d)" % (size,chrom,self.stats["jobs"]))
+        func = partial(snpeff_shard_worker,self.params,ids,pipelined=self.pipelined)
+        if self.job_manager is None:
+            self.collect(func())
+            return
+        # don't read further while too many jobs are waiting
+        while len(self.jobs) >= self.max_jobs:
+            done, _ = concurrent.futures.wait(self.jobs,return_when=concurrent.futures.FIRST_COMPLETED)
+            for fut in done:
+                self.jobs.remove(fut)
+                self.collect(fut.result())
+        self.jobs.append(asyncio.run_coroutine_threadsafe(
+                defer_and_wait(self.job_manager,self.get_pinfo(chrom,size),func),self.job_manager.loop))
+
+    def add(self, ids):
+        '''collect ids to annotate, dispatching shard batches when full'''
+        self.stats["seen"] += len(ids)
+        # don't re-compute annotations if already there
+        for name,filt in (("already_annotated",self.annotated),("duplicated",self.planned)):
+            if filt is not None:
+                found = filt.contains_many(ids).tolist()
+                newids = [_id for _id,isin in zip(ids,found) if not isin]
+                self.stats[name] += len(ids) - len(newids)
+                ids = newids
+        if self.planned is not None:
+            self.planned.update(ids)
+        self.stats["planned"] += len(ids)
+        by_chrom = {}
+        for _id in ids:
+            by_chrom.setdefault(_id[3:_id.find(":")],[]).append(_id)
+        for chrom,chrom_ids in by_chrom.items():
+            shard = self.shards.setdefault(chrom,[VariantKeyCodec(),[],0])
+            shard[1].append(shard[0].encode_many(chrom_ids))
+            shard[2] += len(chrom_ids)
+            if shard[2] >= self.shard_size:
+                self.dispatch(chrom)
+
+    def add_collection(self, col, force_use_cache=False):
+        total = math.ceil(col.count()/self.batch_size)
         cnt = 0
-        to_process = []
-
-        def process(ids):
-            self.logger.info("%d documents to annotate" % len(ids))
-            hgvs_vcfs = vcf_builder.build_vcfs(ids)
-            # merge "vcf" and snpeff annotations keys when possible
-            # (it no snpeff data, we keep 'vcf' data)
-            for annot in annotator.annotate(hgvs_vcfs):
-                hgvs_vcfs[annot["_id"]].update(annot)
-            # trim if sequence is to big
-            for _id in hgvs_vcfs:
-                vcf = hgvs_vcfs[_id]
-                for k in ["alt","ref"]:
-                    if len(vcf["vcf"][k]) > MAX_REF_ALT_LEN:
-                        msg = "...(trimmed)"
-                        vcf["vcf"][k] = vcf["vcf"][k][:MAX_REF_ALT_LEN - len(msg)] + msg
-                hgvs_vcfs[_id] = vcf
-
-            data = annotate_start_end(hgvs_vcfs,version)
-            howmany = storage.process(data, batch_size)
-            if howmany:
-                # we need to update some metadata info about snpeff b/c data has changed
-                # so cache could be invalid
-                self.logger.debug("Invalidating cache for '%s'" % snpeff_class.name)
-                mongo.invalidate_cache(snpeff_class.name)
-
-        for ids in id_feeder(col, batch_size=batch_size, logger=self.logger, force_use=force_use_cache):
+        for ids in id_feeder(col, batch_size=self.batch_size, logger=self.logger, force_use=force_use_cache):
             cnt += 1
-            self.logger.debug("Processing batch %s/%s [%.1f]" % (cnt,total,(cnt/total*100)))
-            # don't re-compute annotations if already there
-            if not force:
-                for subids in iter_n(ids,10000):
-                    cur = storage.temp_collection.find({'_id' : {'$in' : subids}},{'_id':1})
-                    already_ids = [d["_id"] for d in list(cur)]
-                    newids = list(set(subids).difference(set(already_ids)))
-                    if len(subids) != len(newids):
-                        self.logger.debug("%d documents already have snpeff annotations, skip them" % \
-                                (len(subids) - len(newids)))
-                    to_process.extend(newids)
-                    self.logger.debug("Batch filled %d out of %d" % (len(to_process),batch_size))
-                    if not (len(to_process) >= batch_size):
-                        # can fill more...
-                        continue
-                    process(to_process)
-                    to_process = []
-            else:
-                to_process = ids
+            self.logger.debug("Processing batch %s/%s [%.1f] from '%s'" % (cnt,total,(cnt/total*100),col.name))
+            self.add(ids)
+
+    def finish(self):
+        '''annotate remaining IDs, wait for all jobs, save the annotated IDs
+           filter and return stats'''
         # for potential remainings
-        if to_process:
-            process(to_process)
+        for chrom in list(self.shards):
+            self.dispatch(chrom)
+        for fut in concurrent.futures.as_completed(self.jobs):
+            self.collect(fut.result())
+        self.jobs = []
+        self.logger.info("%d documents annotated in %d jobs" % (self.stats["annotated"],self.stats["jobs"]))
+        if self.stats["stages"]:
+            self.logger.info("Pipeline stages (all jobs):\n%s" % format_stages(self.stats["stages"]))
+        path = id_filter_path(self.params["name"])
+        if self.annotated is not None and path:
+            self.annotated.save(path,signature=get_id_signature(mongo.get_src_db()[self.params["name"]]))
+        return self.stats
+
+
+def upgrade_snpeff(assembly, job_manager=None, batch_size=SnpeffPostUpdateUploader.SNPEFF_BATCH_SIZE,
+                   shard_size=SnpeffPostUpdateUploader.SNPEFF_SHARD_SIZE, force_use_cache=False,
+                   pipelined=SnpeffPostUpdateUploader.SNPEFF_PIPELINED, logger=None):
+    '''after a snpEff database upgrade, annotate again variants from snpeff
+       collection falling in intervals where gene/transcript models changed
+       (see snpeff_models, changes are computed by SnpeffDumper). Return stats'''
+    logger = logger or snpeff_parser.logging
+    params = get_snpeff_params(assembly)
+    changes = load_changes(os.path.join(params["folder"],CHANGES_FILENAME % assembly))
+    if changes is None:
+        raise Exception("No snpeff models changes found in '%s', " % params["folder"] + \
+                        "can't upgrade, run snpeff with force=True instead")
+    intervals, meta = changes
+    logger.info("Upgrading snpeff annotations from release '%s' to '%s' (%d changed intervals, %dbp)" % \
+            (meta.get("previous_release"),params["version"],sum(len(iv[0]) for iv in intervals.values()),meta["length"]))
+    col = mongo.get_src_db()[params["name"]]
+    # annotations are replaced, no ID filter needed
+    planner = SnpeffPlanner(params,job_manager=job_manager,
+                            pinfo={"category" : "snpeff", "source" : params["name"], "step" : "", "description" : ""},
+                            batch_size=batch_size,shard_size=shard_size,pipelined=pipelined,logger=logger)
+    total = 0
+    for ids in id_feeder(col, batch_size=batch_size, logger=logger, force_use=force_use_cache):
+        total += len(ids)
+        planner.add(select_ids(ids,intervals))
+    stats = planner.finish()
+    stats["total"] = total
+    logger.info("snpeff upgrade: %d out of %d annotations computed again (%.1f%%)" % \
+            (stats["planned"],total,total and stats["planned"]/total*100 or 0.0))
+    return stats
+
+
+@asyncio.coroutine
+def defer_and_wait(job_manager, pinfo, func):
+    job = yield from job_manager.defer_to_process(pinfo,func)
+    res = yield from job
+    return res
 
-    def post_update_data(self, steps, force, batch_size, job_manager, **kwargs):
-        # this one will run in current thread, snpeff java prg will
-        # multiprocess itself, no need to do more
-        force_use_cache = kwargs.get("force_use_cache",False)
-        self.do_snpeff(force=force,force_use_cache=force_use_cache)
 
+def annotate_ids(ids, annotator, vcf_builder, storage, assembly, version=None,
+                 storage_batch_size=SnpeffPostUpdateUploader.SNPEFF_STORAGE_BATCH_SIZE):
+    '''build VCF info for ids, annotate them with snpeff and store them (by
+       batches of storage_batch_size docs), recording snpeff version in annotations.
+       Return list of stored IDs and the number of docs stored'''
+    # one pass: VCF info is built as columns (sequences extracted in bulk),
+    # docs (trimmed VCF info, start/end) are built while annotations are
+    # streamed from snpEff and merged, then sent to storage
+    cols = vcf_builder.build_columns(ids,max_len=MAX_REF_ALT_LEN)
 
-def annotate_start_end(hgvs_vcfs, assembly):
-    for hgvs_id in hgvs_vcfs:
-        st,end = None,None
-        doc = hgvs_vcfs[hgvs_id]
-        if 'vcf' in doc:
-            # remove chrom, not needed
-            doc['vcf'].pop('chrom',None)
+    def annotations():
+        for annot in annotator.annotate(cols):
+            if version and "snpeff" in annot:
+                annot["snpeff"]["version"] = version
+            yield annot
+
+    howmany = storage.process(cols.docs(annotations(),assembly), storage_batch_size)
+    return cols.ids, howmany
+
+
+def annotate_ids_pipelined(ids, annotator, vcf_builder, storage, assembly, version=None,
+                           chunk_size=SnpeffPostUpdateUploader.SNPEFF_CHUNK_SIZE, queue_size=2, logger=None):
+    '''same as annotate_ids() but ids are processed by chunks going through
+       3 stages, each in its own thread, connected by bounded queues:
+       construct (VCF info) => annotate (snpEff, all chunks streamed to one
+       snpEff process) => store (calling thread,
+       storage batches are chunks, so storing overlaps the other stages).
+       Throughput is the one of the slowest stage, not the sum of all of them.
+       Return stored IDs, number of docs stored and per stage stats'''
+    logger = logger or snpeff_parser.logging
+    stages = {name : {"items" : 0, "busy" : 0.0, "wait" : 0.0} for name in ("construct","annotate","store")}
+    nb_chunks = math.ceil(len(ids)/chunk_size)
+    cols_q = queue.Queue(maxsize=queue_size)
+    docs_q = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors = []
+    built_ids = []
+    done = object()
+
+    def put(q, item):
+        # don't block forever if downstream stage failed
+        while not stop.is_set():
             try:
-                st, end = get_pos_start_end(
-                                chr=None, # not even used in func
-                                pos=doc['vcf']['position'],
-                                ref=doc['vcf']['ref'],
-                                alt=doc['vcf']['alt'])
-                if st and end:
-                    doc[assembly] = {"start": st, "end": end}
-            except Exception as e:
+                q.put(item,timeout=1)
+                return
+            except queue.Full:
                 pass
 
-        yield doc
+    def get(q, name):
+        t0 = time.time()
+        try:
+            while not stop.is_set():
+                try:
+                    return q.get(timeout=1)
+                except queue.Empty:
+                    pass
+            return done
+        finally:
+            stages[name]["wait"] += time.time() - t0
+
+    def construct():
+        try:
+            for i in range(0,len(ids),chunk_size):
+                t0 = time.time()
+                cols = vcf_builder.build_columns(ids[i:i+chunk_size],max_len=MAX_REF_ALT_LEN)
+                stages["construct"]["busy"] += time.time() - t0
+                stages["construct"]["items"] += len(cols)
+                put(cols_q,cols)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            put(cols_q,done)
+
+    def chunks():
+        # read by snpEff worker's writer thread, as snpEff consumes records
+        while True:
+            cols = get(cols_q,"annotate")
+            if cols is done:
+                return
+            yield cols
+
+    def annotate():
+        try:
+            # all chunks go through one snpEff batch (a snpEff process per
+            # chunk otherwise, when worker isn't persistent)
+            t0, wait0 = time.time(), stages["annotate"]["wait"]
+            for cols, annots in annotator.annotate_chunks(chunks()):
+                docs = []
+                for doc in cols.docs(annots,assembly):
+                    if version and "snpeff" in doc:
+                        doc["snpeff"]["version"] = version
+                    docs.append(doc)
+                # waiting for constructed chunks isn't busy time
+                stages["annotate"]["busy"] += time.time() - t0 - (stages["annotate"]["wait"] - wait0)
+                stages["annotate"]["items"] += len(docs)
+                put(docs_q,(cols.ids,docs))
+                t0, wait0 = time.time(), stages["annotate"]["wait"]
+        except Exception as e:
+            errors.append(e)
+        finally:
+            put(docs_q,done)
+
+    def stored():
+        cnt = 0
+        t0 = time.time()
+        while True:
+            t1 = time.time()
+            item = get(docs_q,"store")
+            t0 += time.time() - t1
+            if item is done:
+                break
+            chunk_ids, docs = item
+            cnt += 1
+            built_ids.extend(chunk_ids)
+            yield from docs
+            stages["store"]["items"] += len(docs)
+            logger.debug("Pipeline chunk %d/%d:\n%s" % (cnt,nb_chunks,format_stages(stages)))
+        stages["store"]["busy"] += time.time() - t0
+
+    threads = [threading.Thread(target=construct,daemon=True),threading.Thread(target=annotate,daemon=True)]
+    for thread in threads:
+        thread.start()
+    try:
+        howmany = storage.process(stored(),chunk_size)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    if errors:
+        raise errors[0]
+    return built_ids, howmany, stages
+
+
+def format_stages(stages):
+    '''return a report of pipeline stages stats, one line per stage'''
+    lines = []
+    for name,stage in stages.items():
+        rate = stage["busy"] and stage["items"]/stage["busy"] or 0
+        lines.append("  %-10s %10d items, busy %8.1fs (%.0f items/s), waiting %8.1fs" % \
+                (name,stage["items"],stage["busy"],rate,stage["wait"]))
+    return "\n".join(lines)
+
+
+def snpeff_shard_worker(params, ids, pipelined=SnpeffPostUpdateUploader.SNPEFF_PIPELINED):
+    '''annotate ids (all from same chromosome) and store them in snpeff
+       collection, params coming from get_snpeff_params(). Runs in a hub pool
+       process, persistent snpEff worker (and its JVM) is kept there for next
+       jobs (see snpeff_parser.get_snpeff_worker())'''
+    logger = snpeff_parser.logging
+    annotator = snpeff_parser.SnpeffAnnotator(params["cmd"],logger=logger,
+                                              persistent=SNPEFF_PERSISTENT_WORKER)
+    vcf_builder = snpeff_parser.VCFConstruct(params["genome"],logger=logger)
+    storage = UpsertStorage(None,params["name"],logger)
+    stages = {}
+    if pipelined:
+        built_ids, howmany, stages = annotate_ids_pipelined(ids,annotator,vcf_builder,storage,params["assembly"],
+                                                            version=params.get("version"),logger=logger)
+        logger.info("Pipeline stages:\n%s" % format_stages(stages))
+    else:
+        built_ids, howmany = annotate_ids(ids,annotator,vcf_builder,storage,params["assembly"],
+                                         version=params.get("version"))
+    if howmany:
+        # we need to update some metadata info about snpeff b/c data has changed
+        # so cache could be invalid
+        mongo.invalidate_cache(params["name"])
+    return {"ids" : built_ids, "stored" : howmany, "stages" : stages}
+
+
+def id_filter_path(col_name):
+    '''path to IdFilter files for col_name (in cache folder), None if no cache is used'''
+    return CACHE_FOLDER and os.path.join(CACHE_FOLDER,"%s.idfilter" % col_name)
+
 
+def invalidate_id_filter(col_name):
+    '''remove IdFilter saved for col_name, if any'''
+    path = id_filter_path(col_name)
+    if path:
+        IdFilter.remove(path)
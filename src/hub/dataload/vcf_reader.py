@@ -0,0 +1,391 @@
+'''
+Lightweight VCF reader, used by VCF based parsers (dbSNP, ExAC, gnomAD,
+geno2mp...) instead of PyVCF.
+
+Records have the same API as PyVCF records (CHROM, POS, ID, REF, ALT, QUAL,
+FILTER, INFO, is_snp, is_indel, var_type, ...), except:
+  - ALT alleles are plain strings (None for missing alleles), as parsers
+    convert them with str() anyway,
+  - samples (FORMAT and genotype columns) aren't parsed,
+  - INFO is decoded lazily: the raw INFO string is only split when INFO is
+    first accessed, and a value is only decoded (with the same rules as PyVCF,
+    according to header's definitions) when the key is accessed. A parser can
+    also declare the INFO keys it uses (info_keys), other keys are then
+    ignored, as if they weren't in the record.
+'''
+import re
+import gzip
+from collections import OrderedDict, namedtuple
+from collections.abc import Mapping
+
+
+Info = namedtuple("Info", ["id", "num", "type", "desc", "source", "version"])
+
+# types of INFO keys used when not defined in header (as in PyVCF)
+RESERVED_INFO = {
+    "AA": "String", "AC": "Integer", "AF": "Float", "AN": "Integer",
+    "BQ": "Float", "CIGAR": "String", "DB": "Flag", "DP": "Integer",
+    "END": "Integer", "H2": "Flag", "H3": "Flag", "MQ": "Float",
+    "MQ0": "Integer", "NS": "Integer", "SB": "String", "SOMATIC": "Flag",
+    "VALIDATED": "Flag", "1000G": "Flag",
+    # structural variants
+    "IMPRECISE": "Flag", "NOVEL": "Flag", "SVTYPE": "String",
+    "SVLEN": "Integer", "CIPOS": "Integer", "CIEND": "Integer",
+    "HOMLEN": "Integer", "HOMSEQ": "String", "BKPTID": "String",
+    "MEINFO": "String", "METRANS": "String", "DGVID": "String",
+    "DBVARID": "String", "DBRIPID": "String", "MATEID": "String",
+    "PARID": "String", "EVENT": "String", "CILEN": "Integer",
+    "DPADJ": "Integer", "CN": "Integer", "CNADJ": "Integer",
+    "CICN": "Integer", "CICNADJ": "Integer",
+}
+# INFO keys always kept, as needed by records' properties (is_sv, var_subtype)
+RECORD_INFO_KEYS = {"SVTYPE", "IMPRECISE"}
+
+# special values for Number=
+FIELD_COUNTS = {".": None, "A": -1, "G": -2, "R": -3}
+MISSING_VALUES = {".", "", "NA"}
+
+pat_info = re.compile(r'''\#\#INFO=<
+    ID=(?P<id>[^,]+),\s*
+    Number=(?P<number>-?\d+|\.|[AGR])?,\s*
+    Type=(?P<type>Integer|Float|Flag|Character|String),\s*
+    Description="(?P<desc>[^"]*)"
+    (?:,\s*Source="(?P<source>[^"]*)")?
+    (?:,\s*Version="?(?P<version>[^"]*)"?)?
+    >''', re.VERBOSE)
+pat_breakend = re.compile(r"[\[\]]")
+
+
+def _map(func, values):
+    return [func(v) if v not in MISSING_VALUES else None for v in values]
+
+
+def _int_or_float(values):
+    try:
+        return _map(int, values)
+    except ValueError:
+        # integers specified as floats, wrong header type
+        return _map(float, values)
+
+
+def alt_type(alt):
+    '''return type of ALT allele, as PyVCF: "SNV", "MNV", "BND" for breakends
+       or SV type (eg. "DEL" for "<DEL>")'''
+    if alt is None:
+        return None
+    if pat_breakend.search(alt) or (len(alt) > 1 and (alt[0] == "." or alt[-1] == ".")):
+        return "BND"
+    if alt[0] == "<" and alt[-1] == ">":
+        return alt[1:-1]
+    return len(alt) == 1 and "SNV" or "MNV"
+
+
+class LazyInfo(Mapping):
+    '''INFO field of a record, split on first access, values decoded on access'''
+
+    __slots__ = ("_raw", "_reader", "_entries", "_values")
+
+    def __init__(self, raw, reader):
+        self._raw = raw
+        self._reader = reader
+        self._entries = None
+        self._values = {}
+
+    def _split(self):
+        entries = {}
+        if self._raw != ".":
+            keys = self._reader.kept_info_keys
+            for entry in self._raw.split(";"):
+                key, sep, value = entry.partition("=")
+                if keys is None or key in keys:
+                    entries[key] = sep and value or None
+        self._entries = entries
+        return entries
+
+    def __getitem__(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            entries = self._entries if self._entries is not None else self._split()
+            value = self._values[key] = self._reader.decode_info(key, entries[key])
+            return value
+
+    def __contains__(self, key):
+        entries = self._entries if self._entries is not None else self._split()
+        return key in entries
+
+    def __iter__(self):
+        entries = self._entries if self._entries is not None else self._split()
+        return iter(entries)
+
+    def __len__(self):
+        entries = self._entries if self._entries is not None else self._split()
+        return len(entries)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class VCFRecord(object):
+    '''One VCF line, PyVCF compatible record (see module docstring)'''
+
+    __slots__ = ("CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER", "INFO", "FORMAT")
+
+    def __init__(self, chrom, pos, id_, ref, alt, qual, filt, info, fmt=None):
+        self.CHROM = chrom
+        self.POS = pos
+        self.ID = id_
+        self.REF = ref
+        self.ALT = alt
+        self.QUAL = qual
+        self.FILTER = filt
+        self.INFO = info
+        self.FORMAT = fmt
+
+    def __repr__(self):
+        return "Record(CHROM=%s, POS=%s, REF=%s, ALT=%s)" % (self.CHROM, self.POS, self.REF, self.ALT)
+
+    @property
+    def start(self):
+        return self.POS - 1
+
+    @property
+    def end(self):
+        return self.POS - 1 + len(self.REF)
+
+    @property
+    def alleles(self):
+        return [self.REF] + self.ALT
+
+    @property
+    def is_snp(self):
+        if len(self.REF) > 1:
+            return False
+        for alt in self.ALT:
+            if alt not in ("A", "C", "G", "T", "N", "*"):
+                return False
+        return True
+
+    @property
+    def is_sv(self):
+        return self.INFO.get("SVTYPE") is not None
+
+    @property
+    def is_indel(self):
+        is_sv = self.is_sv
+        if len(self.REF) > 1 and not is_sv:
+            return True
+        for alt in self.ALT:
+            if alt_type(alt) not in ("SNV", "MNV"):
+                return False
+            elif len(alt) != len(self.REF):
+                return not is_sv
+        return False
+
+    @property
+    def is_transition(self):
+        if len(self.ALT) > 1 or not self.is_snp:
+            return False
+        return (self.REF, self.ALT[0]) in (("A", "G"), ("G", "A"), ("C", "T"), ("T", "C"))
+
+    @property
+    def is_deletion(self):
+        if len(self.ALT) > 1 or not self.is_indel:
+            return False
+        return self.ALT[0] is not None and len(self.REF) > len(self.ALT[0])
+
+    @property
+    def is_sv_precise(self):
+        if self.INFO.get("IMPRECISE") is None and not self.is_sv:
+            return False
+        return self.is_sv and self.INFO.get("IMPRECISE") is None
+
+    @property
+    def is_monomorphic(self):
+        return len(self.ALT) == 1 and self.ALT[0] is None
+
+    @property
+    def is_filtered(self):
+        return bool(self.FILTER)
+
+    @property
+    def var_type(self):
+        if self.is_snp:
+            return "snp"
+        elif self.is_indel:
+            return "indel"
+        elif self.is_sv:
+            return "sv"
+        else:
+            return "unknown"
+
+    @property
+    def var_subtype(self):
+        if self.is_snp:
+            if self.is_transition:
+                return "ts"
+            return len(self.ALT) == 1 and "tv" or "unknown"
+        elif self.is_indel:
+            if self.is_deletion:
+                return "del"
+            return len(self.ALT) == 1 and "ins" or "unknown"
+        elif self.is_sv:
+            if self.INFO["SVTYPE"] == "BND":
+                return "complex"
+            elif self.is_sv_precise:
+                return self.INFO["SVTYPE"]
+            return alt_type(self.ALT[0])
+        return "unknown"
+
+
+class VCFReader(object):
+    '''
+    Read VCF records from fsock or filename (gzipped if compressed, or
+    if filename ends with ".gz"). info_keys is the collection of INFO keys
+    the caller uses (None for all of them), it can be set after the header was
+    read (eg. from header's definitions, in self.infos).
+    '''
+
+    def __init__(self, fsock=None, filename=None, compressed=None, info_keys=None, encoding="utf-8"):
+        if not (fsock or filename):
+            raise ValueError("You must provide at least fsock or filename")
+        self.filename = filename or getattr(fsock, "name", None)
+        if fsock is None:
+            if compressed is None:
+                compressed = filename.endswith(".gz")
+            fsock = compressed and gzip.open(filename, "rt", encoding=encoding) or open(filename, encoding=encoding)
+        self.encoding = encoding
+        self._fsock = fsock
+        self._tabix = None
+        self._decoders = {}
+        self.info_keys = info_keys
+        self.infos = OrderedDict()
+        self.metadata = OrderedDict()
+        self.header = None
+        self.reader = self._read_header(fsock)
+
+    @property
+    def info_keys(self):
+        return self._info_keys
+
+    @info_keys.setter
+    def info_keys(self, keys):
+        self._info_keys = keys
+        self.kept_info_keys = keys is not None and set(keys) | RECORD_INFO_KEYS or None
+
+    def _read_header(self, fsock):
+        for line in fsock:
+            if line.startswith("##"):
+                m = pat_info.match(line)
+                if m:
+                    num = m.group("number")
+                    num = int(num) if num not in FIELD_COUNTS else FIELD_COUNTS[num]
+                    self.infos[m.group("id")] = Info(m.group("id"), num, m.group("type"), m.group("desc"),
+                                                     m.group("source"), m.group("version"))
+                else:
+                    key, _, value = line[2:].rstrip().partition("=")
+                    self.metadata.setdefault(key, []).append(value)
+            elif line.startswith("#"):
+                self.header = line[1:].rstrip().split("\t")
+                break
+        return fsock
+
+    def _decoder(self, key):
+        info = self.infos.get(key)
+        typ = info and info.type or RESERVED_INFO.get(key)
+        scalar = info is not None and info.num == 1
+        if typ == "Flag":
+            return lambda raw: True
+        if typ == "Integer":
+            decode = _int_or_float
+        elif typ == "Float":
+            decode = lambda values: _map(float, values)
+        else:
+            # String/Character, or unknown key: String with a value, Flag otherwise
+            decode = lambda values: _map(str, values)
+
+        def decoder(raw):
+            if raw is None:
+                if typ in ("Integer", "Float"):
+                    # as PyVCF, an Integer/Float key needs a value
+                    raise ValueError("No value for INFO key '%s'" % key)
+                return True
+            values = decode(raw.split(","))
+            return values[0] if scalar else values
+        return decoder
+
+    def decode_info(self, key, raw):
+        '''decode raw INFO value (None for a key without value) for key'''
+        try:
+            decoder = self._decoders[key]
+        except KeyError:
+            decoder = self._decoders[key] = self._decoder(key)
+        return decoder(raw)
+
+    def parse_line(self, line):
+        row = line.rstrip().split("\t")
+        if row[2] != ".":
+            id_ = row[2]
+        else:
+            id_ = None
+        alt = [a if a not in MISSING_VALUES else None for a in row[4].split(",")]
+        try:
+            qual = int(row[5])
+        except ValueError:
+            try:
+                qual = float(row[5])
+            except ValueError:
+                qual = None
+        filt = row[6]
+        filt = None if filt == "." else [] if filt == "PASS" else filt.split(";")
+        fmt = len(row) > 8 and row[8] != "." and row[8] or None
+        return VCFRecord(row[0], int(row[1]), id_, row[3], alt, qual, filt, LazyInfo(row[7], self), fmt)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = next(self.reader)
+        while not line.strip() or line.startswith("#"):
+            line = next(self.reader)
+        return self.parse_line(line)
+
+    def fetch(self, reference, start=None, end=None):
+        '''restrict records to a region (0-based, half-open, as pysam), requires
+           a bgzipped and tabix-indexed file (and pysam module)'''
+        if self._tabix is None:
+            import pysam
+            self._tabix = pysam.TabixFile(self.filename, encoding=self.encoding)
+        self.reader = iter(self._tabix.fetch(reference, start, end))
+        return self
+
+
+class InfoRouter(object):
+    '''Route INFO values into sub-documents according to keys' prefixes, eg.
+    "AC_afr" => {"ac": {"ac_afr": value}}. The routing table is computed once
+    from header's INFO keys, for each record values are then gathered by key,
+    without testing prefixes. Values of per-allele keys (per_allele prefixes)
+    are indexed by allele'''
+
+    def __init__(self, info_keys, prefixes, per_allele=()):
+        self.groups = [prefix.lower() for prefix in prefixes]
+        # (key, group, field, is per-allele), in header's order
+        self.routes = [(key, prefix.lower(), key.lower(), prefix in per_allele)
+                       for key in info_keys for prefix in prefixes if key.startswith(prefix)]
+
+    @property
+    def keys(self):
+        '''INFO keys routed to sub-documents'''
+        return set(route[0] for route in self.routes)
+
+    def __call__(self, info, nb_alleles):
+        '''return, for each allele, a dict of sub-documents (one per prefix)'''
+        routed = [(group, field, info[key], indexed)
+                  for key, group, field, indexed in self.routes if key in info]
+        docs = []
+        for i in range(nb_alleles):
+            doc = {group: {} for group in self.groups}
+            for group, field, value, indexed in routed:
+                doc[group][field] = value[i] if indexed else value
+            docs.append(doc)
+        return docs
@@ -0,0 +1,40 @@
+'''
+dbNSFP parser tests. Expected documents in data/dbnsfp_sample.json were
+produced by the parser before it used DocMapper/DocNormalizer (one document
+per version and gnomAD option, duplicated rows merged, row without hg19
+position skipped).
+'''
+import os
+import json
+
+from hub.dataload.sources.dbnsfp.dbnsfp_parser import data_generator, load_data_file_multi
+
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "data")
+SAMPLE = os.path.join(DATA_DIR, "dbnsfp_sample.tsv")
+
+
+def expected(version, include_gnomad):
+    with open(os.path.join(DATA_DIR, "dbnsfp_sample.json")) as fin:
+        return json.load(fin)[version + (include_gnomad and "_gnomad" or "")]
+
+
+def as_json(docs):
+    # same types as the pinned documents
+    return json.loads(json.dumps(list(docs)))
+
+
+def test_same_as_previous_parser():
+    for version in ("hg19", "hg38"):
+        for include_gnomad in (False, True):
+            docs = as_json(data_generator(SAMPLE, version, include_gnomad))
+            assert docs == expected(version, include_gnomad), (version, include_gnomad)
+
+
+def test_multi_versions_single_pass():
+    for include_gnomad in (False, True):
+        docs = {"hg19": [], "hg38": []}
+        for version, doc in load_data_file_multi(SAMPLE, ["hg38", "hg19"], include_gnomad):
+            docs[version].append(doc)
+        for version in docs:
+            assert as_json(docs[version]) == expected(version, include_gnomad), (version, include_gnomad)
@@ -0,0 +1,47 @@
+from utils.docmapper import DocMapper
+
+
+HEADER = ["chr", "pos", "ref", "alt", "score", "pred"]
+ROW = ["1", "100", "A", "G", "0.5", "D;T"]
+
+
+def test_map_row():
+    calls = []
+
+    def position(chrom, pos):
+        calls.append((chrom, pos))
+        return chrom, int(pos), int(pos)
+
+    mapper = DocMapper([("_id", ("chr", "pos", "ref", "alt"), lambda c, p, r, a: "chr%s:g.%s%s>%s" % (c, p, r, a)),
+                        (("x.chrom", "x.hg19.start", "x.hg19.end"), ("chr", "pos"), position),
+                        ("x.score", "score", float),
+                        ("x.pred", 5, lambda val: val.split(";")),
+                        ("x.ref", "ref")])
+    assert mapper.columns == ["chr", "pos", "ref", "alt", "score", 5]
+    doc = mapper.compile(HEADER)(ROW)
+    assert doc == {"_id": "chr1:g.100A>G",
+                   "x": {"chrom": "1", "hg19": {"start": 100, "end": 100}, "score": 0.5,
+                         "pred": ["D", "T"], "ref": "A"}}
+    # converter shared by several fields called once
+    assert calls == [("1", "100")]
+    # fields in spec order
+    assert list(doc["x"]) == ["chrom", "hg19", "score", "pred", "ref"]
+
+
+def test_columns_by_position():
+    mapper = DocMapper([("a", 1, int), ("b.c", 0)]).compile()
+    assert mapper(["x", "2"]) == {"a": 2, "b": {"c": "x"}}
+
+
+def test_errors():
+    for spec, header in (([("a", ("chr", "pos"))], HEADER),
+                         ([(("a", "b"), "chr")], HEADER),
+                         ([("a", "missing")], HEADER),
+                         ([("a", "chr"), ("a", "pos")], HEADER),
+                         ([("a", "chr"), ("a.b", "pos")], HEADER)):
+        try:
+            DocMapper(spec).compile(header)
+        except ValueError:
+            pass
+        else:
+            assert False, "ValueError expected for %s" % repr(spec)
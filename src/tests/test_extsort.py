@@ -0,0 +1,17 @@
+import random
+
+from utils.extsort import external_sort
+
+
+def test_same_as_sorted():
+    rand = random.Random(1)
+    for num, run_size in ((0, 10), (5, 10), (10, 10), (11, 10), (1000, 7), (1000, 1000), (5000, 300)):
+        # few distinct keys, so stability is checked too
+        data = [(rand.randint(0, 50), i) for i in range(num)]
+        res = list(external_sort(iter(data), key=lambda x: x[0], run_size=run_size))
+        assert res == sorted(data, key=lambda x: x[0]), (num, run_size)
+
+
+def test_no_key():
+    data = ["chr%d:g.%d" % (i % 7, i) for i in range(100)]
+    assert list(external_sort(data, run_size=9)) == sorted(data)
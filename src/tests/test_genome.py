@@ -0,0 +1,94 @@
+import os
+import gzip
+import random
+import tempfile
+
+import numpy as np
+
+from utils.genome import GenomeStore, build_genome_store, encode_chrom, write_index, read_index
+
+
+def random_seq(rand, length):
+    '''random sequence with masked runs (N and other IUPAC codes) and
+       lowercase (soft-masked) stretches'''
+    seq = []
+    while len(seq) < length:
+        r = rand.random()
+        if r < .05:
+            seq.extend(rand.choice("NNNRYK") * rand.randint(1, 20))
+        elif r < .1:
+            seq.extend(rand.choice("acgtn") for _ in range(rand.randint(1, 30)))
+        else:
+            seq.extend(rand.choice("ACGT") for _ in range(rand.randint(1, 50)))
+    return "".join(seq[:length])
+
+
+def write_fasta(filename, chrom, seq):
+    with gzip.open(filename, "wt") as fout:
+        fout.write(">chr%s\n" % chrom)
+        for i in range(0, len(seq), 60):
+            fout.write(seq[i:i + 60] + "\n")
+
+
+class Logger(object):
+    def __init__(self):
+        self.messages = []
+
+    def info(self, msg):
+        self.messages.append(msg)
+
+
+def test_fetch():
+    rand = random.Random(1)
+    seqs = {"1": random_seq(rand, 5001), "X": random_seq(rand, 3), "MT": random_seq(rand, 1000)}
+    with tempfile.TemporaryDirectory() as folder:
+        # chunks of odd sizes, so masked runs and packed bytes span chunks
+        metas = {}
+        for chrom, seq in seqs.items():
+            cuts = [0] + sorted(rand.sample(range(1, len(seq)), min(len(seq) - 1, 20))) + [len(seq)]
+            metas[chrom] = encode_chrom(folder, chrom, [seq[i:j] for i, j in zip(cuts[:-1], cuts[1:])])
+        write_index(folder, metas)
+        genome = GenomeStore(folder)
+        assert sorted(genome.chroms) == ["1", "MT", "X"]
+        assert "M" in genome and "2" not in genome
+        for chrom, seq in seqs.items():
+            seq = seq.upper()
+            assert genome.length(chrom) == len(seq)
+            assert genome.fetch(chrom, 1, len(seq)) == seq
+            for _ in range(200):
+                start = rand.randint(1, len(seq))
+                end = rand.randint(start, len(seq))
+                assert genome.fetch(chrom, start, end) == seq[start - 1:end]
+            positions = [rand.randint(-2, len(seq) + 2) for _ in range(500)]
+            expected = [ord(seq[p - 1]) if 1 <= p <= len(seq) else 0 for p in positions]
+            assert genome.bases_at(chrom, np.array(positions)).tolist() == expected
+        assert genome.fetch("M", 1, 10) == seqs["MT"][:10].upper()
+        try:
+            genome.fetch("X", 2, 4)
+        except ValueError:
+            pass
+        else:
+            assert False, "ValueError expected"
+
+
+def test_build_genome_store():
+    rand = random.Random(2)
+    seqs = {"1": random_seq(rand, 2000), "2": random_seq(rand, 1500)}
+    with tempfile.TemporaryDirectory() as fasta_folder, tempfile.TemporaryDirectory() as folder:
+        for chrom, seq in seqs.items():
+            write_fasta(os.path.join(fasta_folder, "chr%s.fa.gz" % chrom), chrom, seq)
+        build_genome_store(fasta_folder, folder, chroms=["1"], max_workers=1)
+        # chromosomes not built again are kept in the index
+        index = build_genome_store(fasta_folder, folder, chroms=["2"], max_workers=1)
+        assert sorted(index["chroms"]) == ["1", "2"]
+        genome = GenomeStore(folder)
+        for chrom, seq in seqs.items():
+            assert genome.fetch(chrom, 1, len(seq)) == seq.upper()
+        # unchanged FASTA files are skipped, unless forced
+        logger = Logger()
+        build_genome_store(fasta_folder, folder, chroms=["1", "2"], max_workers=1, logger=logger)
+        assert sorted(logger.messages) == ["Chromosome 1 unchanged, skipped", "Chromosome 2 unchanged, skipped"]
+        logger = Logger()
+        build_genome_store(fasta_folder, folder, chroms=["1"], max_workers=1, force=True, logger=logger)
+        assert logger.messages == ["Chromosome 1 encoded (2000 nucleotides)"]
+        assert read_index(folder)["chroms"]["1"]["checksum"] == index["chroms"]["1"]["checksum"]
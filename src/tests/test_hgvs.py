@@ -0,0 +1,152 @@
+import os
+import random
+import tempfile
+
+import numpy as np
+
+import utils.hgvs
+from utils.hgvs import parse_hgvs, format_hgvs, parse_many, is_snp, VariantKeyCodec, VariantKeySet, \
+                       INDEL_KEY_FLAG, get_hgvs_from_vcf, get_hgvs_from_vcf_many, normalize_vcf_many
+from utils.genome import GenomeStore, encode_chrom, write_index
+
+
+HGVS_IDS = ["chr1:g.1234A>G", "chrX:g.10del", "chr2:g.10_12del", "chr2:g.10_12delACG",
+            "chr3:g.5_6insTT", "chr4:g.7delinsAC", "chr4:g.7_9delinsA", "chrMT:g.100dup",
+            "chr5:g.100_101dupAT"]
+
+
+def test_parse_format():
+    for hgvs_id in HGVS_IDS:
+        assert format_hgvs(parse_hgvs(hgvs_id)) == hgvs_id
+    var = parse_hgvs("chr2:g.10_12delACG")
+    assert (var.chrom, var.start, var.end, var.vartype, var.ref, var.alt) == ("2", 10, 12, "del", "ACG", None)
+    for hgvs_id in ("rs123", "chr1:g.10_11A>G", "chr1:g.10A>", "1:g.10A>G"):
+        assert parse_hgvs(hgvs_id) is None
+    assert parse_many(["chr1:g.1A>G", "x"]) == [parse_hgvs("chr1:g.1A>G"), None]
+    assert [is_snp(hgvs_id) for hgvs_id in HGVS_IDS[:2]] == [True, False]
+
+
+def random_ids(rand, num):
+    ids = []
+    for _ in range(num):
+        pos = rand.randint(1, 10**5)
+        if rand.random() < .6:
+            ids.append("chr%s:g.%d%s>%s" % (rand.choice(["1", "X", "Un"]), pos, rand.choice("ACGT"), rand.choice("ACGT")))
+        else:
+            ids.append("chr1:g.%d_%ddel" % (pos, pos + rand.randint(1, 5)))
+    return ids
+
+
+def test_variant_key_codec():
+    codec = VariantKeyCodec()
+    snvs = ["chr1:g.1234A>G", "chrX:g.1T>C", "chrMT:g.16569G>A", "chrY:g.%dA>T" % ((1 << 32) - 1)]
+    others = HGVS_IDS[1:] + ["chr1:g.01A>G", "chrUn:g.10A>G", "chr1:g.10A>N"]
+    keys = codec.encode_many(snvs + others + others)
+    assert keys.dtype == np.uint64
+    assert not (keys[:len(snvs)] & np.uint64(INDEL_KEY_FLAG)).any()
+    assert (keys[len(snvs):] & np.uint64(INDEL_KEY_FLAG)).all()
+    # other IDs are interned once
+    assert len(codec) == len(others)
+    assert codec.decode_many(keys) == snvs + others + others
+    assert [codec.decode(key) for key in keys] == snvs + others + others
+    # SNV keys sort by chrom, then position
+    assert sorted(codec.encode_many(["chr2:g.1A>G", "chr1:g.20A>G", "chr1:g.3A>G"]).tolist()) == \
+        codec.encode_many(["chr1:g.3A>G", "chr1:g.20A>G", "chr2:g.1A>G"]).tolist()
+
+
+def test_variant_key_set():
+    rand = random.Random(1)
+    ids1 = random_ids(rand, 3000)
+    ids2 = random_ids(rand, 3000)
+    queries = random_ids(rand, 3000) + ids1 + ids2
+    expected1 = set(ids1)
+    expected = expected1 | set(ids2)
+    set1 = VariantKeySet.from_ids(ids1)
+    assert len(set1) == len(expected1) and set(set1) == expected1
+    assert set1.contains_many(queries).tolist() == [q in expected1 for q in queries]
+    assert set1.difference(queries) == [q for q in queries if q not in expected1]
+    union = set1.union(VariantKeySet.from_ids(ids2))
+    assert set(union) == expected and len(union) == len(expected)
+    assert union.contains_many(queries).tolist() == [q in expected for q in queries]
+    # querying doesn't grow the set
+    assert len(union) == len(expected)
+    with tempfile.TemporaryDirectory() as folder:
+        union.save(os.path.join(folder, "ids"))
+        loaded = VariantKeySet.load(os.path.join(folder, "ids"))
+        assert loaded.contains_many(queries).tolist() == union.contains_many(queries).tolist()
+        loaded.update(["chr2:g.1_2insA", "chr2:g.5A>G"])
+        assert "chr2:g.1_2insA" in loaded and "chr2:g.5A>G" in loaded and len(loaded) == len(union) + 2
+    empty = VariantKeySet()
+    assert len(empty.union(empty)) == 0 and not empty.contains_many(ids1).any()
+
+
+def test_variant_key_set_collisions():
+    hash_id = utils.hgvs.hash_id
+    # only 3 different hashes for all indels
+    utils.hgvs.hash_id = lambda hgvs_id: INDEL_KEY_FLAG | (sum(map(ord, hgvs_id)) % 3)
+    try:
+        ids = ["chr1:g.%ddel" % i for i in range(20)]
+        union = VariantKeySet.from_ids(ids[:10]).union(VariantKeySet.from_ids(ids[5:15]))
+        assert len(union) == 15 and set(union) == set(ids[:15])
+        assert union.contains_many(ids).tolist() == [i < 15 for i in range(20)]
+    finally:
+        utils.hgvs.hash_id = hash_id
+
+
+def random_vcf_alleles(rand, num):
+    seq = lambda: "".join(rand.choice("ACGT") for _ in range(rand.choice([1, 1, 1, 2, 3, 5])))
+    alleles = []
+    for i in range(num):
+        ref = seq()
+        alt = rand.random() < .05 and rand.choice([ref, "*", "N", "", "<DEL>"]) or seq()
+        if rand.random() < .2:
+            # overlapping from the left
+            alt = ref[:rand.randint(1, len(ref))] + alt
+        alleles.append((rand.choice(["1", "X", "MT"]), rand.randint(1, 10**6), ref, alt))
+    return alleles
+
+
+def test_many_same_as_single():
+    alleles = random_vcf_alleles(random.Random(1), 5000)
+    expected = []
+    for chrom, pos, ref, alt in alleles:
+        try:
+            expected.append(get_hgvs_from_vcf(chrom, pos, ref, alt, mutant_type=True))
+        except (ValueError, AssertionError):
+            expected.append((None, None))
+    hgvs_ids, var_types = get_hgvs_from_vcf_many(*zip(*alleles), mutant_type=True, skip_invalid=True)
+    assert list(zip(hgvs_ids, var_types)) == expected
+    valid = [allele for allele, exp in zip(alleles, expected) if exp[0] is not None]
+    assert get_hgvs_from_vcf_many(*zip(*valid)) == [exp[0] for exp in expected if exp[0] is not None]
+    # invalid alleles raise an error unless skipped
+    try:
+        get_hgvs_from_vcf_many(["1", "1"], [10, 10], ["A", "A"], ["C", "<DEL>"])
+    except ValueError:
+        pass
+    else:
+        assert False, "ValueError expected"
+
+
+def test_many_shared_columns():
+    # multi-allelic record, chrom/pos/ref given once
+    assert get_hgvs_from_vcf_many("1", 100, "AT", ["A", "ATT", "GT"]) == \
+        ["chr1:g.101del", "chr1:g.101_102insT", "chr1:g.100_101delinsGT"]
+
+
+def test_normalize_vcf_many():
+    #        pos: 123456789012345
+    seqs = {"1": "GGGCAAAAAGTTCAG"}
+    with tempfile.TemporaryDirectory() as folder:
+        write_index(folder, {chrom: encode_chrom(folder, chrom, [seq]) for chrom, seq in seqs.items()})
+        genome = GenomeStore(folder)
+        # same insertion/deletion of an "A" in the repeat, whatever its position
+        ins = [("1", 4, "C", "CA"), ("1", 6, "A", "AA"), ("1", 9, "A", "AA"), ("1", 7, "AAA", "AAAA")]
+        dels = [("1", 4, "CA", "C"), ("1", 8, "AA", "A"), ("1", 6, "AAAG", "AAG")]
+        for window in (64, 2):
+            assert set(get_hgvs_from_vcf_many(*zip(*ins), genome=genome)) == {"chr1:g.4_5insA"}
+            chrs, positions, refs, alts = normalize_vcf_many(genome, *zip(*dels), window=window)
+            assert set(zip(positions, refs, alts)) == {(4, "CA", "C")}
+        # SNVs, invalid alleles and unknown chromosomes are left untouched
+        others = [("1", 6, "A", "G"), ("1", 6, "A", "<DEL>"), ("2", 6, "A", "AA")]
+        assert list(zip(*normalize_vcf_many(genome, *zip(*others)))) == others
+
@@ -0,0 +1,99 @@
+import os
+import random
+import tempfile
+
+import utils.hgvs
+from utils.hgvs import INDEL_KEY_FLAG
+from utils.idfilter import IdFilter, build_collection_filter
+
+
+def random_ids(rand, num):
+    ids = []
+    for _ in range(num):
+        chrom = rand.choice(["1", "X", "MT", "Un"])
+        pos = rand.randint(1, 10**6)
+        if rand.random() < .7:
+            ids.append("chr%s:g.%d%s>%s" % (chrom, pos, rand.choice("ACGT"), rand.choice("ACGT")))
+        else:
+            ids.append("chr%s:g.%d_%ddel" % (chrom, pos, pos + rand.randint(1, 10)))
+    return ids
+
+
+def test_same_as_set():
+    rand = random.Random(1)
+    ids = random_ids(rand, 5000)
+    queries = ids[:1000] + random_ids(rand, 5000)
+    filt = IdFilter.from_ids(ids)
+    assert len(filt) == len(set(ids))
+    assert filt.contains_many(queries).tolist() == [q in set(ids) for q in queries]
+    assert ids[0] in filt and "chr1:g.0A>G" not in filt
+
+
+def test_update_save_load():
+    rand = random.Random(2)
+    ids = random_ids(rand, 2000)
+    filt = IdFilter.from_ids(ids[:500])
+    for i in range(500, 2000, 100):
+        filt.update(ids[i:i + 100])
+    # updates are merged into a few runs
+    assert len(filt._added) <= 5
+    queries = random_ids(rand, 2000) + ids
+    expected = [q in set(ids) for q in queries]
+    assert filt.contains_many(queries).tolist() == expected
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "filter")
+        filt.save(path, collection="test")
+        loaded = IdFilter.load(path)
+        assert len(loaded) == len(set(ids)) and loaded.meta == {"collection": "test"}
+        assert loaded.contains_many(queries).tolist() == expected
+        loaded.update(["chr2:g.10A>G"])
+        assert "chr2:g.10A>G" in loaded and len(loaded) == len(set(ids)) + 1
+        # already there, not added again
+        loaded.update(ids[:100])
+        assert len(loaded) == len(set(ids)) + 1
+        assert IdFilter.load(os.path.join(folder, "missing")) is None
+
+
+def test_hash_collisions():
+    hash_id = utils.hgvs.hash_id
+    # only 2 different hashes for all indels, Bloom filter can't tell them apart
+    utils.hgvs.hash_id = lambda hgvs_id: INDEL_KEY_FLAG | (len(hgvs_id) % 2)
+    try:
+        ids = ["chr1:g.%d_%ddel" % (i, i + 2) for i in range(40)]
+        filt = IdFilter.from_ids(ids[:10])
+        filt.update(ids[10:20])
+        assert filt.contains_many(ids).tolist() == [i < 20 for i in range(40)]
+        assert len(filt) == 20
+    finally:
+        utils.hgvs.hash_id = hash_id
+
+
+class FakeCollection:
+    name = "test"
+
+
+def test_build_collection_filter():
+    import biothings.utils.mongo
+    rand = random.Random(3)
+    ids = random_ids(rand, 3000)
+    id_feeder = biothings.utils.mongo.id_feeder
+    biothings.utils.mongo.id_feeder = lambda col, batch_size, **kwargs: \
+        (ids[i:i + batch_size] for i in range(0, len(ids), batch_size))
+    try:
+        filt = build_collection_filter(FakeCollection(), batch_size=170, signature="sig")
+    finally:
+        biothings.utils.mongo.id_feeder = id_feeder
+    assert filt.meta == {"collection": "test", "signature": "sig"}
+    assert len(filt) == len(set(ids)) and set(filt.keyset) == set(ids)
+    queries = random_ids(rand, 2000)
+    assert filt.contains_many(queries).tolist() == [q in set(ids) for q in queries]
+
+
+def test_remove():
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "filter")
+        IdFilter.from_ids(["chr1:g.10A>G", "chr1:g.10del"]).save(path)
+        assert len(IdFilter.load(path)) == 2
+        IdFilter.remove(path)
+        assert IdFilter.load(path) is None and os.listdir(folder) == []
+        IdFilter.remove(path)
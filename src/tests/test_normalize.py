@@ -0,0 +1,70 @@
+'''
+DocNormalizer must give the same documents as the biothings.utils.dataload
+functions chains it replaces in parsers, checked on random documents.
+'''
+import copy
+import random
+
+from biothings.utils.dataload import value_convert_to_number, unlist, dict_sweep, list_split
+
+from utils.normalize import DocNormalizer, to_number
+
+
+KEYS = ["a", "b", "chrom", "id", "x", "y"]
+VALUES = ["1", "2.5", ".", "-", "NA", "", None, "a;b", "c;", "x", "3;4", "1e3", "nan",
+          " 7 ", "None", 0, 1.0, "N/A", "null", "a,b"]
+
+# (biothings chain, equivalent normalizer), as used in parsers
+CHAINS = [
+    (lambda d: list_split(dict_sweep(unlist(value_convert_to_number(d)), vals=[".", '-', "NA", None],
+                                     remove_invalid_list=True), ";"),
+     DocNormalizer(sweep=[".", '-', "NA", None], remove_invalid_list=True, split=";")),
+    (lambda d: list_split(dict_sweep(unlist(value_convert_to_number(d)), vals=[".", None]), ";"),
+     DocNormalizer(sweep=[".", None], split=";")),
+    (lambda d: dict_sweep(unlist(value_convert_to_number(d, skipped_keys=['chrom'])), [None]),
+     DocNormalizer(skipped_keys=["chrom"], sweep=[None])),
+    (lambda d: dict_sweep(unlist(value_convert_to_number(d, ['chrom', 'id'])), [None, '', 'None']),
+     DocNormalizer(skipped_keys=["chrom", "id"], sweep=[None, '', 'None'])),
+    (lambda d: dict_sweep(value_convert_to_number(d), vals=["NA", "none", "unknown"]),
+     DocNormalizer(unlist=False, sweep=["NA", "none", "unknown"])),
+    (lambda d: unlist(dict_sweep(value_convert_to_number(d), vals=[""])),
+     DocNormalizer(sweep=[""], sweep_before_unlist=True)),
+    (lambda d: dict_sweep(unlist(d), ['', 'null', 'N/A', None, [], {}]),
+     DocNormalizer(convert=False, sweep=['', 'null', 'N/A', None, [], {}])),
+    (lambda d: dict_sweep(d, vals=['', 'null', 'N/A', None, [], {}]),
+     DocNormalizer(convert=False, unlist=False, sweep=['', 'null', 'N/A', None, [], {}])),
+    (lambda d: list_split(dict_sweep(unlist(value_convert_to_number(d)), [""]), ","),
+     DocNormalizer(sweep=[""], split=",")),
+]
+
+
+def random_value(rand, depth=0):
+    r = rand.random()
+    if depth < 4 and r < .25:
+        return {rand.choice(KEYS): random_value(rand, depth + 1) for _ in range(rand.randint(0, 4))}
+    if depth < 4 and r < .5:
+        return [random_value(rand, depth + 1) for _ in range(rand.choice([0, 1, 1, 2, 3]))]
+    return rand.choice(VALUES)
+
+
+def test_to_number():
+    assert to_number("12") == 12 and isinstance(to_number("12"), int)
+    assert to_number("1e3") == 1000.0
+    assert to_number(" 7 ") == 7
+    assert to_number("a") == "a"
+    assert to_number(None) is None
+
+
+def test_same_as_biothings_chains():
+    rand = random.Random(3)
+    for i, (chain, normalize) in enumerate(CHAINS):
+        for _ in range(2000):
+            doc = {key: random_value(rand) for key in rand.sample(KEYS, 4)}
+            # repr() also tells int from float and list from tuple
+            assert repr(normalize(copy.deepcopy(doc))) == repr(chain(copy.deepcopy(doc))), (i, doc)
+
+
+def test_in_place():
+    doc = {"a": {"b": ["1"]}, "c": "."}
+    assert DocNormalizer(sweep=["."])(doc) is doc
+    assert doc == {"a": {"b": 1}}
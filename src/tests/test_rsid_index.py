@@ -0,0 +1,60 @@
+import random
+import tempfile
+
+from utils.rsid_index import RsidIndex, build_rsid_index, rsid_to_int
+from utils.hgvs import get_hgvs_from_rsid
+
+
+def random_docs(rand, num):
+    docs = []
+    for i in range(num):
+        rsid = rand.choice(["rs%d" % rand.randint(1, 500), "rs%d" % rand.randint(1, 10**9), "rs", "123"])
+        docs.append({"_id": "chr1:g.%dA>G" % i, "dbsnp": {"rsid": rsid}})
+    return docs
+
+
+def test_rsid_to_int():
+    assert rsid_to_int("rs123") == 123
+    for rsid in ("rs", "123", "rs12a", None, 123):
+        assert rsid_to_int(rsid) is None
+
+
+def test_resolve():
+    rand = random.Random(1)
+    docs = random_docs(rand, 3000)
+    expected = {}
+    for doc in docs:
+        if rsid_to_int(doc["dbsnp"]["rsid"]) is not None:
+            expected.setdefault(doc["dbsnp"]["rsid"], []).append(doc["_id"])
+    with tempfile.TemporaryDirectory() as folder:
+        meta = build_rsid_index(folder, iter(docs), source="test")
+        assert meta["source"] == "test"
+        assert meta["count"] == sum(map(len, expected.values())) and meta["rsids"] == len(expected)
+        index = RsidIndex(folder)
+        assert len(index) == meta["count"]
+        rsids = list(expected) + ["rs0", "rs", "abc", "rs%d" % (10**10)]
+        # hgvs ids in insertion order
+        assert index.resolve_many(rsids) == [expected.get(rsid, []) for rsid in rsids]
+        rsid = max(expected, key=lambda k: len(expected[k]))
+        assert len(expected[rsid]) > 1 and index.resolve(rsid) == expected[rsid]
+
+
+def test_rsid_list_and_empty_index():
+    with tempfile.TemporaryDirectory() as folder:
+        docs = [{"_id": "a", "rsids": ["rs1", "rs2"]}, {"_id": "b", "rsids": "rs1"}]
+        build_rsid_index(folder, docs, rsid_fn=lambda doc: doc["rsids"])
+        assert RsidIndex(folder).resolve_many(["rs1", "rs2", "rs3"]) == [["a", "b"], ["a"], []]
+    with tempfile.TemporaryDirectory() as folder:
+        build_rsid_index(folder, [])
+        assert RsidIndex(folder).resolve_many(["rs1"]) == [[]]
+
+
+def test_get_hgvs_from_rsid():
+    with tempfile.TemporaryDirectory() as folder:
+        build_rsid_index(folder, [{"_id": "chr1:g.1A>G", "dbsnp": {"rsid": "rs1"}},
+                                  {"_id": "chr1:g.1A>T", "dbsnp": {"rsid": "rs1"}}])
+        docs = [{"rsid": "rs1", "val": 1}, {"rsid": "rs2", "val": 2}, {"rsid": None, "val": 3}]
+        res = list(get_hgvs_from_rsid(docs, lambda doc: doc["rsid"], RsidIndex(folder), batch_size=2))
+        assert [(doc.get("_id"), doc["val"]) for doc in res] == [("chr1:g.1A>G", 1), ("chr1:g.1A>T", 1), (None, 3)]
+        res = list(get_hgvs_from_rsid(docs, lambda doc: doc["rsid"], RsidIndex(folder), skip_unmatched=True))
+        assert [doc["val"] for doc in res] == [1, 1, 2, 3]
@@ -0,0 +1,162 @@
+'''
+snpEff worker tests. A fake snpEff (echoing records) is used by default, to
+also check with actual snpEff, give its command line in SNPEFF_CMD:
+
+    SNPEFF_CMD="java -Xmx4g -jar /path/to/snpEff/snpEff.jar -t -noStats -noExpandIUB hg19" \
+        nosetests tests.test_snpeff
+'''
+import os
+import sys
+import time
+from unittest import SkipTest
+
+from hub.dataload.sources.snpeff.snpeff_parser import SnpeffWorker, SnpeffError, SnpeffAnnotator, VCFColumns, \
+                                                    stop_snpeff_workers
+
+
+# echoes records, ANN built from ALT, as snpEff does (in order). Output is
+# flushed per record if argv[1] == "flush", at exit otherwise
+FAKE_SNPEFF = '''
+import sys
+flush = sys.argv[1:] == ["flush"]
+out = []
+for line in sys.stdin:
+    if not line.startswith("#"):
+        cols = line.rstrip("\\n").split("\\t")
+        cols[7] = "ANN=%s|fake|MODIFIER%s" % (cols[4], "|" * 13)
+        line = "\\t".join(cols) + "\\n"
+    if flush:
+        sys.stdout.write(line)
+        sys.stdout.flush()
+    else:
+        out.append(line)
+sys.stdout.write("".join(out))
+'''
+
+RECORDS = ["1\t%d\t.\tA\tC\t.\t.\t.\t# hgvs:chr1:g.%dA>C" % (pos, pos) for pos in range(100, 2100, 10)]
+
+
+def fake_cmd(*args):
+    return [sys.executable, "-c", FAKE_SNPEFF] + list(args)
+
+
+def test_batch_per_process():
+    worker = SnpeffWorker(fake_cmd())
+    for _ in range(2):
+        out = list(worker.stream_batch(iter(RECORDS)))
+        assert [line.split("\t")[-1] for line in out] == [rec.split("\t")[-1] for rec in RECORDS]
+        assert all("ANN=C|fake" in line for line in out)
+        # batch complete when snpEff exits
+        assert worker.proc is None
+
+
+def test_persistent_worker():
+    worker = SnpeffWorker(fake_cmd("flush"), persistent=True, timeout=10)
+    try:
+        out = worker.run_batch(RECORDS[:50])
+        pid = worker.proc.pid
+        assert len(out) == 50
+        out = worker.run_batch(RECORDS[50:])
+        assert len(out) == len(RECORDS) - 50
+        assert worker.proc.pid == pid
+        assert not any(SnpeffWorker.MARKER in line for line in out)
+    finally:
+        worker.stop()
+
+
+def test_health_check():
+    # restarted when it's gone
+    worker = SnpeffWorker(fake_cmd("flush"), persistent=True, timeout=10)
+    try:
+        worker.run_batch(RECORDS[:10])
+        worker.proc.kill()
+        worker.proc.wait()
+        assert len(worker.run_batch(RECORDS)) == len(RECORDS)
+        assert worker.persistent
+    finally:
+        worker.stop()
+    # no answer to health check (output not flushed), one process per batch
+    worker = SnpeffWorker(fake_cmd(), persistent=True, timeout=10, check_timeout=1)
+    out = worker.run_batch(RECORDS)
+    assert len(out) == len(RECORDS) and not worker.persistent and worker.proc is None
+
+
+def test_idle_timeout():
+    worker = SnpeffWorker(fake_cmd("flush"), persistent=True, timeout=10, idle_timeout=1)
+    try:
+        worker.run_batch(RECORDS[:10])
+        assert worker.is_alive()
+        time.sleep(2)
+        assert worker.proc is None
+        # started again when needed
+        assert len(worker.run_batch(RECORDS)) == len(RECORDS)
+        assert worker.is_alive()
+    finally:
+        worker.stop()
+
+
+def make_chunks(shard, num, size):
+    chunks = []
+    for i in range(num):
+        positions = list(range(shard * 10000 + i * size + 1, shard * 10000 + (i + 1) * size + 1))
+        # invalid alt, skipped (not sent to snpEff): no annotation
+        alts = ["N" if pos % 7 == 0 else "C" for pos in positions]
+        ids = ["chr1:g.%dA>%s" % (pos, alt) for pos, alt in zip(positions, alts)]
+        chunks.append(VCFColumns(ids, ["1"] * size, positions, ["A"] * size, alts))
+    return chunks
+
+
+def test_worker_starts_per_shard():
+    starts = []
+    start = SnpeffWorker.start
+
+    def counting_start(self):
+        starts.append(self)
+        start(self)
+
+    SnpeffWorker.start = counting_start
+    try:
+        for persistent in (False, True):
+            del starts[:]
+            annotator = SnpeffAnnotator(fake_cmd("flush"), persistent=persistent)
+            for shard in range(2):
+                chunks = make_chunks(shard, 5, 30)
+                out = list(annotator.annotate_chunks(iter(chunks)))
+                assert [cols for cols, _ in out] == chunks
+                for cols, annots in out:
+                    assert [annot["_id"] for annot in annots] == [_id for _id in cols.ids if _id[-1] == "C"]
+                # chunks of a shard streamed to one snpEff process, kept for
+                # next shards if persistent
+                assert len(starts) == (1 if persistent else shard + 1)
+    finally:
+        SnpeffWorker.start = start
+        stop_snpeff_workers()
+
+
+def test_failing_snpeff():
+    worker = SnpeffWorker([sys.executable, "-c", "import sys; sys.stderr.write('boom'); sys.exit(1)"])
+    try:
+        list(worker.stream_batch(iter(RECORDS)))
+    except SnpeffError as e:
+        assert "boom" in str(e)
+    else:
+        assert False, "SnpeffError expected"
+
+
+def test_real_snpeff_persistent():
+    '''persistent mode relies on snpEff flushing each record, a batch must
+       come back well before TIMEOUT (not only when snpEff exits)'''
+    cmd = os.environ.get("SNPEFF_CMD")
+    if not cmd:
+        raise SkipTest("SNPEFF_CMD not set")
+    worker = SnpeffWorker(cmd.split(), persistent=True)
+    try:
+        # first batch includes database loading
+        worker.run_batch(RECORDS[:10])
+        worker.timeout = 60
+        t0 = time.time()
+        out = worker.run_batch(RECORDS)
+        assert len(out) == len(RECORDS)
+        assert time.time() - t0 < 60
+    finally:
+        worker.stop()
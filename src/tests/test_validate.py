@@ -0,0 +1,123 @@
+import tempfile
+
+from utils.genome import encode_chrom, write_index
+import utils.validate
+from utils.validate import VariantValidator, ValidationSummary, validate_range_worker, configured_db_key
+
+
+#        pos: 1234567890
+SEQS = {"1": "ACGTNACGTA", "MT": "GATTACA"}
+
+CASES = [
+    ("chr1:g.1A>G", True),
+    ("chr1:g.1C>G", False),
+    ("chr1:g.5N>A", True),
+    ("chr1:g.10A>T", True),
+    ("chr1:g.11A>T", False),
+    ("chr1:g.2_4del", True),
+    ("chr1:g.2_4delCGT", True),
+    ("chr1:g.2_4delCGA", False),
+    ("chr1:g.2_4delCG", False),
+    ("chr1:g.9_11del", False),
+    ("chr1:g.3_4insTT", True),
+    ("chr1:g.6_7delinsTT", True),
+    # same sequence as reference, not a delins
+    ("chr1:g.6_7delinsAC", False),
+    ("chr1:g.6_7delinsA", True),
+    ("chrM:g.2_3dupAT", True),
+    ("chrMT:g.7A>C", True),
+    ("chrMT:g.7C>A", False),
+    # not tested: unknown chromosome, not a genomic hgvs id
+    ("chr2:g.1A>G", None),
+    ("rs123", None),
+]
+
+
+def make_validator(folder):
+    write_index(folder, {chrom: encode_chrom(folder, chrom, [seq]) for chrom, seq in SEQS.items()})
+    return VariantValidator(folder)
+
+
+def test_validate_many():
+    with tempfile.TemporaryDirectory() as folder:
+        validator = make_validator(folder)
+        ids, expected = zip(*CASES)
+        assert validator.validate_many(list(ids), summary=False) == list(expected)
+        assert validator.validate_hgvs("chr1:g.2C>A") is True
+
+
+def test_validate_generator():
+    with tempfile.TemporaryDirectory() as folder:
+        validator = make_validator(folder)
+        docs = [{"_id": hgvs_id} for hgvs_id, _ in CASES]
+        out = validator.validate_generator(iter(docs), return_false=True, batch_size=4)
+        assert out[False] == [hgvs_id for hgvs_id, valid in CASES if valid is False]
+        assert True not in out and None not in out
+        summary = out["summary"]
+        assert dict(summary) == {k: [valid for _, valid in CASES].count(k) for k in (True, False, None)}
+
+
+def test_summary():
+    one = ValidationSummary(keep=[False])
+    one.add(["a", "b", "c"], [True, False, None])
+    two = ValidationSummary(keep=[False, None])
+    two.add(["d", "e"], [False, None])
+    res = one + two
+    assert dict(res) == {True: 1, False: 2, None: 2} and res.total == 5
+    assert res.ids == {False: ["b", "d"], None: ["e"]}
+    one += two
+    assert dict(one) == dict(res) and one.ids == res.ids
+
+
+class FakeCursor(list):
+
+    def batch_size(self, size):
+        return self
+
+    def close(self):
+        pass
+
+
+class FakeCollection:
+
+    def __init__(self, ids):
+        self.ids = sorted(ids)
+        self.queries = []
+
+    def find(self, query, projection, no_cursor_timeout=False):
+        self.queries.append(query)
+        bounds = query.get("_id", {})
+        return FakeCursor({"_id": _id} for _id in self.ids
+                          if bounds.get("$gte", _id) <= _id and (_id < bounds["$lt"] if "$lt" in bounds else True))
+
+
+class FakeDatabase(dict):
+
+    def __init__(self, name, collections):
+        super(FakeDatabase, self).__init__(collections)
+        self.name = name
+
+
+def test_validate_range_worker():
+    col = FakeCollection([hgvs_id for hgvs_id, _ in CASES])
+    src = FakeDatabase("src_db", {"variants": col})
+    target = FakeDatabase("target_db", {})
+    getters = utils.validate.DB_GETTERS
+    utils.validate.DB_GETTERS = {"src": lambda: src, "target": lambda: target}
+    try:
+        assert configured_db_key(src) == "src" and configured_db_key(target) == "target"
+        try:
+            configured_db_key(FakeDatabase("other", {}))
+            assert False, "unconfigured database not detected"
+        except ValueError:
+            pass
+        with tempfile.TemporaryDirectory() as folder:
+            make_validator(folder)
+            lo = "chr1:g.5N>A"
+            summary = validate_range_worker(folder, "src", "variants", lo, None, keep=[False])
+            assert col.queries == [{"_id": {"$gte": lo}}]
+            expected = [valid for hgvs_id, valid in CASES if hgvs_id >= lo]
+            assert summary.total == len(expected)
+            assert summary.ids[False] == sorted(hgvs_id for hgvs_id, valid in CASES if hgvs_id >= lo and valid is False)
+    finally:
+        utils.validate.DB_GETTERS = getters
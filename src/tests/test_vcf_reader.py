@@ -0,0 +1,100 @@
+'''
+VCFReader tests. Records are compared to PyVCF ones (when installed) on a
+random VCF covering multi-allelic records, missing values, flags, keys not
+defined in header and structural variants.
+'''
+import io
+import gzip
+import random
+import tempfile
+from unittest import SkipTest
+
+from hub.dataload.vcf_reader import VCFReader, InfoRouter
+
+
+HEADER = '''##fileformat=VCFv4.1
+##INFO=<ID=RSPOS,Number=1,Type=Integer,Description="pos">
+##INFO=<ID=CAF,Number=.,Type=String,Description="caf">
+##INFO=<ID=VLD,Number=0,Type=Flag,Description="vld">
+##INFO=<ID=AC,Number=A,Type=Integer,Description="ac">
+##INFO=<ID=AF,Number=A,Type=Float,Description="af">
+##INFO=<ID=FS,Number=1,Type=Float,Description="fs">
+##INFO=<ID=HPO_CT,Number=1,Type=String,Description="s">
+#CHROM	POS	ID	REF	ALT	QUAL	FILTER	INFO
+'''
+
+RECORD_PROPS = ["CHROM", "POS", "ID", "REF", "QUAL", "FILTER", "is_snp", "is_indel", "is_sv",
+                "is_deletion", "is_transition", "var_type", "var_subtype", "start", "end"]
+
+
+def random_vcf(num=1000, seed=1):
+    rand = random.Random(seed)
+    seq = lambda lens: "".join(rand.choice("ACGT") for _ in range(rand.choice(lens)))
+    lines = []
+    for i in range(num):
+        alts = [rand.random() < .05 and rand.choice([".", "<DEL>", "A[1:20[", "*", "N"]) or seq([1, 1, 1, 3])
+                for _ in range(rand.choice([1, 1, 2, 3]))]
+        info = ["RSPOS=%d" % (i + 1),
+                "AC=%s" % ",".join(str(rand.randint(0, 9)) for _ in alts),
+                "AF=%s" % ",".join(rand.choice(["0.1", ".", "1e-3"]) for _ in alts)]
+        for entry, freq in (("CAF=0.9,.,0.1", .3), ("VLD", .3), ("UNK=x,y", .3), ("UNKFLAG", .3),
+                            ("SVTYPE=DEL", .1), ("SVTYPE=BND", .1), ("FS=1.5", .2), ("FS=NA", .1),
+                            ("DP=12", .3), ("IMPRECISE", .1), ("HPO_CT=3", .3)):
+            if rand.random() < freq:
+                info.append(entry)
+        lines.append("\t".join([rand.choice(["1", "X"]), str(i + 1), rand.choice([".", "rs%d" % i]),
+                                seq([1, 1, 1, 2, 4]), ",".join(alts), rand.choice([".", "50", "3.5"]),
+                                rand.choice([".", "PASS", "a;b"]),
+                                rand.random() > .02 and ";".join(info) or "."]))
+    return HEADER + "\n".join(lines) + "\n"
+
+
+def test_same_as_pyvcf():
+    try:
+        import vcf
+    except ImportError:
+        raise SkipTest("PyVCF not installed")
+    content = random_vcf()
+    expected = list(vcf.Reader(io.StringIO(content)))
+    records = list(VCFReader(io.StringIO(content)))
+    assert len(records) == len(expected)
+    for exp, rec in zip(expected, records):
+        for prop in RECORD_PROPS:
+            try:
+                value = getattr(exp, prop)
+            except TypeError:
+                # PyVCF fails on some properties for missing alleles
+                continue
+            assert getattr(rec, prop) == value, (prop, exp)
+        assert rec.ALT == [None if alt is None else str(alt) for alt in exp.ALT]
+        assert [str(a) for a in rec.alleles] == [str(a) for a in exp.alleles]
+        assert dict(rec.INFO) == dict(exp.INFO)
+
+
+def test_info_keys():
+    reader = VCFReader(io.StringIO(HEADER + "1\t10\trs1\tA\tC,G\t.\tPASS\tRSPOS=10;AC=1,2;AF=.,0.5;VLD;SVTYPE=DEL\n"),
+                       info_keys={"AC", "AF"})
+    rec = next(reader)
+    assert rec.ID == "rs1" and rec.ALT == ["C", "G"] and rec.FILTER == []
+    # SVTYPE is always kept (record properties rely on it), not defined in
+    # header so decoded as a list, as PyVCF does
+    assert dict(rec.INFO) == {"AC": [1, 2], "AF": [None, 0.5], "SVTYPE": ["DEL"]}
+    assert reader.infos["RSPOS"].num == 1 and reader.infos["AC"].num == -1
+
+
+def test_gzipped_file():
+    content = random_vcf(50)
+    with tempfile.NamedTemporaryFile(suffix=".vcf.gz") as fout:
+        with gzip.open(fout.name, "wt") as gz:
+            gz.write(content)
+        records = list(VCFReader(filename=fout.name))
+    assert [rec.POS for rec in records] == list(range(1, 51))
+    assert [rec.REF for rec in records] == [line.split("\t")[3] for line in content.splitlines()[-50:]]
+
+
+def test_info_router():
+    router = InfoRouter(["AC", "AC_afr", "AF_afr", "AN_afr", "DP"], ["AC", "AF", "AN"], per_allele=["AC", "AF"])
+    assert router.keys == {"AC", "AC_afr", "AF_afr", "AN_afr"}
+    docs = router({"AC": [1, 2], "AF_afr": [0.1, 0.2], "AN_afr": 10, "DP": 3}, 2)
+    assert docs == [{"ac": {"ac": 1}, "af": {"af_afr": 0.1}, "an": {"an_afr": 10}},
+                    {"ac": {"ac": 2}, "af": {"af_afr": 0.2}, "an": {"an_afr": 10}}]
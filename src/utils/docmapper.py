@@ -0,0 +1,95 @@
+'''
+Declarative column => document mappers, for wide tabular sources.
+
+A spec is a list of (path, column) or (path, column, converter) entries:
+  - path: dotted path of the field in the document, eg. "sift.pred"; fields
+    are created in spec order. Can be a tuple of paths, then converter is
+    called once and returns one value per path,
+  - column: column name (found in file's header) or position, or a tuple of
+    them, then converter is called with all these values,
+  - converter: callable applied to column value(s).
+
+DocMapper(spec).compile(header) generates, once per file header, a function
+mapping a row (list of values) to a new document, with values read by
+position. Columns not in the spec are never read.
+
+    mapper = DocMapper([("rsid", "rs_dbSNP151"),
+                        ("hg19.start", "hg19_pos(1-based)", int),
+                        ("hg19.end", "hg19_pos(1-based)", int)]).compile(header)
+    doc = mapper(row)
+
+    # one parsing for several fields
+    DocMapper([(("chrom", "hg19.start"), "pos", lambda val: val.split(":"))])
+'''
+
+
+class DocMapper(object):
+
+    def __init__(self, spec):
+        self.spec = []
+        for entry in spec:
+            path, columns = entry[:2]
+            converter = entry[2] if len(entry) > 2 else None
+            multiple = isinstance(columns, tuple)
+            if (multiple or isinstance(path, tuple)) and converter is None:
+                raise ValueError("Converter required for multiple columns or fields: %s" % repr(entry))
+            paths = [p.split(".") for p in path] if isinstance(path, tuple) else [path.split(".")]
+            self.spec.append((paths, multiple and columns or (columns,), multiple, converter))
+
+    @property
+    def columns(self):
+        '''columns used by the spec'''
+        cols = []
+        for _, columns, _, _ in self.spec:
+            cols.extend(c for c in columns if c not in cols)
+        return cols
+
+    def compile(self, header=None):
+        '''return a function mapping a row to a document, header is the list of
+           column names (required if columns are referred by name)'''
+        # as with dict(zip(header, row)), last column wins when names are duplicated
+        positions = {name: i for i, name in enumerate(header or [])}
+        namespace = {}
+        tree = {}
+        # converters shared by several fields, evaluated first
+        stmts = []
+        for paths, columns, multiple, converter in self.spec:
+            args = []
+            for col in columns:
+                if not isinstance(col, int):
+                    try:
+                        col = positions[col]
+                    except KeyError:
+                        raise ValueError("Column '%s' not found in header" % col)
+                args.append("row[%d]" % col)
+            expr = ", ".join(args)
+            if converter is not None:
+                name = "conv%d" % len(namespace)
+                namespace[name] = converter
+                expr = "%s(%s)" % (name, expr)
+            if len(paths) > 1:
+                var = "vals%d" % len(stmts)
+                stmts.append("%s = %s" % (var, expr))
+                exprs = ["%s[%d]" % (var, i) for i in range(len(paths))]
+            else:
+                exprs = [expr]
+            for path, expr in zip(paths, exprs):
+                self._insert(tree, path, expr)
+        body = "".join("    %s\n" % stmt for stmt in stmts)
+        src = "def map_row(row):\n%s    return %s\n" % (body, self._render(tree))
+        exec(compile(src, "<DocMapper>", "exec"), namespace)
+        return namespace["map_row"]
+
+    def _insert(self, tree, path, expr):
+        node = tree
+        for key in path[:-1]:
+            node = node.setdefault(key, {})
+            if not isinstance(node, dict):
+                raise ValueError("Field '%s' is both a value and a document" % ".".join(path))
+        if path[-1] in node:
+            raise ValueError("Field '%s' defined twice" % ".".join(path))
+        node[path[-1]] = expr
+
+    def _render(self, tree):
+        return "{%s}" % ", ".join("%r: %s" % (key, self._render(val) if isinstance(val, dict) else val)
+                                  for key, val in tree.items())
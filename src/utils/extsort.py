@@ -0,0 +1,51 @@
+'''
+External sort: sort an iterable too big to fit in memory.
+
+Items are sorted by runs of run_size items, each sorted run is pickled to a
+temporary file, runs are then k-way merged (heapq.merge) while being read
+back. At most run_size items (plus one per run when merging) are kept in
+memory. As with sorted(), the sort is stable.
+
+    for doc in external_sort(docs, key=lambda d: d["_id"]):
+        ...
+'''
+import heapq
+import pickle
+import tempfile
+from itertools import islice
+
+
+def _spill_run(run, tmp_dir):
+    fout = tempfile.TemporaryFile(dir=tmp_dir)
+    for item in run:
+        pickle.dump(item, fout, protocol=pickle.HIGHEST_PROTOCOL)
+    fout.seek(0)
+    return fout
+
+
+def _read_run(fin):
+    while True:
+        try:
+            yield pickle.load(fin)
+        except EOFError:
+            return
+
+
+def external_sort(iterable, key=None, run_size=100000, tmp_dir=None):
+    '''yield items from iterable sorted by key, sorted runs of run_size items
+       are stored in temporary files (in tmp_dir, system's default if None)'''
+    iterable = iter(iterable)
+    run = sorted(islice(iterable, run_size), key=key)
+    if len(run) < run_size:
+        # fits in memory
+        yield from run
+        return
+    runs = []
+    try:
+        while run:
+            runs.append(_spill_run(run, tmp_dir))
+            run = sorted(islice(iterable, run_size), key=key)
+        yield from heapq.merge(*[_read_run(fin) for fin in runs], key=key)
+    finally:
+        for fin in runs:
+            fin.close()
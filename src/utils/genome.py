@@ -0,0 +1,305 @@
+'''
+On-disk reference genome store.
+
+A genome store is a folder containing, for each chromosome:
+  - "<chrom>.seq": the sequence packed as 2 bits per nucleotide (A=0, C=1,
+    G=2, T=3), 4 nucleotides per byte, first one in the highest bits,
+  - "<chrom>.mask.npy": runs of non-ACGT nucleotides (N or any IUPAC code),
+    as a structured array of (start, end, code), 0-based, end excluded,
+plus an "index.json" file describing chromosomes (length, number of masked
+runs, and whatever metadata the builder added, like source checksums).
+
+Files are memory-mapped when opened, so a store opens in milliseconds and its
+pages are shared by all processes using it, through the OS page cache.
+Coordinates used in the API are 1-based and inclusive, like HGVS and VCF ones.
+'''
+import os
+import json
+import gzip
+import hashlib
+import concurrent.futures
+
+import numpy as np
+
+
+INDEX_FILENAME = "index.json"
+STORE_FORMAT = 1
+NUCS = "ACGT"
+MASK_DTYPE = np.dtype([("start", np.int64), ("end", np.int64), ("code", np.uint8)])
+# chromosome aliases, names in store are "1".."22", "X", "Y", "MT"
+CHROM_ALIASES = {"M": "MT"}
+
+# ascii code => 2-bit code, and whether the nucleotide is ACGT (not masked)
+NUC_TO_CODE = np.zeros(256, dtype=np.uint8)
+NUC_IS_ACGT = np.zeros(256, dtype=bool)
+for _i, _nuc in enumerate(NUCS):
+    for _c in (_nuc, _nuc.lower()):
+        NUC_TO_CODE[ord(_c)] = _i
+        NUC_IS_ACGT[ord(_c)] = True
+# packed byte => the 4 ascii nucleotides it holds
+CODE_TO_NUC = np.frombuffer(NUCS.encode(), dtype=np.uint8)
+BYTE_TO_NUCS = np.array([[CODE_TO_NUC[(b >> shift) & 3] for shift in (6, 4, 2, 0)] for b in range(256)],
+                        dtype=np.uint8)
+
+
+def seq_filename(folder, chrom):
+    return os.path.join(folder, "%s.seq" % chrom)
+
+
+def mask_filename(folder, chrom):
+    return os.path.join(folder, "%s.mask.npy" % chrom)
+
+
+class ChromEncoder(object):
+    '''Encode a chromosome sequence, given as successive chunks of
+       nucleotides (eg. FASTA lines), into a genome store.'''
+
+    def __init__(self, folder, chrom):
+        self.folder = folder
+        self.chrom = chrom
+        self.length = 0
+        # files are written aside and renamed when complete, so processes
+        # having a previous version mapped in memory aren't affected
+        self._fseq = open(seq_filename(folder, chrom) + ".tmp", "wb")
+        self._pending = np.empty(0, dtype=np.uint8)
+        self._runs = []
+
+    def add(self, chunk):
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        nucs = np.frombuffer(chunk.strip(), dtype=np.uint8)
+        if not len(nucs):
+            return
+        self._add_mask_runs(nucs)
+        self.length += len(nucs)
+        codes = NUC_TO_CODE[nucs]
+        if len(self._pending):
+            codes = np.concatenate([self._pending, codes])
+        full = len(codes) - len(codes) % 4
+        self._write(codes[:full])
+        self._pending = codes[full:]
+
+    def _add_mask_runs(self, nucs):
+        masked = ~NUC_IS_ACGT[nucs]
+        if not masked.any():
+            return
+        upper = np.where((nucs >= 97) & (nucs <= 122), nucs - 32, nucs).astype(np.uint8)
+        # a run starts wherever masked and (previous not masked or different code)
+        idx = np.flatnonzero(masked)
+        breaks = np.flatnonzero((np.diff(idx) != 1) | (np.diff(upper[idx].astype(np.int16)) != 0)) + 1
+        starts = idx[np.concatenate([[0], breaks])]
+        ends = idx[np.concatenate([breaks - 1, [len(idx) - 1]])] + 1
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            code = int(upper[start])
+            start += self.length
+            end += self.length
+            # merge with previous run if contiguous (run spanning chunks)
+            if self._runs and self._runs[-1][1] == start and self._runs[-1][2] == code:
+                self._runs[-1] = (self._runs[-1][0], end, code)
+            else:
+                self._runs.append((start, end, code))
+
+    def _write(self, codes):
+        if not len(codes):
+            return
+        codes = codes.reshape(-1, 4)
+        packed = (codes[:, 0] << 6) | (codes[:, 1] << 4) | (codes[:, 2] << 2) | codes[:, 3]
+        self._fseq.write(packed.astype(np.uint8).tobytes())
+
+    def close(self):
+        '''flush remaining data and return chromosome metadata (for the index)'''
+        if len(self._pending):
+            padding = np.zeros(4 - len(self._pending), dtype=np.uint8)
+            self._write(np.concatenate([self._pending, padding]))
+            self._pending = np.empty(0, dtype=np.uint8)
+        self._fseq.close()
+        mask_fn = mask_filename(self.folder, self.chrom)
+        with open(mask_fn + ".tmp", "wb") as fmask:
+            np.save(fmask, np.array(self._runs, dtype=MASK_DTYPE))
+        os.rename(self._fseq.name, seq_filename(self.folder, self.chrom))
+        os.rename(mask_fn + ".tmp", mask_fn)
+        return {"length": self.length, "masked_runs": len(self._runs)}
+
+
+def encode_chrom(folder, chrom, chunks):
+    '''encode whole chromosome from chunks iterable, return its metadata'''
+    encoder = ChromEncoder(folder, chrom)
+    for chunk in chunks:
+        encoder.add(chunk)
+    return encoder.close()
+
+
+def fasta_chunks(fasta_file, block_size=16 * 1024**2):
+    '''iterate over blocks of nucleotides (bytes) from a single sequence
+       FASTA file, possibly gzipped, skipping header and newlines'''
+    opener = gzip.open if fasta_file.endswith(".gz") else open
+    with opener(fasta_file, "rb") as fin:
+        header = fin.readline()
+        assert header.startswith(b">"), "Not a FASTA file: %s" % fasta_file
+        while True:
+            block = fin.read(block_size)
+            if not block:
+                break
+            yield block.translate(None, b"\r\n")
+
+
+def file_checksum(filename, block_size=16 * 1024**2):
+    md5 = hashlib.md5()
+    with open(filename, "rb") as fin:
+        for block in iter(lambda: fin.read(block_size), b""):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def build_chrom(folder, chrom, fasta_file, previous=None):
+    '''encode chromosome from fasta_file into genome store folder, unless
+       previous metadata shows it was built from the same file content.
+       Return chromosome metadata.'''
+    checksum = file_checksum(fasta_file)
+    if previous and previous.get("checksum") == checksum and \
+            os.path.exists(seq_filename(folder, chrom)) and os.path.exists(mask_filename(folder, chrom)):
+        return dict(previous, skipped=True)
+    meta = encode_chrom(folder, chrom, fasta_chunks(fasta_file))
+    meta.update({"source": os.path.basename(fasta_file), "checksum": checksum})
+    return meta
+
+
+def build_genome_store(chr_fa_folder, folder, chroms=None, pattern="chr{}.fa.gz",
+                       max_workers=None, force=False, logger=None):
+    '''build genome store in folder from chromosome FASTA files found in
+       chr_fa_folder (eg. chr1.fa.gz, see utils.validate.get_genome_in_bit for sources).
+       Chromosomes are encoded in parallel, each in its own process, and
+       those whose FASTA file didn't change since last build are skipped
+       (unless force=True). Return the index.'''
+    chroms = chroms or [str(i) for i in range(1, 23)] + ['X', 'Y', 'MT']
+    os.makedirs(folder, exist_ok=True)
+    previous = {}
+    if os.path.exists(os.path.join(folder, INDEX_FILENAME)):
+        previous = read_index(folder)["chroms"]
+    # chromosomes not built in this call are kept in the index
+    metas = dict(previous)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for chrom in chroms:
+            fasta_file = os.path.join(chr_fa_folder, pattern.format(chrom))
+            futures[executor.submit(build_chrom, folder, chrom, fasta_file,
+                                    None if force else previous.get(chrom))] = chrom
+        for future in concurrent.futures.as_completed(futures):
+            chrom = futures[future]
+            meta = future.result()
+            if meta.pop("skipped", False):
+                logger and logger.info("Chromosome %s unchanged, skipped" % chrom)
+            else:
+                logger and logger.info("Chromosome %s encoded (%d nucleotides)" % (chrom, meta["length"]))
+            metas[chrom] = meta
+    return write_index(folder, metas, source=chr_fa_folder)
+
+
+def read_index(folder):
+    with open(os.path.join(folder, INDEX_FILENAME)) as fin:
+        index = json.load(fin)
+    if index.get("format") != STORE_FORMAT:
+        raise ValueError("Unsupported genome store format in '%s': %s" % (folder, index.get("format")))
+    return index
+
+
+def write_index(folder, chroms, **meta):
+    '''write index for chromosomes (dict of chrom => metadata) found in folder'''
+    index = {"format": STORE_FORMAT, "chroms": chroms}
+    index.update(meta)
+    tmpfn = os.path.join(folder, INDEX_FILENAME + ".tmp")
+    with open(tmpfn, "w") as fout:
+        json.dump(index, fout, indent=2, sort_keys=True)
+    os.rename(tmpfn, os.path.join(folder, INDEX_FILENAME))
+    return index
+
+
+class GenomeStore(object):
+    '''Read-only access to a genome store folder'''
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.index = read_index(folder)
+        self._chroms = {}
+
+    def __contains__(self, chrom):
+        return CHROM_ALIASES.get(chrom, chrom) in self.index["chroms"]
+
+    @property
+    def chroms(self):
+        return list(self.index["chroms"].keys())
+
+    def length(self, chrom):
+        return self.index["chroms"][CHROM_ALIASES.get(chrom, chrom)]["length"]
+
+    def _get(self, chrom):
+        chrom = CHROM_ALIASES.get(chrom, chrom)
+        data = self._chroms.get(chrom)
+        if data is None:
+            meta = self.index["chroms"][chrom]
+            if meta["length"]:
+                seq = np.memmap(seq_filename(self.folder, chrom), dtype=np.uint8, mode="r")
+            else:
+                seq = np.empty(0, dtype=np.uint8)
+            mask = np.load(mask_filename(self.folder, chrom), mmap_mode="r")
+            data = self._chroms[chrom] = (seq, mask, meta["length"])
+        return data
+
+    def fetch_bytes(self, chrom, start, end):
+        '''return nucleotides from start to end (1-based, inclusive) as an
+           array of ascii codes'''
+        seq, mask, length = self._get(chrom)
+        if not (1 <= start <= end <= length):
+            raise ValueError("Invalid range %s:%s-%s (chromosome length is %s)" % (chrom, start, end, length))
+        i0, i1 = start - 1, end
+        b0 = i0 >> 2
+        nucs = BYTE_TO_NUCS[seq[b0:(i1 + 3) >> 2]].ravel()[i0 - 4 * b0:i1 - 4 * b0]
+        if len(mask):
+            lo = np.searchsorted(mask["end"], i0, side="right")
+            hi = np.searchsorted(mask["start"], i1, side="left")
+            for run_start, run_end, code in mask[lo:hi].tolist():
+                nucs[max(run_start, i0) - i0:min(run_end, i1) - i0] = code
+        return nucs
+
+    def fetch(self, chrom, start, end):
+        '''return nucleotides from start to end (1-based, inclusive) as a string'''
+        return self.fetch_bytes(chrom, start, end).tobytes().decode()
+
+    def bases_at(self, chrom, positions):
+        '''return nucleotides found at each position (1-based) as an array of
+           ascii codes. Positions out of chromosome are returned as 0.'''
+        seq, mask, length = self._get(chrom)
+        positions = np.asarray(positions, dtype=np.int64)
+        valid = (positions >= 1) & (positions <= length)
+        idx = np.where(valid, positions - 1, 0)
+        shifts = (6 - 2 * (idx & 3)).astype(np.uint8)
+        nucs = CODE_TO_NUC[(seq[idx >> 2] >> shifts) & 3] if length else np.zeros(len(idx), dtype=np.uint8)
+        if len(mask):
+            run = np.searchsorted(mask["start"], idx, side="right") - 1
+            inrun = (run >= 0) & (idx < np.asarray(mask["end"])[np.maximum(run, 0)])
+            nucs[inrun] = np.asarray(mask["code"])[run[inrun]]
+        nucs[~valid] = 0
+        return nucs
+
+
+# 4-bit codes used in pickled bitarray genomes (see utils.validate.nuc_to_bit)
+BITARRAY_GENOME_CODES = {'Y': '0000', 'A': '0001', 'C': '0010', 'G': '0011', 'T': '0100',
+                         'N': '0101', 'M': '0110', 'R': '0111', 'W': '1000', 'K': '1001'}
+
+
+def convert_bitarray_genome(genome_file, folder, chunk_size=1000000, logger=None):
+    '''convert a pickled dict of chrom => bitarray (4 bits per nucleotide) into
+       a genome store in folder'''
+    from bitarray import bitarray
+    from biothings.utils.common import loadobj
+    code = dict((k, bitarray(v)) for k, v in BITARRAY_GENOME_CODES.items())
+    genome = loadobj(genome_file)
+    os.makedirs(folder, exist_ok=True)
+    chroms = {}
+    for chrom in sorted(genome):
+        logger and logger.info("Converting chromosome %s" % chrom)
+        bits = genome[chrom]
+        step = chunk_size * 4
+        chunks = ("".join(bits[i:i + step].decode(code)) for i in range(0, len(bits), step))
+        chroms[chrom] = encode_chrom(folder, chrom, chunks)
+    return write_index(folder, chroms, source=os.path.basename(genome_file))
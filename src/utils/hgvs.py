@@ -1,13 +1,85 @@
 import re
+import os
 import copy
+import hashlib
+import itertools
+from collections import namedtuple
 import requests
+import numpy as np
+
+from utils.rsid_index import CollectionRsidResolver
+
+
+# One compiled pattern for all the genomic HGVS IDs we produce
+# ("chrN:g." SNV, del, ins, delins and dup). Groups are:
+# chrom, start, end, snp ref, snp alt, delins seq, del seq, ins seq, dup seq,
+# so match.lastindex tells directly which kind of variant was matched.
+HGVS_PAT = re.compile(r'^chr(\w+):g\.(\d+)(?:_(\d+))?'
+                      r'(?:([A-Z])>([A-Z])|delins([A-Z]+)|del([A-Z]*)|ins([A-Z]+)|dup([A-Z]*))$')
+
+# compact typed record for a parsed genomic HGVS ID. start/end are ints
+# (end == start for single position IDs). "ref" holds the SNP reference base,
+# or the deleted/duplicated sequence when the ID carries it, "alt" holds the
+# SNP alternate base or the inserted sequence. Missing values are None.
+HgvsVariant = namedtuple("HgvsVariant", ["chrom", "start", "end", "vartype", "ref", "alt"])
+
+
+def parse_hgvs(hgvs_id):
+    '''parse a genomic hgvs_id (eg. "chr1:g.1234A>G", "chr2:g.10_12del")
+       into a HgvsVariant record. Returns None if hgvs_id can't be parsed.'''
+    mat = HGVS_PAT.match(hgvs_id)
+    if mat is None:
+        return None
+    chrom, start, end, ref, alt, delins, dele, ins, dup = mat.groups()
+    start = int(start)
+    end = int(end) if end else start
+    idx = mat.lastindex
+    if idx == 5:
+        if end != start:
+            return None
+        return HgvsVariant(chrom, start, end, "snp", ref, alt)
+    elif idx == 6:
+        return HgvsVariant(chrom, start, end, "delins", None, delins)
+    elif idx == 7:
+        return HgvsVariant(chrom, start, end, "del", dele or None, None)
+    elif idx == 8:
+        return HgvsVariant(chrom, start, end, "ins", None, ins)
+    else:
+        return HgvsVariant(chrom, start, end, "dup", dup or None, None)
+
+
+def parse_many(hgvs_ids):
+    '''parse a list of hgvs_ids, return a list of HgvsVariant records
+       (None for IDs which couldn't be parsed), in the same order.'''
+    return [parse_hgvs(hgvs_id) for hgvs_id in hgvs_ids]
+
+
+def format_hgvs(variant):
+    '''return the hgvs_id for a HgvsVariant record (reverse of parse_hgvs())'''
+    chrom, start, end, vartype, ref, alt = variant
+    if vartype == "snp":
+        return "chr%s:g.%d%s>%s" % (chrom, start, ref, alt)
+    if start == end:
+        pos = "%d" % start
+    else:
+        pos = "%d_%d" % (start, end)
+    if vartype == "del" or vartype == "dup":
+        return "chr%s:g.%s%s%s" % (chrom, pos, vartype, ref or "")
+    elif vartype == "ins" or vartype == "delins":
+        return "chr%s:g.%s%s%s" % (chrom, pos, vartype, alt)
+    else:
+        raise ValueError("Unknown variant type in %s" % repr(variant))
+
+
+def format_many(variants):
+    '''return the list of hgvs_ids for a list of HgvsVariant records'''
+    return [format_hgvs(variant) for variant in variants]
 
 
 def is_snp(hgvs_id):
     '''return True/False if a hgvs id a SNP or not.'''
-    pat = 'chr(\w+):g\.(\d+)(\w)\>(\w)'
-    mat = re.match(pat, hgvs_id)
-    return mat is not None
+    variant = parse_hgvs(hgvs_id)
+    return variant is not None and variant.vartype == "snp"
 
 
 def reverse_complement_seq(seq):
@@ -17,7 +89,7 @@ def reverse_complement_seq(seq):
         "C": "G",
         "G": "C"
     }
-    for k in seq_d.keys():
+    for k in list(seq_d.keys()):
         seq_d[k.lower()] = seq_d[k].lower()
     return ''.join(seq_d[base] for base in reversed(seq))
 
@@ -25,25 +97,14 @@ def reverse_complement_seq(seq):
 def reverse_complement_hgvs(hgvs_id):
     '''return a complementary version of hgvs_id.
     works only for SNP, ins, delins variant for now.'''
-    pat_snp = '(chr\w+:g\.\d+)(\w)\>(\w)'
-    pat_ins = '(chr\w+:g\.\d+_\d+)ins(\w+)'
-    pat_del_ins = '(chr\w+:g\.\d+_\d+)delins(\w+)'
+    variant = parse_hgvs(hgvs_id)
     # complement SNP ID
-    if re.match(pat_snp, hgvs_id):
-        g = re.match(pat_snp, hgvs_id).groups()
-        return '{}{}>{}'.format(g[0],
-                                reverse_complement_seq(g[1]),
-                                reverse_complement_seq(g[2]))
-    # reverse complement ins ID
-    elif re.match(pat_ins, hgvs_id):
-        g = re.match(pat_ins, hgvs_id).groups()
-        return '{}ins{}'.format(g[0],
-                                reverse_complement_seq(g[1]))
-    # reverse complement del_ins ID
-    elif re.match(pat_del_ins, hgvs_id):
-        g = re.match(pat_del_ins, hgvs_id).groups()
-        return '{}delins{}'.format(g[0],
-                                   reverse_complement_seq(g[1]))
+    if variant and variant.vartype == "snp":
+        return format_hgvs(variant._replace(ref=reverse_complement_seq(variant.ref),
+                                            alt=reverse_complement_seq(variant.alt)))
+    # reverse complement ins and del_ins ID
+    elif variant and variant.vartype in ("ins", "delins"):
+        return format_hgvs(variant._replace(alt=reverse_complement_seq(variant.alt)))
     else:
         raise ValueError("Not a Valid HGVS ID")
 
@@ -134,6 +195,159 @@ def get_hgvs_from_vcf(chr, pos, ref, alt, mutant_type=None):
         return hgvs
 
 
+VALID_REF_PAT = re.compile('[ACGTN]+')
+VALID_ALT_PAT = re.compile('[ACGTN*]+')
+
+def _vcf_columns(chrs, positions, refs, alts):
+    '''return VCF columns as same-length lists, broadcasting single values'''
+    alts = list(alts)
+    num = len(alts)
+    refs = [refs] * num if isinstance(refs, str) else list(refs)
+    chrs = [chrs] * num if isinstance(chrs, str) else list(chrs)
+    positions = np.asarray(positions, dtype=np.int64)
+    if positions.ndim == 0:
+        positions = np.full(num, positions, dtype=np.int64)
+    assert len(chrs) == len(positions) == num == len(refs), "Columns have different lengths"
+    return chrs, positions.tolist(), refs, alts
+
+
+# number of reference nucleotides fetched on the left of indels to normalize
+# them, more is fetched when the indel is in a longer repeat
+NORMALIZE_WINDOW = 64
+
+def _left_align(pos, ref, alt, context, ctx_start):
+    '''left-align and trim (pos, ref, alt), context being the reference sequence
+       from ctx_start (1-based) to pos - 1. Return normalized (pos, ref, alt), or
+       None if context is too short.'''
+    while True:
+        if ref and alt and ref[-1] == alt[-1]:
+            ref, alt = ref[:-1], alt[:-1]
+        elif not ref or not alt:
+            if pos <= ctx_start:
+                return None
+            pos -= 1
+            base = context[pos - ctx_start]
+            ref, alt = base + ref, base + alt
+        else:
+            break
+    while len(ref) > 1 and len(alt) > 1 and ref[0] == alt[0]:
+        ref, alt, pos = ref[1:], alt[1:], pos + 1
+    return pos, ref, alt
+
+
+def normalize_vcf_many(genome, chrs, positions, refs, alts, window=NORMALIZE_WINDOW):
+    '''left-align and trim VCF-style records against reference genome (a
+       utils.genome.GenomeStore), so an indel gets the same representation (and
+       hgvs id) whatever the source, even within a repeat. Columns are given as in
+       get_hgvs_from_vcf_many(), normalized ones are returned as lists. Invalid
+       records and records on chromosomes missing in genome are left untouched.'''
+    chrs, positions, refs, alts = _vcf_columns(chrs, positions, refs, alts)
+    by_chrom = {}
+    for i, (chrom, ref, alt) in enumerate(zip(chrs, refs, alts)):
+        if (len(ref) > 1 or len(alt) > 1) and ref != alt and chrom in genome \
+                and VALID_REF_PAT.fullmatch(ref) and VALID_REF_PAT.fullmatch(alt) \
+                and 1 <= positions[i] <= genome.length(chrom):
+            by_chrom.setdefault(chrom, []).append(i)
+    for chrom, idxs in by_chrom.items():
+        # fetch left context of all indels at once
+        pos = np.array([positions[i] for i in idxs], dtype=np.int64)
+        ctx_starts = np.maximum(pos - window, 1)
+        lens = pos - ctx_starts
+        offsets = np.cumsum(lens) - lens
+        contexts = genome.bases_at(chrom, np.repeat(ctx_starts - offsets, lens) + np.arange(lens.sum()))
+        contexts = contexts.tobytes().decode()
+        for i, ctx_start, offset, length in zip(idxs, ctx_starts.tolist(), offsets.tolist(), lens.tolist()):
+            context = contexts[offset:offset + length]
+            res = _left_align(positions[i], refs[i], alts[i], context, ctx_start)
+            while res is None and ctx_start > 1:
+                # longer repeat than window, get more context
+                ctx_start = max(ctx_start - len(context), 1)
+                context = genome.fetch(chrom, ctx_start, positions[i] - 1)
+                res = _left_align(positions[i], refs[i], alts[i], context, ctx_start)
+            if res:
+                positions[i], refs[i], alts[i] = res
+    return chrs, positions, refs, alts
+
+
+def get_hgvs_from_vcf_many(chrs, positions, refs, alts, mutant_type=False, skip_invalid=False, genome=None):
+    '''columnar version of get_hgvs_from_vcf(): chrs, positions, refs and alts
+       are same-length sequences. chrs, positions and refs can also be single values,
+       shared by all records (eg. all alleles of a multi-allelic VCF record).
+       If genome (a utils.genome.GenomeStore) is given, indels are first
+       normalized against it (see normalize_vcf_many()).
+       Returns the list of hgvs ids, and the list of variant types if mutant_type.
+       Invalid records raise a ValueError, or get None values if skip_invalid.'''
+    if genome is not None:
+        chrs, positions, refs, alts = normalize_vcf_many(genome, chrs, positions, refs, alts)
+    chrs, positions, refs, alts = _vcf_columns(chrs, positions, refs, alts)
+    num = len(alts)
+    positions = np.array(positions, dtype=np.int64)
+    hgvs_ids = [None] * num
+    var_types = [None] * num
+    if not num:
+        return (hgvs_ids, var_types) if mutant_type else hgvs_ids
+    ref_lens = np.fromiter(map(len, refs), dtype=np.int64, count=num)
+    alt_lens = np.fromiter(map(len, alts), dtype=np.int64, count=num)
+    # validate all alleles in one scan, only look for culprits if needed
+    valid = (ref_lens > 0) & (alt_lens > 0)
+    if not (valid.all() and VALID_REF_PAT.fullmatch("".join(refs))
+                        and VALID_ALT_PAT.fullmatch("".join(alts))):
+        valid &= np.fromiter((bool(VALID_REF_PAT.fullmatch(r) and VALID_ALT_PAT.fullmatch(a))
+                              for r, a in zip(refs, alts)), dtype=bool, count=num)
+    first_eq = np.fromiter((r[:1] == a[:1] for r, a in zip(refs, alts)), dtype=bool, count=num)
+    ends = (positions + ref_lens - 1).tolist()
+    positions = positions.tolist()
+    ref_one = ref_lens == 1
+    alt_one = alt_lens == 1
+
+    def fill(mask, vtype, fmt):
+        for i in np.flatnonzero(mask & valid).tolist():
+            hgvs_ids[i] = fmt(i)
+            var_types[i] = vtype
+
+    fill(ref_one & alt_one, "snp",
+         lambda i: 'chr%s:g.%d%s>%s' % (chrs[i], positions[i], refs[i], alts[i]))
+    # deletions, single nt deletion doesn't have a range
+    is_del = ~ref_one & alt_one & first_eq
+    fill(is_del & (ref_lens == 2), "del",
+         lambda i: 'chr%s:g.%ddel' % (chrs[i], positions[i] + 1))
+    fill(is_del & (ref_lens > 2), "del",
+         lambda i: 'chr%s:g.%d_%ddel' % (chrs[i], positions[i] + 1, ends[i]))
+    # insertions
+    fill(ref_one & ~alt_one & first_eq, "ins",
+         lambda i: 'chr%s:g.%d_%dins%s' % (chrs[i], positions[i], positions[i] + 1, alts[i][1:]))
+    fill(ref_one & ~alt_one & ~first_eq, "delins",
+         lambda i: 'chr%s:g.%ddelins%s' % (chrs[i], positions[i], alts[i]))
+    fill(~ref_one & ~first_eq, "delins",
+         lambda i: 'chr%s:g.%d_%ddelins%s' % (chrs[i], positions[i], ends[i], alts[i]))
+    # ref and alt overlap from the left, trim them and convert in a second pass
+    to_trim = np.flatnonzero(~ref_one & ~alt_one & first_eq & valid).tolist()
+    if to_trim:
+        trimmed = []
+        for i in to_trim:
+            ref, alt = refs[i], alts[i]
+            prefix = len(os.path.commonprefix([ref, alt]))
+            if prefix == len(ref) or prefix == len(alt):
+                # del or ins types, keep one anchor base (identical ref and
+                # alt end up as a single base "SNP", as get_hgvs_from_vcf() does)
+                prefix -= 1
+            trimmed.append((i, positions[i] + prefix, ref[prefix:], alt[prefix:]))
+        if trimmed:
+            idxs, tpos, trefs, talts = zip(*trimmed)
+            tids, ttypes = get_hgvs_from_vcf_many([chrs[i] for i in idxs], tpos, trefs, talts,
+                                                  mutant_type=True, skip_invalid=skip_invalid)
+            for i, hgvs_id, var_type in zip(idxs, tids, ttypes):
+                hgvs_ids[i] = hgvs_id
+                var_types[i] = var_type
+    if not skip_invalid and not valid.all():
+        i = int(np.flatnonzero(~valid)[0])
+        raise ValueError("Cannot convert {} into HGVS id.".format((chrs[i], positions[i], refs[i], alts[i])))
+    if mutant_type:
+        return hgvs_ids, var_types
+    else:
+        return hgvs_ids
+
+
 def get_pos_start_end(chr, pos, ref, alt):
     '''get start,end tuple from VCF-style "chr, pos, ref, alt" data.'''
     try:
@@ -161,6 +375,9 @@ def get_pos_start_end(chr, pos, ref, alt):
     return start, end
 
 
+FIXABLE_SNP_PAT = re.compile(r'(chr\w+:g\.(\d+))([\w-])\>([\w-])')
+
+
 def fix_hgvs_indel(hgvs_id):
     """Fix hgvs id like these:
          'chr19:g.58863869C>-',
@@ -170,9 +387,9 @@ def fix_hgvs_indel(hgvs_id):
          'chr12:g.9004916C>-',
     """
     _hgvs_id = None
-    pat_snp = '(chr\w+:g\.(\d+))([\w-])\>([\w-])'
-    if re.match(pat_snp, hgvs_id):
-        g = re.match(pat_snp, hgvs_id).groups()
+    mat = FIXABLE_SNP_PAT.match(hgvs_id)
+    if mat:
+        g = mat.groups()
         pos, ref, alt = g[1:]
         if ref == '-':
             # should be insertion
@@ -188,39 +405,311 @@ def fix_hgvs_indel(hgvs_id):
     return _hgvs_id
 
 
-def get_hgvs_from_rsid(doc_li, rsid_fn, dbsnp_col, skip_unmatched=False):
+def get_hgvs_from_rsid(doc_li, rsid_fn, dbsnp_col, skip_unmatched=False, batch_size=10000):
     """input doc_li is a list doc with rsid, rsid_fn is a function to return rsid from
-       each doc. dbsnp_col is a mongo collection object for dbSNP data
+       each doc. dbsnp_col is a mongo collection object for dbSNP data, or a
+       utils.rsid_index.RsidIndex (rsids are then resolved by batch, without any query).
        It will return a generator with the _id as the matching hgvs_id for a given rsid.
        if a rsid matches multiple hgvs ids, it will produce duplicated docs with each hgvs id.
        If rsid_fn returns None, then the original document is yielded
     """
-    for doc in doc_li:
-        rsid = rsid_fn(doc)
-        if rsid is None:
-            yield doc
-        hits = [d for d in dbsnp_col.find({"dbsnp.rsid":rsid})]
-        if hits:
-            for hit in hits:
-                hgvs_id = hit['_id']
-                _doc = copy.copy(doc)
-                _doc['_id'] = hgvs_id
-                yield _doc
-        elif skip_unmatched:
-            yield doc
+    if not hasattr(dbsnp_col, "resolve_many"):
+        dbsnp_col = CollectionRsidResolver(dbsnp_col)
+    doc_li = iter(doc_li)
+    while True:
+        docs = list(itertools.islice(doc_li, batch_size))
+        if not docs:
+            break
+        rsids = [rsid_fn(doc) for doc in docs]
+        hits = iter(dbsnp_col.resolve_many([rsid for rsid in rsids if rsid is not None]))
+        for doc, rsid in zip(docs, rsids):
+            if rsid is None:
+                yield doc
+                continue
+            hgvs_ids = next(hits)
+            if hgvs_ids:
+                for hgvs_id in hgvs_ids:
+                    _doc = copy.copy(doc)
+                    _doc['_id'] = hgvs_id
+                    yield _doc
+            elif skip_unmatched:
+                yield doc
+
+TRIM_DELINS_PAT = re.compile("(.*del)[A-Z]+(ins.*)")
+TRIM_INS_PAT = re.compile("(.*ins)[A-Z]+$")
+TRIM_DEL_PAT = re.compile("(.*del)[A-Z]+$")
+TRIM_DUP_PAT = re.compile("(.*dup)[A-Z]+$")
 
 def trim_delseq_from_hgvs(hgvs):
-    re_delins = re.compile("(.*del)[A-Z]+(ins.*)")
-    re_ins = re.compile("(.*ins)[A-Z]+$")
-    re_del = re.compile("(.*del)[A-Z]+$")
-    re_dup = re.compile("(.*dup)[A-Z]+$")
-    if re_delins.match(hgvs):
-        hgvs = "".join(re_delins.match(hgvs).groups())
-    elif re_ins.match(hgvs):
-        hgvs = "".join(re_ins.match(hgvs).groups())
-    elif re_del.match(hgvs):
-        hgvs = "".join(re_del.match(hgvs).groups())
-    elif re_dup.match(hgvs):
-        hgvs = "".join(re_dup.match(hgvs).groups())
-    
+    for pat in (TRIM_DELINS_PAT, TRIM_INS_PAT, TRIM_DEL_PAT, TRIM_DUP_PAT):
+        mat = pat.match(hgvs)
+        if mat:
+            return "".join(mat.groups())
     return hgvs
+
+
+# Packed 64-bit variant keys
+# --------------------------
+# SNVs are packed into a single uint64:
+#   bits 36-41: chromosome index (see KEY_CHROMS), bits 4-35: position,
+#   bits 2-3: ref base, bits 0-1: alt base
+# so sorting keys sorts SNVs by chrom/pos. Anything else (indels, SNVs on
+# unknown chromosomes or with non-ACGT bases) is interned in the codec's
+# side-table and gets a key with INDEL_KEY_FLAG set, holding its serial number.
+# Such keys are only meaningful for the codec instance which produced them.
+KEY_CHROMS = [str(i) for i in range(1, 23)] + ['X', 'Y', 'MT', 'M']
+KEY_CHROM_IDX = dict((c, i + 1) for i, c in enumerate(KEY_CHROMS))
+KEY_NUCS = "ACGT"
+KEY_NUC_IDX = dict((n, i) for i, n in enumerate(KEY_NUCS))
+KEY_CHROM_SHIFT = 36
+KEY_POS_SHIFT = 4
+KEY_POS_MAX = (1 << (KEY_CHROM_SHIFT - KEY_POS_SHIFT)) - 1
+INDEL_KEY_FLAG = 1 << 63
+
+
+
+def pack_snv(hgvs_id):
+    '''return the packed key (as python int) for a SNV hgvs_id, or None if
+       hgvs_id can't be packed'''
+    mat = HGVS_PAT.match(hgvs_id)
+    if mat is not None and mat.lastindex == 5 and mat.group(3) is None:
+        chrom, pos = mat.group(1), mat.group(2)
+        chrom_idx = KEY_CHROM_IDX.get(chrom)
+        ref = KEY_NUC_IDX.get(mat.group(4))
+        alt = KEY_NUC_IDX.get(mat.group(5))
+        # leading zeros in position wouldn't survive a round-trip
+        if chrom_idx and ref is not None and alt is not None and pos[0] != "0":
+            pos = int(pos)
+            if pos <= KEY_POS_MAX:
+                return (chrom_idx << KEY_CHROM_SHIFT) | (pos << KEY_POS_SHIFT) | (ref << 2) | alt
+    return None
+
+
+def hash_id(hgvs_id):
+    '''return a stable 63-bit hash of hgvs_id, with INDEL_KEY_FLAG set'''
+    return INDEL_KEY_FLAG | int.from_bytes(hashlib.blake2b(hgvs_id.encode(), digest_size=8).digest(), "little")
+
+
+def stable_keys(hgvs_ids):
+    '''return a uint64 array of keys for hgvs_ids, not depending on any codec
+       instance: packed key for SNVs, hash_id() for other IDs'''
+    return np.fromiter((pack_snv(hgvs_id) or hash_id(hgvs_id) for hgvs_id in hgvs_ids), dtype=np.uint64)
+
+
+class VariantKeyCodec(object):
+    '''encode/decode hgvs_ids to/from packed uint64 keys. SNVs are packed
+       in the key itself, other IDs are interned in a side-table.'''
+
+    def __init__(self):
+        self._interned_ids = []
+        self._interned_keys = {}
+
+    def __len__(self):
+        # number of interned (non packable) IDs
+        return len(self._interned_ids)
+
+    def intern(self, hgvs_id):
+        key = self._interned_keys.get(hgvs_id)
+        if key is None:
+            key = INDEL_KEY_FLAG | len(self._interned_ids)
+            self._interned_ids.append(hgvs_id)
+            self._interned_keys[hgvs_id] = key
+        return key
+
+    def encode(self, hgvs_id):
+        '''return the uint64 key (as python int) for hgvs_id'''
+        return pack_snv(hgvs_id) or self.intern(hgvs_id)
+
+    def decode(self, key):
+        '''return the hgvs_id for a key produced by encode()'''
+        key = int(key)
+        if key & INDEL_KEY_FLAG:
+            return self._interned_ids[key ^ INDEL_KEY_FLAG]
+        return "chr%s:g.%d%s>%s" % (KEY_CHROMS[(key >> KEY_CHROM_SHIFT) - 1],
+                                    (key >> KEY_POS_SHIFT) & KEY_POS_MAX,
+                                    KEY_NUCS[(key >> 2) & 3], KEY_NUCS[key & 3])
+
+    def encode_many(self, hgvs_ids):
+        '''return a numpy uint64 array of keys for hgvs_ids'''
+        encode = self.encode
+        return np.fromiter((encode(hgvs_id) for hgvs_id in hgvs_ids), dtype=np.uint64)
+
+    def decode_many(self, keys):
+        '''return the list of hgvs_ids for an array of keys. Chrom, position
+           and bases of SNV keys are extracted in bulk.'''
+        keys = np.asarray(keys, dtype=np.uint64)
+        interned = (keys & np.uint64(INDEL_KEY_FLAG)) != 0
+        chroms = ((keys >> np.uint64(KEY_CHROM_SHIFT)) & np.uint64(0x3f)).tolist()
+        positions = ((keys >> np.uint64(KEY_POS_SHIFT)) & np.uint64(KEY_POS_MAX)).tolist()
+        refs = ((keys >> np.uint64(2)) & np.uint64(3)).tolist()
+        alts = (keys & np.uint64(3)).tolist()
+        serials = (keys & np.uint64(~INDEL_KEY_FLAG & 0xffffffffffffffff)).tolist()
+        out = []
+        for i, is_interned in enumerate(interned.tolist()):
+            if is_interned:
+                out.append(self._interned_ids[serials[i]])
+            else:
+                out.append("chr%s:g.%d%s>%s" % (KEY_CHROMS[chroms[i] - 1], positions[i],
+                                                KEY_NUCS[refs[i]], KEY_NUCS[alts[i]]))
+        return out
+
+
+
+def _concat_ids(hgvs_ids):
+    '''return hgvs_ids concatenated as a uint8 array, and IDs boundaries'''
+    data = [hgvs_id.encode() for hgvs_id in hgvs_ids]
+    lens = np.fromiter(map(len, data), dtype=np.int64, count=len(data))
+    return np.frombuffer(b"".join(data), dtype=np.uint8), np.concatenate([[0], np.cumsum(lens)]).astype(np.int64)
+
+
+class VariantKeySet(object):
+    '''Exact set of hgvs_ids, stored as sorted numpy arrays:
+      - snv_keys: packed keys of SNVs (see pack_snv()), unique,
+      - indel_keys: hash_id() of other IDs, the IDs themselves being
+        concatenated in the same order in indel_strings (boundaries in
+        indel_offsets), so hash collisions are resolved by comparing IDs.
+    Membership tests and set operations are vectorized (np.searchsorted),
+    and nothing is interned when querying.'''
+
+    ARRAYS = ("snv_keys", "indel_keys", "indel_offsets", "indel_strings")
+
+    def __init__(self, snv_keys=None, indel_keys=None, indel_offsets=None, indel_strings=None):
+        self.snv_keys = np.empty(0, dtype=np.uint64) if snv_keys is None else snv_keys
+        self.indel_keys = np.empty(0, dtype=np.uint64) if indel_keys is None else indel_keys
+        self.indel_offsets = np.zeros(1, dtype=np.int64) if indel_offsets is None else indel_offsets
+        self.indel_strings = np.empty(0, dtype=np.uint8) if indel_strings is None else indel_strings
+
+    @classmethod
+    def from_ids(klass, hgvs_ids):
+        hgvs_ids = list(hgvs_ids)
+        keys = stable_keys(hgvs_ids)
+        is_indel = (keys & np.uint64(INDEL_KEY_FLAG)) != 0
+        indel_ids = list(dict.fromkeys(hgvs_ids[i] for i in np.flatnonzero(is_indel).tolist()))
+        indel_keys = stable_keys(indel_ids)
+        # colliding IDs end up side by side
+        order = np.argsort(indel_keys, kind="stable")
+        strings, offsets = _concat_ids([indel_ids[i] for i in order.tolist()])
+        return klass(np.unique(keys[~is_indel]), indel_keys[order], offsets, strings)
+
+    def __len__(self):
+        return len(self.snv_keys) + len(self.indel_keys)
+
+    def __iter__(self):
+        for hgvs_id in VariantKeyCodec().decode_many(self.snv_keys):
+            yield hgvs_id
+        offsets = np.asarray(self.indel_offsets).tolist()
+        for start, end in zip(offsets[:-1], offsets[1:]):
+            yield self.indel_strings[start:end].tobytes().decode()
+
+    def __contains__(self, hgvs_id):
+        return bool(self.contains_many([hgvs_id])[0])
+
+    @property
+    def keys(self):
+        '''all keys (eg. for a Bloom filter), SNVs first'''
+        return np.concatenate([self.snv_keys, self.indel_keys])
+
+    def _contains_snvs(self, keys):
+        if not len(self.snv_keys):
+            return np.zeros(len(keys), dtype=bool)
+        idx = np.searchsorted(self.snv_keys, keys)
+        return np.asarray(self.snv_keys)[np.minimum(idx, len(self.snv_keys) - 1)] == keys
+
+    def _match_indels(self, entries, qstrings, qoffsets, queries):
+        '''return a boolean array telling if IDs of indel entries are the
+           same as IDs of queries (indices in qstrings/qoffsets)'''
+        offsets = np.asarray(self.indel_offsets)
+        starts = offsets[entries]
+        lens = offsets[entries + 1] - starts
+        qstarts = qoffsets[queries]
+        res = lens == qoffsets[queries + 1] - qstarts
+        idx = np.flatnonzero(res & (lens > 0))
+        if len(idx):
+            lens = lens[idx]
+            cumlens = np.cumsum(lens) - lens
+            pos = np.arange(lens.sum()) - np.repeat(cumlens, lens)
+            same = np.asarray(self.indel_strings)[np.repeat(starts[idx], lens) + pos] == \
+                qstrings[np.repeat(qstarts[idx], lens) + pos]
+            res[idx] = np.logical_and.reduceat(same, cumlens)
+        return res
+
+    def _contains_indels(self, keys, qstrings, qoffsets):
+        '''membership of IDs (qstrings, qoffsets), keys being their hash_id()'''
+        res = np.zeros(len(keys), dtype=bool)
+        if not len(keys) or not len(self.indel_keys):
+            return res
+        lo = np.searchsorted(self.indel_keys, keys, side="left")
+        hi = np.searchsorted(self.indel_keys, keys, side="right")
+        # compare with first entry having the same key, then with next ones
+        # for (rare) hash collisions
+        todo = np.flatnonzero(hi > lo)
+        entries = lo[todo]
+        while len(todo):
+            res[todo] = self._match_indels(entries, qstrings, qoffsets, todo)
+            left = ~res[todo] & (entries + 1 < hi[todo])
+            todo = todo[left]
+            entries = entries[left] + 1
+        return res
+
+    def contains_keys(self, keys, hgvs_ids):
+        '''return a boolean array telling which hgvs_ids are in the set, keys
+           being their stable_keys() (so callers having them already, like
+           utils.idfilter, don't compute them again)'''
+        keys = np.asarray(keys, dtype=np.uint64)
+        res = np.zeros(len(keys), dtype=bool)
+        is_indel = (keys & np.uint64(INDEL_KEY_FLAG)) != 0
+        snvs = np.flatnonzero(~is_indel)
+        res[snvs] = self._contains_snvs(keys[snvs])
+        indels = np.flatnonzero(is_indel)
+        if len(indels):
+            qstrings, qoffsets = _concat_ids([hgvs_ids[i] for i in indels.tolist()])
+            res[indels] = self._contains_indels(keys[indels], qstrings, qoffsets)
+        return res
+
+    def contains_many(self, hgvs_ids):
+        '''return a boolean array telling which hgvs_ids are in the set'''
+        hgvs_ids = hgvs_ids if isinstance(hgvs_ids, list) else list(hgvs_ids)
+        return self.contains_keys(stable_keys(hgvs_ids), hgvs_ids)
+
+    def difference(self, hgvs_ids):
+        '''return the list of hgvs_ids not in the set (order preserved)'''
+        hgvs_ids = list(hgvs_ids)
+        found = self.contains_many(hgvs_ids)
+        return [hgvs_id for hgvs_id, isin in zip(hgvs_ids, found.tolist()) if not isin]
+
+    def union(self, other):
+        '''return a new set with IDs from both sets. Other's keys missing in
+           this set are inserted at their sorted position (no sorting)'''
+        other_snvs = np.asarray(other.snv_keys)
+        new = other_snvs[~self._contains_snvs(other_snvs)]
+        snv_keys = np.insert(self.snv_keys, np.searchsorted(self.snv_keys, new), new)
+        ostrings = np.asarray(other.indel_strings)
+        ooffsets = np.asarray(other.indel_offsets)
+        new = np.flatnonzero(~self._contains_indels(other.indel_keys, ostrings, ooffsets))
+        keys = np.asarray(other.indel_keys)[new]
+        starts = ooffsets[new]
+        lens = ooffsets[new + 1] - starts
+        pos = np.searchsorted(self.indel_keys, keys, side="right")
+        # new IDs inserted in the string table before the entry they're inserted before
+        offsets = np.asarray(self.indel_offsets)
+        data = ostrings[np.repeat(starts - (np.cumsum(lens) - lens), lens) + np.arange(lens.sum())]
+        strings = np.insert(self.indel_strings, np.repeat(offsets[pos], lens), data)
+        indel_offsets = np.concatenate([[0], np.cumsum(np.insert(np.diff(offsets), pos, lens))]).astype(np.int64)
+        return VariantKeySet(snv_keys, np.insert(self.indel_keys, pos, keys), indel_offsets, strings)
+
+    def update(self, hgvs_ids):
+        merged = self.union(VariantKeySet.from_ids(hgvs_ids))
+        for name in self.ARRAYS:
+            setattr(self, name, getattr(merged, name))
+
+    def save(self, path):
+        '''save arrays as path.<array name>.npy'''
+        for name in self.ARRAYS:
+            with open("%s.%s.npy.tmp" % (path, name), "wb") as fout:
+                np.save(fout, np.asarray(getattr(self, name)))
+            os.rename("%s.%s.npy.tmp" % (path, name), "%s.%s.npy" % (path, name))
+
+    @classmethod
+    def load(klass, path, mmap_mode="r"):
+        '''load arrays saved in path, memory-mapped by default'''
+        return klass(*[np.load("%s.%s.npy" % (path, name), mmap_mode=mmap_mode) for name in klass.ARRAYS])
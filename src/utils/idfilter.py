@@ -0,0 +1,168 @@
+'''
+Variant ID existence filter.
+
+IdFilter answers "is this hgvs_id in the set ?" for large sets of IDs (eg. all
+IDs of a collection), in bulk:
+  - IDs are first turned into stable 64-bit keys (see utils.hgvs.stable_keys):
+    packed variant keys for SNVs, a 63-bit hash for other IDs,
+  - a Bloom filter (about 1% false positives) rejects most absent IDs
+    without touching the set,
+  - remaining candidates are checked against a VariantKeySet (sorted keys,
+    plus the IDs themselves for hashed ones), so results are exact, hash
+    collisions included.
+Filters can be saved and loaded (memory-mapped), so they're built once from a
+collection and reused.
+'''
+import os
+import json
+
+import numpy as np
+
+from utils.hgvs import VariantKeySet, stable_keys
+
+
+FILTER_FORMAT = 2
+BITS_PER_KEY = 10
+NUM_HASHES = 7
+
+
+def _mix(keys):
+    '''splitmix64 finalizer, spreads key bits before computing Bloom bit positions'''
+    with np.errstate(over="ignore"):
+        z = keys + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+
+class IdFilter(object):
+    '''Bloom filter with exact fallback (a VariantKeySet) over a set of variant IDs'''
+
+    def __init__(self, bits, keyset, num_hashes=NUM_HASHES, meta=None):
+        self.bits = bits
+        self.keyset = keyset
+        self.num_hashes = num_hashes
+        self.meta = meta or {}
+        # sets of IDs added with update(), merged into self.keyset on save()
+        self._added = []
+
+    @classmethod
+    def from_keyset(klass, keyset, bits_per_key=BITS_PER_KEY, num_hashes=NUM_HASHES, **meta):
+        nbits = max(64, (len(keyset) * bits_per_key + 7) // 8 * 8)
+        filt = klass(np.zeros(nbits // 8, dtype=np.uint8), keyset, num_hashes=num_hashes, meta=meta)
+        filt._set_bits(keyset.keys)
+        return filt
+
+    @classmethod
+    def from_ids(klass, hgvs_ids, **kwargs):
+        return klass.from_keyset(VariantKeySet.from_ids(hgvs_ids), **kwargs)
+
+    def __len__(self):
+        return len(self.keyset) + sum(len(keyset) for keyset in self._added)
+
+    def _positions(self, keys):
+        # double hashing, one row of bit positions per hash function
+        nbits = np.uint64(len(self.bits) * 8)
+        h1 = _mix(keys)
+        h2 = _mix(h1) | np.uint64(1)
+        with np.errstate(over="ignore"):
+            return [(h1 + np.uint64(i) * h2) % nbits for i in range(self.num_hashes)]
+
+    def _set_bits(self, keys):
+        for pos in self._positions(keys):
+            np.bitwise_or.at(self.bits, pos >> np.uint64(3),
+                             np.left_shift(1, (pos & np.uint64(7)).astype(np.uint8)).astype(np.uint8))
+
+    def might_contain_keys(self, keys):
+        '''Bloom filter only: False means absent, True means probably present'''
+        res = np.ones(len(keys), dtype=bool)
+        for pos in self._positions(keys):
+            res &= (self.bits[pos >> np.uint64(3)] >> (pos & np.uint64(7)).astype(np.uint8)) & 1 == 1
+        return res
+
+    def contains_many(self, hgvs_ids):
+        '''exact membership of hgvs_ids, as a boolean array'''
+        hgvs_ids = hgvs_ids if isinstance(hgvs_ids, list) else list(hgvs_ids)
+        keys = stable_keys(hgvs_ids)
+        res = self.might_contain_keys(keys)
+        candidates = np.flatnonzero(res)
+        found = np.zeros(len(candidates), dtype=bool)
+        for keyset in [self.keyset] + self._added:
+            todo = np.flatnonzero(~found)
+            if len(keyset) and len(todo):
+                found[todo] = keyset.contains_keys(keys[candidates[todo]],
+                                                   [hgvs_ids[i] for i in candidates[todo].tolist()])
+        res[candidates] = found
+        return res
+
+    def __contains__(self, hgvs_id):
+        return bool(self.contains_many([hgvs_id])[0])
+
+    def update(self, hgvs_ids):
+        '''add hgvs_ids to the filter (Bloom filter isn't resized, false
+           positive rate grows if many IDs are added, results stay exact)'''
+        hgvs_ids = hgvs_ids if isinstance(hgvs_ids, list) else list(hgvs_ids)
+        found = self.contains_many(hgvs_ids).tolist()
+        keyset = VariantKeySet.from_ids(hgvs_id for hgvs_id, isin in zip(hgvs_ids, found) if not isin)
+        if len(keyset):
+            self._set_bits(keyset.keys)
+            self._added.append(keyset)
+            # merge sets of similar sizes (as a binary counter would), so lookups
+            # search O(log n) sets and each ID is copied O(log n) times
+            while len(self._added) > 1 and len(self._added[-2]) <= 2 * len(self._added[-1]):
+                last = self._added.pop()
+                self._added[-1] = self._added[-1].union(last)
+
+    def save(self, path, **meta):
+        '''save filter as path.json, path.bits.npy and VariantKeySet arrays (path.<array>.npy)'''
+        for keyset in self._added:
+            self.keyset = self.keyset.union(keyset)
+        self._added = []
+        self.meta.update(meta)
+        with open("%s.bits.npy.tmp" % path, "wb") as fout:
+            np.save(fout, self.bits)
+        os.rename("%s.bits.npy.tmp" % path, "%s.bits.npy" % path)
+        self.keyset.save(path)
+        with open(path + ".json.tmp", "w") as fout:
+            json.dump({"format": FILTER_FORMAT, "num_hashes": self.num_hashes,
+                       "count": len(self.keyset), "meta": self.meta}, fout, indent=2, sort_keys=True)
+        os.rename(path + ".json.tmp", path + ".json")
+
+    @classmethod
+    def load(klass, path):
+        '''load filter saved in path, or return None if there's none (or in an
+           unsupported format)'''
+        if not os.path.exists(path + ".json"):
+            return None
+        with open(path + ".json") as fin:
+            info = json.load(fin)
+        if info.get("format") != FILTER_FORMAT:
+            return None
+        # bits are modified by update(), the set is only read
+        bits = np.load(path + ".bits.npy")
+        return klass(bits, VariantKeySet.load(path), num_hashes=info["num_hashes"], meta=info["meta"])
+
+    @staticmethod
+    def remove(path):
+        '''remove filter files saved in path, if any (description first, so
+           a partially removed filter isn't loaded)'''
+        for name in ["json", "bits.npy"] + ["%s.npy" % name for name in VariantKeySet.ARRAYS]:
+            if os.path.exists("%s.%s" % (path, name)):
+                os.remove("%s.%s" % (path, name))
+
+
+def build_collection_filter(col, batch_size=100000, logger=None, force_use=False, **meta):
+    '''build an IdFilter from all _ids in collection col, using id_feeder
+       (so the ID cache, if any)'''
+    from biothings.utils.mongo import id_feeder
+    # per-batch sets merged by sizes, as in IdFilter.update()
+    keysets = []
+    for ids in id_feeder(col, batch_size=batch_size, logger=logger, force_use=force_use):
+        keysets.append(VariantKeySet.from_ids(ids))
+        while len(keysets) > 1 and len(keysets[-2]) <= 2 * len(keysets[-1]):
+            last = keysets.pop()
+            keysets[-1] = keysets[-1].union(last)
+    keyset = VariantKeySet()
+    for other in reversed(keysets):
+        keyset = other.union(keyset) if len(keyset) else other
+    return IdFilter.from_keyset(keyset, collection=col.name, **meta)
@@ -0,0 +1,148 @@
+'''
+On-disk rsID => hgvs ids index.
+
+An index is a folder containing:
+  - "rsids.npy": rsID numbers (without "rs" prefix), sorted, one entry per
+    (rsid, hgvs_id) pair (an rsID can match multiple hgvs ids),
+  - "starts.npy"/"ends.npy": for each entry, boundaries of the hgvs id in
+    the string table,
+  - "hgvs.txt": the string table, hgvs ids concatenated (in insertion order),
+plus an "index.json" file with counts and builder's metadata.
+
+Arrays are memory-mapped when opened, lookups are binary searches over the
+sorted rsids, done in bulk with resolve_many().
+'''
+import os
+import json
+import array
+
+import numpy as np
+
+
+INDEX_FILENAME = "index.json"
+INDEX_FORMAT = 1
+
+
+def rsid_to_int(rsid):
+    '''return rsID number ("rs123" => 123), or None if rsid isn't valid'''
+    if isinstance(rsid, str) and rsid.startswith("rs") and rsid[2:].isdigit():
+        return int(rsid[2:])
+    return None
+
+
+class RsidIndexBuilder(object):
+    '''Build an rsID index in folder from (rsid, hgvs_id) pairs'''
+
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        self._rsids = array.array("Q")
+        self._ends = array.array("q")
+        self._offset = 0
+        self._fstr = open(os.path.join(folder, "hgvs.txt.tmp"), "wb")
+
+    def add(self, rsid, hgvs_id):
+        num = rsid_to_int(rsid)
+        if num is None:
+            return False
+        data = hgvs_id.encode()
+        self._fstr.write(data)
+        self._offset += len(data)
+        self._rsids.append(num)
+        self._ends.append(self._offset)
+        return True
+
+    def close(self, **meta):
+        '''write index files, return the index metadata'''
+        self._fstr.close()
+        rsids = np.frombuffer(self._rsids, dtype=np.uint64)
+        ends = np.frombuffer(self._ends, dtype=np.int64)
+        starts = np.concatenate([[0], ends[:-1]]).astype(np.int64)
+        # stable, so hgvs ids for a given rsid keep insertion order
+        order = np.argsort(rsids, kind="stable")
+        for name, values in (("rsids", rsids), ("starts", starts), ("ends", ends)):
+            with open(os.path.join(self.folder, "%s.npy.tmp" % name), "wb") as fout:
+                np.save(fout, values[order])
+        for name in ("rsids.npy", "starts.npy", "ends.npy", "hgvs.txt"):
+            os.rename(os.path.join(self.folder, name + ".tmp"), os.path.join(self.folder, name))
+        index = {"format": INDEX_FORMAT, "count": len(rsids),
+                 "rsids": len(np.unique(rsids)) if len(rsids) else 0}
+        index.update(meta)
+        with open(os.path.join(self.folder, INDEX_FILENAME), "w") as fout:
+            json.dump(index, fout, indent=2, sort_keys=True)
+        return index
+
+
+def build_rsid_index(folder, docs, rsid_fn=lambda doc: doc["dbsnp"]["rsid"], **meta):
+    '''build rsID index in folder from docs (eg. from dbSNP collection, or dbSNP
+       VCF parser), rsid_fn returns the rsid (or a list of) from a doc. Return
+       the index metadata.'''
+    builder = RsidIndexBuilder(folder)
+    for doc in docs:
+        rsids = rsid_fn(doc)
+        for rsid in (rsids if isinstance(rsids, list) else [rsids]):
+            builder.add(rsid, doc["_id"])
+    return builder.close(**meta)
+
+
+def build_rsid_index_from_collection(folder, col, batch_size=100000):
+    '''build rsID index in folder from a dbSNP collection'''
+    cur = col.find({}, {"dbsnp.rsid": 1}, no_cursor_timeout=True).batch_size(batch_size)
+    try:
+        docs = (doc for doc in cur if "dbsnp" in doc)
+        return build_rsid_index(folder, docs, source=col.name)
+    finally:
+        cur.close()
+
+
+class CollectionRsidResolver(object):
+    '''Resolve rsids with one query per rsid on a dbSNP collection, same API
+       as RsidIndex (slow, used when no index was built)'''
+
+    def __init__(self, col):
+        self.col = col
+
+    def resolve_many(self, rsids):
+        return [[d["_id"] for d in self.col.find({"dbsnp.rsid": rsid}, {"_id": 1})] for rsid in rsids]
+
+    def resolve(self, rsid):
+        return self.resolve_many([rsid])[0]
+
+
+class RsidIndex(object):
+    '''Read-only access to an rsID index folder'''
+
+    def __init__(self, folder):
+        self.folder = folder
+        with open(os.path.join(folder, INDEX_FILENAME)) as fin:
+            self.index = json.load(fin)
+        if self.index.get("format") != INDEX_FORMAT:
+            raise ValueError("Unsupported rsID index format in '%s': %s" % (folder, self.index.get("format")))
+        self.rsids = np.load(os.path.join(folder, "rsids.npy"), mmap_mode="r")
+        self.starts = np.load(os.path.join(folder, "starts.npy"), mmap_mode="r")
+        self.ends = np.load(os.path.join(folder, "ends.npy"), mmap_mode="r")
+        if self.index["count"]:
+            self.strings = np.memmap(os.path.join(folder, "hgvs.txt"), dtype=np.uint8, mode="r")
+        else:
+            self.strings = np.empty(0, dtype=np.uint8)
+
+    def __len__(self):
+        return self.index["count"]
+
+    def resolve_many(self, rsids):
+        '''return, for each rsid in rsids (eg. "rs123"), the list of matching
+           hgvs ids (empty if none or rsid is invalid), in the same order'''
+        nums = [rsid_to_int(rsid) for rsid in rsids]
+        valid = np.array([num is not None for num in nums], dtype=bool)
+        keys = np.array([num or 0 for num in nums], dtype=np.uint64)
+        lo = np.searchsorted(self.rsids, keys, side="left")
+        hi = np.searchsorted(self.rsids, keys, side="right")
+        hi[~valid] = lo[~valid]
+        res = []
+        for i, j in zip(lo.tolist(), hi.tolist()):
+            res.append([self.strings[s:e].tobytes().decode()
+                        for s, e in zip(self.starts[i:j].tolist(), self.ends[i:j].tolist())])
+        return res
+
+    def resolve(self, rsid):
+        return self.resolve_many([rsid])[0]
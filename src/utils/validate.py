@@ -1,12 +1,15 @@
 from __future__ import print_function
-import re
 import os.path
 import time
+import concurrent.futures
 
+import numpy as np
 from bitarray import bitarray
 
-from biothings.utils.common import loadobj, is_str, open_anyfile, timesofar
-from biothings.utils.mongo import get_src_db, doc_feeder
+from biothings.utils.common import is_str, open_anyfile, timesofar, iter_n
+from biothings.utils.mongo import get_src_db, get_target_db
+from utils.hgvs import parse_hgvs, parse_many
+from utils.genome import GenomeStore
 
 
 def nuc_to_bit(sequence):
@@ -74,16 +77,14 @@ def bit_to_nuc2(bits):
     return bits.decode(code)
 
 
-def parse(str):
+def parse(hgvs_id):
     '''parse variant name, print the variant name and
        return chromosome number, nucleotide position
        and nucleotide name
     '''
-    pat = 'chr(\w+):g\.(\d+)(\w)\>(\w)'
-    mat = re.match(pat, str)
-    if mat:
-        r = mat.groups()
-        return (r[0], r[1], r[2])
+    variant = parse_hgvs(hgvs_id)
+    if variant and variant.vartype == "snp":
+        return (variant.chrom, str(variant.start), variant.ref)
 
 
 def get_genome_in_bit(chr_fa_folder):
@@ -96,6 +97,8 @@ def get_genome_in_bit(chr_fa_folder):
         ftp://ftp.ncbi.nlm.nih.gov/genbank/genomes/Eukaryotes/vertebrates_mammals/Homo_sapiens/GRCh37.p13/Primary_Assembly/assembled_chromosomes/FASTA/
         chr<i>.fa.gz  (e.g. chr1.fa.gz)
 
+        Legacy format, see utils.genome.build_genome_store to build a
+        genome store (as used by VariantValidator) from the same files.
     '''
     chr_bit_d = {}
     chr_range = [str(i) for i in range(1, 23)] + ['X', 'Y', 'MT']
@@ -122,150 +125,260 @@ def get_genome_in_bit(chr_fa_folder):
 
 
 class VariantValidator:
-    def __init__(self):
+    def __init__(self, genome=None):
+        self.genome = genome
         self._chr_data = None
 
-    def load_chr_data(self,genome_file):
-        print("\tLoading chromosome data...", end='')
-        self._chr_data = loadobj(genome_file)
+    def load_chr_data(self, genome=None):
+        '''open genome store folder (see utils.genome)'''
+        self.genome = genome or self.genome
+        print("\tOpening genome store...", end='')
+        self._chr_data = GenomeStore(self.genome)
         print("Done.")
 
     def validate_hgvs(self, hgvs_id, verbose=False):
         '''validate single hgvs variant name, return True/False,
            or None if input hgvs_id cannot be validated (could be
-           wrong format, or ins/del type currently we don't validate.
+           wrong format or unknown chromosome). See validate_many().
         '''
-        r = parse(hgvs_id)
-        # set the range for r[0]
-        chr_range = [str(i) for i in range(1, 23)] + ['X', 'Y', 'M', 'MT']
-        chr_range = set(chr_range)
-
-        if r and (str(r[0]) in chr_range):
-            # get the chromosome sequence in bit form
-            if self._chr_data is None:
-                print()
-                self.load_chr_data()
-            if r[0] == 'M':
-                chr = 'MT'
-            else:
-                chr = r[0]
-            pos = int(r[1])
-            nuc_hgvs = r[2]
-
-            chr_bit = bitarray()
-            chr_bit = self._chr_data[str(chr)]
-
-            # get the nucleotide in chromsome sequence in bit form
-            nuc_chr_bit = bitarray()
-            nuc_chr_bit = chr_bit[pos*3-3:pos*3]
-            nuc_chr = bit_to_nuc(nuc_chr_bit)
-
-            # compare HGVS id with genome
-            matched = nuc_hgvs == nuc_chr
-            if verbose:
-                if matched:
-                    print('"{}":\t{}'.format(hgvs_id, matched))
-                else:
-                    print('"{}":\t{} (should be "{}")'.format(hgvs_id, matched, nuc_chr))
-            return matched
-        else:
-            if verbose:
-                print('"{}":\tNone(not tested).'.format(hgvs_id))
-            return None
+        return self.validate_many([hgvs_id], verbose=verbose, summary=False)[0]
+
+    def _match_seqs(self, chrom, starts, seqs):
+        '''return a boolean array telling, for each (non-empty) sequence in seqs,
+           if it's found in genome at corresponding start position'''
+        if not seqs:
+            return np.empty(0, dtype=bool)
+        lens = np.fromiter(map(len, seqs), dtype=np.int64, count=len(seqs))
+        offsets = np.cumsum(lens) - lens
+        codes = np.frombuffer("".join(seqs).encode(), dtype=np.uint8)
+        # genome position for each nucleotide of all sequences, concatenated
+        positions = np.repeat(np.asarray(starts, dtype=np.int64) - offsets, lens) + np.arange(len(codes))
+        matched = self._chr_data.bases_at(chrom, positions) == codes
+        return np.logical_and.reduceat(matched, offsets)
+
+    def _validate_chrom(self, chrom, variants):
+        '''validate a list of HgvsVariant records found on chrom, return
+           a boolean array'''
+        starts = np.array([v.start for v in variants], dtype=np.int64)
+        ends = np.array([v.end for v in variants], dtype=np.int64)
+        valid = (starts >= 1) & (ends >= starts) & (ends <= self._chr_data.length(chrom))
+        # sequences expected in reference genome: SNV/del/dup ref, and for
+        # delins, inserted sequence of same length must differ from reference
+        refs = []
+        alts = []
+        for i, v in enumerate(variants):
+            if v.ref:
+                refs.append((i, v.ref))
+            elif v.vartype == "delins" and len(v.alt) == v.end - v.start + 1:
+                alts.append((i, v.alt))
+        if refs:
+            idx, seqs = zip(*refs)
+            idx = np.array(idx)
+            lens = np.fromiter(map(len, seqs), dtype=np.int64, count=len(seqs))
+            valid[idx] &= (lens == ends[idx] - starts[idx] + 1) & self._match_seqs(chrom, starts[idx], seqs)
+        if alts:
+            idx, seqs = zip(*alts)
+            idx = np.array(idx)
+            valid[idx] &= ~self._match_seqs(chrom, starts[idx], seqs)
+        return valid
 
     def validate_many(self, hgvs_li, verbose=False, summary=True):
-        '''validate multiple hgvs variant name'''
-        out = []
-        for hgvs_id in hgvs_li:
-            out.append(self.validate_hgvs(hgvs_id, verbose=verbose))
-
+        '''validate multiple hgvs variant names, return a list of True/False,
+           or None if hgvs_id cannot be validated. IDs are grouped by chromosome
+           and checked in bulk: reference nucleotides (SNVs), deleted/duplicated
+           sequences when given, and coordinates for all variant types.
+        '''
+        if self._chr_data is None:
+            self.load_chr_data()
+        out = [None] * len(hgvs_li)
+        by_chrom = {}
+        for i, variant in enumerate(parse_many(hgvs_li)):
+            if variant and variant.chrom in self._chr_data:
+                by_chrom.setdefault(variant.chrom, ([], []))
+                by_chrom[variant.chrom][0].append(i)
+                by_chrom[variant.chrom][1].append(variant)
+        for chrom, (idx, variants) in by_chrom.items():
+            for i, valid in zip(idx, self._validate_chrom(chrom, variants).tolist()):
+                out[i] = valid
+
+        if verbose:
+            for hgvs_id, valid in zip(hgvs_li, out):
+                if valid is None:
+                    print('"{}":\tNone(not tested).'.format(hgvs_id))
+                else:
+                    print('"{}":\t{}'.format(hgvs_id, valid))
         if summary:
             # print out counts
-            print("# of VALID HGVS IDs:\t{0}".format(len([x for x in out if x is True])))
-            print("# of INVALID HGVS IDs:\t{0}".format(len([x for x in out if x is False])))
-            print("# of HGVS IDs skipped:\t {0}".format(len([x for x in out if x is None])))
+            print("# of VALID HGVS IDs:\t{0}".format(out.count(True)))
+            print("# of INVALID HGVS IDs:\t{0}".format(out.count(False)))
+            print("# of HGVS IDs skipped:\t {0}".format(out.count(None)))
         return out
 
-    def validate_src(self, collection, return_false=False,
-                     return_none=False, return_true=False, verbose=False, flag_invalid=False, generator=False):
-        '''Validate hgvs ids from a src collection.'''
+    def _validate_docs(self, docs, summary, collection=None, flag_invalid=False, batch_size=10000):
+        '''validate docs by batch, accumulating results in summary. Invalid
+           documents are flagged (unordered bulk) in collection if flag_invalid'''
+        for batch in iter_n(docs, batch_size):
+            ids = [doc['_id'] for doc in batch]
+            results = self.validate_many(ids, summary=False)
+            summary.add(ids, results)
+            if flag_invalid:
+                flag_unmatched(collection, [_id for _id, valid in zip(ids, results) if valid is False])
+        return summary
 
+    def validate_src(self, collection, return_false=False,
+                     return_none=False, return_true=False, verbose=False, flag_invalid=False, generator=False,
+                     workers=None, num_ranges=None, batch_size=10000):
+        '''Validate hgvs ids from a src collection. Collection is split into _id
+           ranges (num_ranges, default is 4 per worker) validated in parallel
+           by a pool of worker processes.'''
         return_dict = {
             False: return_false,
             True: return_true,
             None: return_none
         }
-
         # read in the collection from mongodb
         if is_str(collection):
             src = get_src_db()
             _coll = src[collection]
         else:
             _coll = collection
-        cursor = doc_feeder(_coll, step=10000)
-
-        out = {}
-        print_only = not (return_false or return_none or return_true)
-        if not print_only:
-            # output dictionary, three keys: 'false','true','none'
-            for k in return_dict:
-                if return_dict[k]:
-                    out[k] = []
-
-        # initialize the count
-        cnt_d = {True: 0, False: 0, None: 0}    # cnt_d
-        # validate each item in the cursor
-        for item in cursor:
-            _id = item['_id']
-            valid = self.validate_hgvs(_id, verbose=verbose)
-            if valid == False and flag_invalid:
-                collection.update({"_id": _id}, {'$set':{"unmatched_ref": "True"}})
-            cnt_d[valid] += 1
-            if return_dict[valid]:
-                out[valid].append(_id)
-
-        # print out counts
-        print("\n# of VALID HGVS IDs:\t{0}".format(cnt_d[True]))
-        print("# of INVALID HGVS IDs:\t{0}".format(cnt_d[False]))
-        print("# of HGVS IDs skipped:\t {0}".format(cnt_d[None]))
-
-        out['summary'] = cnt_d
+        # workers reconnect to the same database, with hub's connection settings
+        db_key = configured_db_key(_coll.database)
+        workers = workers or os.cpu_count()
+        num_ranges = num_ranges or workers * 4
+        bounds = get_id_ranges(_coll, num_ranges)
+        keep = [k for k in return_dict if return_dict[k]]
+        summary = ValidationSummary(keep=keep)
+        t0 = time.time()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(validate_range_worker, self.genome, db_key,
+                                       _coll.name, lo, hi,
+                                       flag_invalid=flag_invalid, keep=keep, batch_size=batch_size)
+                       for lo, hi in zip(bounds[:-1], bounds[1:])]
+            for future in concurrent.futures.as_completed(futures):
+                summary += future.result()
+                if verbose:
+                    print("{} IDs validated [{}]".format(summary.total, timesofar(t0)))
+
+        summary.print_counts()
+        out = dict(summary.ids)
+        out['summary'] = summary
         return out
 
     def validate_generator(self, generator, return_false=False,
-                     return_none=False, return_true=False, verbose=False, flag_invalid=False):
-        '''Validate hgvs ids from a src collection.'''
-
+                     return_none=False, return_true=False, verbose=False, flag_invalid=False,
+                     collection=None, batch_size=10000):
+        '''Validate hgvs ids from a generator of documents. If flag_invalid,
+           invalid documents are flagged in collection.'''
+        assert not flag_invalid or collection is not None, "A collection is required to flag invalid documents"
         return_dict = {
             False: return_false,
             True: return_true,
             None: return_none
         }
-
-        out = {}
-        print_only = not (return_false or return_none or return_true)
-        if not print_only:
-            # output dictionary, three keys: 'false','true','none'
-            for k in return_dict:
-                if return_dict[k]:
-                    out[k] = []
-
-        # initialize the count
-        cnt_d = {True: 0, False: 0, None: 0}    # cnt_d
-        # validate each item in the cursor
-        for item in generator:
-            _id = item['_id']
-            valid = self.validate_hgvs(_id, verbose=verbose)
-            if valid == False and flag_invalid:
-                collection.update({"_id": _id}, {'$set':{"unmatched_ref": "True"}})
-            cnt_d[valid] += 1
-            if return_dict[valid]:
-                out[valid].append(_id)
-
-        # print out counts
-        print("\n# of VALID HGVS IDs:\t{0}".format(cnt_d[True]))
-        print("# of INVALID HGVS IDs:\t{0}".format(cnt_d[False]))
-        print("# of HGVS IDs skipped:\t {0}".format(cnt_d[None]))
-
-        out['summary'] = cnt_d
+        summary = ValidationSummary(keep=[k for k in return_dict if return_dict[k]])
+        self._validate_docs(generator, summary, collection=collection,
+                            flag_invalid=flag_invalid, batch_size=batch_size)
+        summary.print_counts()
+        out = dict(summary.ids)
+        out['summary'] = summary
         return out
+
+
+class ValidationSummary(dict):
+    '''Validation counts per result (True/False/None), and IDs for results
+       listed in keep. Summaries from different workers can be merged with "+".'''
+
+    def __init__(self, keep=()):
+        super(ValidationSummary, self).__init__({True: 0, False: 0, None: 0})
+        self.ids = dict((k, []) for k in keep)
+
+    @property
+    def total(self):
+        return sum(self.values())
+
+    def add(self, ids, results):
+        for _id, valid in zip(ids, results):
+            self[valid] += 1
+            if valid in self.ids:
+                self.ids[valid].append(_id)
+
+    def __iadd__(self, other):
+        for k in other:
+            self[k] += other[k]
+        for k, ids in other.ids.items():
+            self.ids.setdefault(k, []).extend(ids)
+        return self
+
+    def __add__(self, other):
+        res = ValidationSummary()
+        res += self
+        res += other
+        return res
+
+    def print_counts(self):
+        print("\n# of VALID HGVS IDs:\t{0}".format(self[True]))
+        print("# of INVALID HGVS IDs:\t{0}".format(self[False]))
+        print("# of HGVS IDs skipped:\t {0}".format(self[None]))
+
+
+def flag_unmatched(collection, ids):
+    '''flag documents whose _id is in ids as having unmatched ref'''
+    if not ids:
+        return
+    bob = collection.initialize_unordered_bulk_op()
+    for _id in ids:
+        bob.find({"_id": _id}).update({'$set': {"unmatched_ref": "True"}})
+    bob.execute()
+
+
+def get_id_ranges(collection, num_ranges):
+    '''split collection into (at most) num_ranges _id ranges of similar size,
+       return boundaries, as a sorted list starting with None (no lower bound)
+       and ending with None (no upper bound)'''
+    # single pass: buckets' "min" are inclusive lower bounds
+    buckets = collection.aggregate([{"$project": {"_id": 1}},
+                                    {"$bucketAuto": {"groupBy": "$_id", "buckets": num_ranges}}],
+                                   allowDiskUse=True)
+    mins = [bucket["_id"]["min"] for bucket in buckets]
+    # first bucket starts at the lowest _id, no lower bound is needed
+    return [None] + mins[1:] + [None]
+
+
+# hub's configured databases (connection settings, credentials included, come
+# from config), collections validated in parallel are reopened from them
+DB_GETTERS = {"src": get_src_db, "target": get_target_db}
+
+
+def configured_db_key(database):
+    '''return the key in DB_GETTERS of the configured database named as database'''
+    for key, get_db in DB_GETTERS.items():
+        if get_db().name == database.name:
+            return key
+    raise ValueError("Database '%s' is neither the source nor the target database from config" % database.name)
+
+
+# validators opened in worker process, per genome (memory-mapped, so
+# the genome pages are shared by all workers through OS page cache)
+_validators = {}
+
+
+def validate_range_worker(genome, db_key, col_name, lo, hi, flag_invalid=False, keep=(), batch_size=10000):
+    '''validate documents with lo <= _id < hi (None meaning no bound) from
+       collection col_name in configured database db_key (see DB_GETTERS),
+       return a ValidationSummary'''
+    validator = _validators.get(genome)
+    if validator is None:
+        validator = _validators[genome] = VariantValidator(genome)
+    col = DB_GETTERS[db_key]()[col_name]
+    query = {}
+    if lo is not None:
+        query["$gte"] = lo
+    if hi is not None:
+        query["$lt"] = hi
+    cur = col.find({"_id": query} if query else {}, {"_id": 1}, no_cursor_timeout=True).batch_size(batch_size)
+    try:
+        return validator._validate_docs(cur, ValidationSummary(keep=keep), collection=col,
+                                        flag_invalid=flag_invalid, batch_size=batch_size)
+    finally:
+        cur.close()